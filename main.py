@@ -6,15 +6,29 @@ Used for running SDN failure recovery experiments
 import sys
 import os
 import argparse
+import time
 from src.experiment import ExperimentRunner
 from src.config import ConfigManager
+from src.scheduler import SweepScheduler, WorkerContext
+from src.benchmark import PhaseBenchmark
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('mode', choices=['run', 'clean'], 
-                       help='Run mode: run(run experiment) or clean(cleanup)')
+    parser.add_argument('mode', choices=['run', 'clean', 'sweep', 'analyze', 'benchmark'], 
+                       help='Run mode: run(run experiment), clean(cleanup), sweep(parallel run), analyze(recompute metrics) '
+                            'or benchmark(time the harness phases on local stand-ins)')
     parser.add_argument('config_file', help='Configuration file name (without .json extension)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of parallel sweep workers')
+    parser.add_argument('--worker', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--trial', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--repeat', type=int, default=3, help='Number of benchmark trials')
+    parser.add_argument('--output', default=None, help='Benchmark result file')
+    parser.add_argument('--baseline', default=None, help='Benchmark result file to compare against')
+    parser.add_argument('--rest', action='store_true', help='Benchmark against the ONOS REST stand-in server')
+    parser.add_argument('--ready-latency', type=float, default=0.0, help='Seconds the stand-in app takes to be Ready')
+    parser.add_argument('--file-handshake', action='store_true', help='Stand-in app signals with handshake files')
+    parser.add_argument('--load-threads', type=int, default=0, help='Threads of the REST load test, 0 to skip it')
     
     args = parser.parse_args()
     
@@ -23,14 +37,49 @@ def main():
             import json
             cfg_file = json.load(f)
         
-        experiment_runner = ExperimentRunner(args.config_file + '.json', cfg_file['UserName'])
+        if args.mode == 'sweep':
+            print(f"Starting parallel sweep with {args.workers} workers...")
+            SweepScheduler(args.config_file + '.json', cfg_file, args.workers,
+                           os.path.dirname(os.path.abspath(__file__))).run()
+            return
+        
+        if args.mode == 'benchmark':
+            print("Starting harness benchmark...")
+            root_dir = os.path.dirname(os.path.abspath(__file__))
+            benchmark = PhaseBenchmark(args.config_file + '.json', cfg_file, root_dir, args.rest,
+                                       args.ready_latency, 'file' if args.file_handshake else 'socket')
+            results = benchmark.run(args.repeat)
+            if args.load_threads:
+                results['rest_load'] = PhaseBenchmark.rest_load(args.load_threads)
+                print("REST load: {requests} requests, {errors} errors, {throughput:.0f} req/s, "
+                      "p50 {p50_ms:.2f}ms, p99 {p99_ms:.2f}ms".format(**results['rest_load']))
+            output_file = args.output or os.path.join(
+                root_dir, 'Trace_folder', 'benchmark', time.strftime('benchmark_%Y%m%d_%H%M%S.json'))
+            print(f"Benchmark results saved to {PhaseBenchmark.save(results, output_file)}")
+            if args.baseline:
+                regressions = PhaseBenchmark.compare(results, args.baseline)
+                for regression in regressions:
+                    print(f"Regression: {regression}")
+                if regressions:
+                    sys.exit(1)
+            return
+        
+        worker_context = None
+        if args.worker is not None:
+            worker_context = WorkerContext(args.worker, os.path.dirname(os.path.abspath(__file__)))
+            worker_context.enter()
+        
+        experiment_runner = ExperimentRunner(args.config_file + '.json', cfg_file['UserName'], worker_context)
         
         if args.mode == 'run':
             print("Starting experiment...")
-            experiment_runner.run_experiments()
+            experiment_runner.run_experiments(None if args.trial is None else [args.trial])
         elif args.mode == 'clean':
             print("Starting experiment environment cleanup...")
             experiment_runner.cleanup_experiment_environment()
+        elif args.mode == 'analyze':
+            print("Starting result analysis...")
+            experiment_runner.analyze_results()
             
     except KeyboardInterrupt:
         print("\nExperiment interrupted by user")
@@ -3,77 +3,116 @@ Algorithm management module
 Handle setup and management of different algorithms
 """
 
+import hashlib
+import json
 import os
-import time
 from .config import ONOSConfig
+from .control import ControlChannel
 
 
 class AlgorithmManager:
-    
-    def __init__(self, logger):
+
+    APP_NAME = 'org.foo.app'
+    BUNDLES = {
+        'LB': '/home/lce/onos/apps/LP/target/LP-1.0-SNAPSHOT.oar',
+        'MP': '/home/lce/onos/apps/MP/target/MP-1.0-SNAPSHOT.oar',
+        'MP_LB': '/home/lce/onos/apps/MP_LP/target/MP_LP-1.0-SNAPSHOT.oar',
+        'DRAF': '/home/lce/onos/apps/DRAF/target/DRAF-1.0-SNAPSHOT.oar',
+        'SDFFR': '/home/lce/onos/apps/SDFFR/target/SDFFR-1.0-SNAPSHOT.oar',
+        'SDFFR_MP': '/home/lce/onos/apps/SDFFR_MP/target/SDFFR_MP-1.0-SNAPSHOT.oar',
+        'SDFFR_MP_LB': '/home/lce/onos/apps/SDFFR_MP_LB/target/SDFFR_MP_LB-1.0-SNAPSHOT.oar',
+    }
+
+    REGISTRY_FILE = './installed_bundles.json'
+    # Longest time an app gets to report its configuration or state
+    READY_TIMEOUT = 600
+
+    def __init__(self, logger, control=None):
         self.logger = logger
-    
+        self.control = control or ControlChannel(logger)
+        self.digest_cache = {}
+        self.installed_bundles = self.load_registry()
+
+    def load_registry(self):
+        """Load the {app name: bundle digest} registry kept next to the handshake files"""
+        if os.path.isfile(self.REGISTRY_FILE):
+            with open(self.REGISTRY_FILE, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def save_registry(self):
+        with open(self.REGISTRY_FILE, 'w') as f:
+            json.dump(self.installed_bundles, f)
+
+    def bundle_digest(self, bundle_path):
+        """Return the sha256 of a bundle, re-hashing only when the file changed"""
+        stat = os.stat(bundle_path)
+        cached = self.digest_cache.get(bundle_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        sha = hashlib.sha256()
+        with open(bundle_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self.digest_cache[bundle_path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def install_bundle(self, bundle_path):
+        """Install and activate the bundle, reusing the installed copy when its hash matches"""
+        client = ONOSConfig.client()
+        digest = self.bundle_digest(bundle_path)
+        installed = client.get_app(self.APP_NAME)
+
+        if installed is not None and self.installed_bundles.get(self.APP_NAME) == digest:
+            self.logger.log(f"Reuse installed bundle {os.path.basename(bundle_path)}")
+            client.deactivate_app(self.APP_NAME)
+            return client.activate_app(self.APP_NAME)
+
+        if installed is not None:
+            client.uninstall_app(self.APP_NAME)
+        self.installed_bundles.pop(self.APP_NAME, None)
+
+        if not client.upload_app(bundle_path):
+            self.logger.log(f"Failed to upload {bundle_path}")
+            self.save_registry()
+            return False
+        self.installed_bundles[self.APP_NAME] = digest
+        self.save_registry()
+        return client.activate_app(self.APP_NAME)
+
     def setup_algorithm(self, algorithm):
-        if algorithm == 'LB':
-            self.logger.log("Perform LB algorithm")
-            os.system('sudo curl -X POST -H Content-Type:application/octet-stream http://127.0.0.1:8181/onos/v1/applications --data-binary @/home/lce/onos/apps/LP/target/LP-1.0-SNAPSHOT.oar --user onos:rocks')
-            os.system('curl -X POST --header "Accept: application/json" "http://localhost:8181/onos/v1/applications/org.foo.app/active" --user onos:rocks')
-            self.logger.log('\n')
-            
-        elif algorithm == 'MP':
-            self.logger.log("Perform MP algorithm")
-            os.system('sudo curl -X POST -H Content-Type:application/octet-stream http://127.0.0.1:8181/onos/v1/applications --data-binary @/home/lce/onos/apps/MP/target/MP-1.0-SNAPSHOT.oar --user onos:rocks')
-            os.system('curl -X POST --header "Accept: application/json" "http://localhost:8181/onos/v1/applications/org.foo.app/active" --user onos:rocks')
-            self.logger.log('\n')
-            
-        elif algorithm == 'MP_LB':
-            self.logger.log("Perform MP_LB algorithm")
-            os.system('sudo curl -X POST -H Content-Type:application/octet-stream http://127.0.0.1:8181/onos/v1/applications --data-binary @/home/lce/onos/apps/MP_LP/target/MP_LP-1.0-SNAPSHOT.oar --user onos:rocks')
-            os.system('curl -X POST --header "Accept: application/json" "http://localhost:8181/onos/v1/applications/org.foo.app/active" --user onos:rocks')
-            self.logger.log('\n')
-            
-        elif algorithm == 'DRAF':
-            self.logger.log("Perform DRAF algorithm")
-            os.system('sudo curl -X POST -H Content-Type:application/octet-stream http://127.0.0.1:8181/onos/v1/applications --data-binary @/home/lce/onos/apps/DRAF/target/DRAF-1.0-SNAPSHOT.oar --user onos:rocks')
-            os.system('curl -X POST --header "Accept: application/json" "http://localhost:8181/onos/v1/applications/org.foo.app/active" --user onos:rocks')
-            self.logger.log('\n')
-            
-        elif algorithm == 'SDFFR':
-            self.logger.log("Perform SDFFR algorithm")
+        if algorithm not in self.BUNDLES:
+            self.logger.log(f"Unknown algorithm: {algorithm}")
+            return False
+
+        self.logger.log(f"Perform {algorithm} algorithm")
+
+        if algorithm == 'SDFFR':
             os.system('sudo python3 /home/lce/yukai_thesis/experiment/SD-FFR/pre_install_select_novlan_spforex.py')
-            os.system('sudo curl -X POST -H Content-Type:application/octet-stream http://127.0.0.1:8181/onos/v1/applications --data-binary @/home/lce/onos/apps/SDFFR/target/SDFFR-1.0-SNAPSHOT.oar --user onos:rocks')
-            os.system('curl -X POST --header "Accept: application/json" "http://localhost:8181/onos/v1/applications/org.foo.app/active" --user onos:rocks')
-            ONOSConfig.configure_onos()
-            self.logger.log('\n')
-            
-        elif algorithm == 'SDFFR_MP':
-            self.logger.log("Perform SD-FFR algorithm")
-            os.system('sudo curl -X POST -H Content-Type:application/octet-stream http://127.0.0.1:8181/onos/v1/applications --data-binary @/home/lce/onos/apps/SDFFR_MP/target/SDFFR_MP-1.0-SNAPSHOT.oar --user onos:rocks')
-            os.system('curl -X POST --header "Accept: application/json" "http://localhost:8181/onos/v1/applications/org.foo.app/active" --user onos:rocks')
-            ONOSConfig.configure_onos()
-            self.logger.log('\n')
-            
-        elif algorithm == 'SDFFR_MP_LB':
-            self.logger.log("Perform SDFFR_MP_LB algorithm")
-            os.system('sudo curl -X POST -H Content-Type:application/octet-stream http://127.0.0.1:8181/onos/v1/applications --data-binary @/home/lce/onos/apps/SDFFR_MP_LB/target/SDFFR_MP_LB-1.0-SNAPSHOT.oar --user onos:rocks')
-            os.system('curl -X POST --header "Accept: application/json" "http://localhost:8181/onos/v1/applications/org.foo.app/active" --user onos:rocks')
+
+        # An app that was never activated will not report its state
+        if not self.install_bundle(self.BUNDLES[algorithm]):
+            self.logger.log(f"Failed to install {algorithm}")
+            return False
+
+        if algorithm.startswith('SDFFR'):
             ONOSConfig.configure_onos()
-            self.logger.log('\n')
-        
-        while True and algorithm == 'SDFFR':
-            time.sleep(1)
-            self.logger.log('Check if the configuration of the algorithm is completed')
-            if os.path.isfile('./config_done'):
-                os.remove('./config_done')
-                break
-
-        while True:
-            time.sleep(1)
-            self.logger.log('Check if the algorithm is ready')
-            if os.path.isfile('./Algorithm_state->Ready'):
-                return True
-            if os.path.isfile('./Algorithm_state->Error'):
+        self.logger.log('\n')
+
+        if algorithm == 'SDFFR':
+            if self.control.wait_any(['config_done'], self.READY_TIMEOUT) is None:
                 return False
-    
+            self.control.consume('config_done')
+
+        state = self.control.wait_any(['Algorithm_state->Ready', 'Algorithm_state->Error'], self.READY_TIMEOUT)
+        return state == 'Algorithm_state->Ready'
+
     def close_algorithm(self):
-        os.system('curl -X DELETE --header "Accept: application/json" "http://localhost:8181/onos/v1/applications/org.foo.app" --user onos:rocks') 
\ No newline at end of file
+        # Keep the bundle installed so the next trial of the same algorithm only reactivates it
+        ONOSConfig.client().deactivate_app(self.APP_NAME)
+
+    def uninstall_algorithm(self):
+        ONOSConfig.client().uninstall_app(self.APP_NAME)
+        self.installed_bundles.pop(self.APP_NAME, None)
+        self.save_registry()
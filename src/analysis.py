@@ -0,0 +1,154 @@
+"""
+Analysis module
+Compute the configured metrics of finished trials from their interval samples
+"""
+
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .iperf_parser import IperfParser
+
+
+class TrialAnalyzer:
+    """Join link change timestamps with iperf interval samples, one trial folder at a time"""
+
+    RECORD_FILE = 'trial_record.json'
+    PHASES = {0: 'los', 1: 'pnlos', 2: 'fnlos'}
+    METRICS = ['Throughput', 'TOTALPacketLoss', 'PacketLoss', 'RecoveryDelay']
+    # A flow has recovered once it is back to this share of its pre-change throughput
+    RECOVERY_THRESHOLD = 0.9
+
+    def __init__(self, metrics=None):
+        self.metrics = list(metrics or self.METRICS)
+
+    @staticmethod
+    def trial_folders(folder):
+        """Label folders below folder that hold both a trial record and interval samples"""
+        if not os.path.isdir(folder):
+            return []
+        return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                      if os.path.isfile(os.path.join(folder, name, TrialAnalyzer.RECORD_FILE))
+                      and os.path.isfile(os.path.join(folder, name, IperfParser.SAMPLE_FILE)))
+
+    def analyze(self, folder):
+        """Return (label, {metric: value}) of one trial folder"""
+        with open(os.path.join(folder, self.RECORD_FILE), 'r') as f:
+            record = json.load(f)
+        samples = IperfParser.load(os.path.join(folder, IperfParser.SAMPLE_FILE))
+
+        flow_names = np.char.add(np.char.add(samples['flow_src'], '_'), samples['flow_dst'])
+        flow_id = samples['flow_id']
+        # Interval midpoints on the epoch clock used by the change timestamps
+        times = samples['flow_start'][flow_id] + (samples['start'] + samples['end']) / 2
+        phase_start = np.asarray(record['status_start'], dtype=float)
+        phase_stop = np.asarray(record['status_stop'], dtype=float)
+        states = record['states']
+        # Phase index of every sample, -1 outside the failure timeline
+        phase = np.searchsorted(phase_start, times, side='right') - 1
+        phase[(phase < 0) | (times >= phase_stop[np.clip(phase, 0, None)])] = -1
+
+        client_flows = np.flatnonzero(samples['flow_role'] == 'client')
+        result = {}
+        if 'Throughput' in self.metrics:
+            result['Throughput'] = self.throughput(samples, flow_names, client_flows, phase, states)
+        if 'PacketLoss' in self.metrics or 'TOTALPacketLoss' in self.metrics:
+            per_phase, total = self.packet_loss(samples, phase, states)
+            if 'PacketLoss' in self.metrics:
+                result['PacketLoss'] = per_phase
+            if 'TOTALPacketLoss' in self.metrics:
+                result['TOTALPacketLoss'] = total
+        if 'RecoveryDelay' in self.metrics:
+            result['RecoveryDelay'] = self.recovery_delay(samples, flow_names, client_flows, phase, states, record)
+        return record['label'], result
+
+    def phase_names(self, states):
+        return [f'{index + 1}:{self.PHASES.get(state, state)}' for index, state in enumerate(states)]
+
+    def throughput(self, samples, flow_names, client_flows, phase, states):
+        """Mean client throughput per flow, summed over flows for the trial and for each phase"""
+        flow_count = len(flow_names)
+        is_client = np.isin(samples['flow_id'], client_flows)
+        bps = samples['bits_per_second']
+        flow_id = samples['flow_id']
+
+        sums = np.bincount(flow_id[is_client], bps[is_client], minlength=flow_count)
+        counts = np.bincount(flow_id[is_client], minlength=flow_count)
+        means = np.divide(sums, counts, out=np.zeros(flow_count), where=counts > 0)
+
+        per_phase = {}
+        for index, name in enumerate(self.phase_names(states)):
+            mask = is_client & (phase == index)
+            phase_sums = np.bincount(flow_id[mask], bps[mask], minlength=flow_count)
+            phase_counts = np.bincount(flow_id[mask], minlength=flow_count)
+            per_phase[name] = float(np.divide(phase_sums, phase_counts, out=np.zeros(flow_count),
+                                              where=phase_counts > 0).sum())
+        return {
+            'aggregate': float(means[client_flows].sum()),
+            'per_phase': per_phase,
+            'per_flow': {str(flow_names[flow]): float(means[flow]) for flow in client_flows}
+        }
+
+    def packet_loss(self, samples, phase, states):
+        """UDP loss ratio per phase and over the whole trial (None without UDP samples)"""
+        valid = (samples['lost_packets'] >= 0) & (samples['packets'] > 0)
+        lost = samples['lost_packets']
+        packets = samples['packets']
+
+        def ratio(mask):
+            total = packets[mask].sum()
+            return float(lost[mask].sum() / total) if total > 0 else None
+
+        per_phase = {name: ratio(valid & (phase == index)) for index, name in enumerate(self.phase_names(states))}
+        return per_phase, ratio(valid)
+
+    def recovery_delay(self, samples, flow_names, client_flows, phase, states, record):
+        """Seconds from each link state change until each client flow is back to its los throughput"""
+        flow_count = len(flow_names)
+        flow_id = samples['flow_id']
+        bps = samples['bits_per_second']
+        starts = samples['flow_start'][flow_id] + samples['start']
+        is_client = np.isin(flow_id, client_flows)
+
+        # Baseline: median throughput of each flow over the los phases
+        baseline = np.full(flow_count, np.nan)
+        in_los = is_client & np.isin(phase, [index for index, state in enumerate(states) if state == 0])
+        order = np.lexsort((bps[in_los], flow_id[in_los]))
+        groups, first_index, counts = np.unique(flow_id[in_los][order], return_index=True, return_counts=True)
+        sorted_bps = bps[in_los][order]
+        baseline[groups] = (sorted_bps[first_index + (counts - 1) // 2] + sorted_bps[first_index + counts // 2]) / 2
+        threshold = self.RECOVERY_THRESHOLD * baseline[flow_id]
+
+        delays = {}
+        names = self.phase_names(states)
+        for index in range(1, len(states)):
+            # A repeated pnlos step still draws a new bandwidth
+            if states[index] == states[index - 1] and states[index] != 1:
+                continue
+            change = float(record['change'][index])
+            first = np.full(flow_count, np.inf)
+            recovered = is_client & (starts >= change) & (bps >= threshold)
+            np.minimum.at(first, flow_id[recovered], starts[recovered])
+            delay = first - change
+            delay[~np.isfinite(delay)] = np.nan
+            delays[names[index]] = {str(flow_names[flow]): float(delay[flow]) for flow in client_flows}
+        return delays
+
+    def analyze_all(self, folders, output_file, workers=None):
+        """Analyze trial folders in parallel and merge the results into the output pickle"""
+        results = {}
+        if os.path.isfile(output_file):
+            with open(output_file, 'rb') as f:
+                results = pickle.load(f)
+        if folders:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for label, result in executor.map(self.analyze, folders):
+                    results[label] = result
+        tmp_file = output_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(results, f)
+        os.replace(tmp_file, output_file)
+        return results
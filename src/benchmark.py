@@ -0,0 +1,302 @@
+"""
+Benchmark module
+Time every phase of a trial against the local stand-ins of Mininet, OVS and ONOS
+"""
+
+import functools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import numpy as np
+
+from .algorithm import AlgorithmManager
+from .analysis import TrialAnalyzer
+from .config import ONOSConfig, SystemManager
+from .experiment import ExperimentRunner
+from .failure import LinkTimeline
+from .fakes import FakeMininet, FakeONOS, FakeONOSServer, FakeOVS, FakeRoutingApp, FakeSwitch, write_iperf_reports
+
+
+class PhaseBenchmark:
+    """Run the phases of a trial through ExperimentRunner on the fakes and keep their timings"""
+
+    PHASES = ['reset', 'topology_build', 'controller_convergence', 'algorithm_setup', 'traffic_start',
+              'link_actuation', 'cleanup', 'analysis']
+    # los -> pnlos -> fnlos -> pnlos -> los, as the fixed failure mode
+    PATTERN = [0, 1, 2, 1, 0]
+    PATTERN_BANDWIDTHS = [0, 500, 0, 500, 0]
+    # Link changes follow each other this fast, in seconds
+    CHANGE_STEP = 0.2
+    # A phase regressed when its mean grew by this share and by at least MIN_REGRESSION seconds
+    REGRESSION_RATIO = 0.2
+    MIN_REGRESSION = 0.005
+
+    def __init__(self, config_file, cfg_file, root_dir='.', rest=False, ready_latency=0.0, handshake='socket'):
+        self.config_file = os.path.abspath(config_file)
+        self.cfg_file = cfg_file
+        self.root_dir = os.path.abspath(root_dir)
+        # Serve the fake controller over HTTP instead of answering ONOSClient in-process
+        self.rest = rest
+        # Seconds the fake app takes to report Ready, and whether it reports over the socket or with files
+        self.ready_latency = ready_latency
+        self.handshake = handshake
+        self.ovs = None
+        self.timings = {}
+        self.commands = {}
+
+    def trial_config(self):
+        """The configuration of one single link failure trial of the first algorithm"""
+        cfg_file = dict(self.cfg_file)
+        for key in ['TimelineFile', 'PatternFile', 'TelemetryInterval', 'ReuseTopology']:
+            cfg_file.pop(key, None)
+        cfg_file.update({'FailureMode': 'single', 'Mode': 'fixed', 'Algorithm': cfg_file['Algorithm'][:1],
+                         'Trial': [1, 1], 'LinkChangeTime': [self.CHANGE_STEP]})
+        return cfg_file
+
+    def phase(self, name, function, *args):
+        """Run one phase, recording its time and the shell commands it ran"""
+        count = self.ovs.command_count()
+        start_time = time.perf_counter()
+        result = function(*args)
+        self.timings[name] = time.perf_counter() - start_time
+        self.commands[name] = self.ovs.command_count() - count
+        return result
+
+    def run(self, repeat=3, keep_workdir=False):
+        """Run repeat trials and return the per phase statistics"""
+        workdir = tempfile.mkdtemp(prefix='benchmark_')
+        previous_dir = os.getcwd()
+        previous = None
+        self.ovs = FakeOVS(os.path.join(workdir, 'fake_ovs'))
+        onos = FakeONOS(AlgorithmManager.APP_NAME)
+        server = None
+        runner = None
+        try:
+            os.chdir(workdir)
+            self.ovs.install()
+            cfg_file = self.trial_config()
+            with open('benchmark.json', 'w') as f:
+                json.dump(cfg_file, f)
+
+            if self.rest:
+                server = FakeONOSServer(onos).start()
+                previous = ONOSConfig.use_client(server.client())
+            else:
+                previous = ONOSConfig.use_client(onos.client())
+            runner = ExperimentRunner('benchmark.json', cfg_file['UserName'])
+            runner.topology_manager.network_class = functools.partial(FakeMininet, onos=onos)
+            runner.topology_manager.switch_class = FakeSwitch
+            algorithm = cfg_file['Algorithm'][0]
+            with open('algorithm.oar', 'wb') as f:
+                f.write(b'benchmark bundle')
+            runner.algorithm_manager.BUNDLES = {algorithm: os.path.abspath('algorithm.oar')}
+            control_socket = runner.control.socket_path if self.handshake == 'socket' else None
+            onos.on_activate[AlgorithmManager.APP_NAME] = FakeRoutingApp(
+                onos, control_socket, ready_latency=self.ready_latency).activate
+
+            runner.setup_experiment_environment(cfg_file['FailureMode'])
+            runner.control.start()
+            runner.logger.set_log_file(os.path.join(workdir, 'benchmark.log'), 'benchmark')
+            graph, traffic_flows = runner.trial_topology(1)
+
+            samples = {name: [] for name in self.PHASES}
+            commands = {name: [] for name in self.PHASES}
+            actuation = {'request_ms': [], 'exec_ms': [], 'max_lateness_ms': []}
+            for index in range(repeat):
+                self.timings = {}
+                self.commands = {}
+                extra = self.run_trial(runner, graph, traffic_flows, algorithm, f'{algorithm}_benchmark_{index + 1}')
+                for name in self.PHASES:
+                    samples[name].append(self.timings[name])
+                    commands[name].append(self.commands[name])
+                actuation['request_ms'].extend(extra['request_ms'])
+                actuation['exec_ms'].extend(extra['exec_ms'])
+                actuation['max_lateness_ms'].append(extra['max_lateness_ms'])
+                print(f'Repetition {index + 1}: ' + ', '.join(f'{name} {self.timings[name]:.3f}s' for name in self.PHASES))
+        finally:
+            if runner is not None:
+                runner.failure_manager.actuator.stop()
+                runner.control.close()
+                runner.logger.flush()
+            self.ovs.uninstall()
+            os.chdir(previous_dir)
+            if previous is not None:
+                ONOSConfig.client().close()
+                ONOSConfig.use_client(*previous)
+            if server is not None:
+                server.stop()
+            if not keep_workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        request_ms = np.asarray(actuation['request_ms'], dtype=float)
+        exec_ms = np.asarray(actuation['exec_ms'], dtype=float)
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': self.commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'rest': self.rest,
+            'handshake': self.handshake,
+            'ready_latency': self.ready_latency,
+            'topology': {'switches': len(graph.vertices), 'links': len(graph.edges), 'flows': len(traffic_flows)},
+            'phases': {name: {'mean': float(np.mean(values)), 'min': float(np.min(values)),
+                              'max': float(np.max(values)), 'samples': values}
+                       for name, values in samples.items()},
+            'commands': {name: float(np.mean(values)) for name, values in commands.items()},
+            'actuation': {'requests': len(request_ms),
+                          'request_p50_ms': float(np.percentile(request_ms, 50)) if len(request_ms) else None,
+                          'request_p99_ms': float(np.percentile(request_ms, 99)) if len(request_ms) else None,
+                          # Fork/exec plus run time of each helper command, the part the change time cannot see
+                          'exec_p50_ms': float(np.percentile(exec_ms, 50)) if len(exec_ms) else None,
+                          'exec_p99_ms': float(np.percentile(exec_ms, 99)) if len(exec_ms) else None,
+                          'max_lateness_ms': float(np.max(actuation['max_lateness_ms']))},
+        }
+
+    def run_trial(self, runner, graph, traffic_flows, algorithm, label):
+        """One trial through the same runner methods run_experiments uses"""
+        cfg_file = runner.cfg_file
+        trial_folder = f'{runner.trace_folder}fixed_version/{label}/'
+        runner.config_manager.build_folder(trial_folder, True)
+        runner.readiness.reset()
+        ONOSConfig.client().reset_metrics()
+        runner.failure_manager.actuator.reset_latencies()
+        runner.control.clear()
+
+        reset_mode = self.phase('reset', SystemManager.reset, runner.readiness, 'warm')
+        if reset_mode != 'warm':
+            raise RuntimeError('the fakes did not pass the warm reset health check')
+
+        network = self.phase('topology_build', runner.setup_network_topology,
+                             graph, traffic_flows, cfg_file['LinkBandwidth'][0])
+        net, host_map, switch_map, traffic_flows, host_to_IP, host_to_addr, addr_to_host, u_v_connection = network
+        # setup_network_topology ends waiting for ONOS to see every link
+        convergence = dict(runner.readiness.wait_times).get('controller links', 0.0)
+        self.timings['topology_build'] = self.timings['topology_build'] - convergence
+        self.timings['controller_convergence'] = convergence
+        self.commands['controller_convergence'] = 0
+
+        def setup_algorithm():
+            runner.setup_experiment_files(label, cfg_file['FailureMode'], 'fixed')
+            if not runner.algorithm_manager.setup_algorithm(algorithm):
+                raise RuntimeError('algorithm setup failed')
+            runner.wait_flows_installed()
+        self.phase('algorithm_setup', setup_algorithm)
+
+        failed_link, affected_traffic_flows = runner.failure_manager.single_link_failure_model(
+            addr_to_host, traffic_flows)
+        timeline = LinkTimeline.from_pattern(self.PATTERN, self.PATTERN_BANDWIDTHS, self.CHANGE_STEP)
+        runner.traffic_manager.trial_duration = timeline.duration
+        # The clients cover the short benchmark timeline instead of the 25s floor of a real trial
+        runner.traffic_manager.MIN_CLIENT_TIME = 0
+        self.phase('traffic_start', runner.traffic_manager.setup_traffic_flows,
+                   traffic_flows, host_map, runner.trace_folder, label, cfg_file['TrafficModel'][0],
+                   cfg_file['Throughput'][0], Event(), 'fixed', affected_traffic_flows)
+
+        # The timeline itself takes its duration; what the harness adds is the time spent in the helper
+        result = self.phase('link_actuation', runner.failure_manager.replay_timeline,
+                            timeline, failed_link, u_v_connection, net, algorithm, runner.traffic_manager.supervise)
+        request_ms = np.asarray(runner.failure_manager.actuator.round_trip_ns, dtype=float) / 1e6
+        self.timings['link_actuation'] = float(request_ms.sum()) / 1000
+        start_epochs = runner.traffic_manager.flow_start_epochs(traffic_flows)
+        # Waiting for the clients to end is traffic time, not harness overhead
+        runner.traffic_manager.wait_reports()
+
+        def cleanup():
+            runner.traffic_manager.cleanup_processes()
+            runner.cleanup_experiment(algorithm, net)
+            runner.cleanup_files()
+        self.phase('cleanup', cleanup)
+
+        # iperf3 of the fakes writes no report, the flows look as if they ran at full rate
+        write_iperf_reports(trial_folder, affected_traffic_flows, start_epochs, timeline.duration,
+                            cfg_file['Throughput'][0] * 1e6)
+        result.update({'affected_traffic_flows': affected_traffic_flows, 'failed_link': failed_link})
+
+        def analyze():
+            runner.iperf_parser.collect(trial_folder, start_epochs)
+            runner.failure_manager.analysis_trace_file(cfg_file['FailureMode'], algorithm, runner.trace_folder,
+                                                       label, result, host_map, 'fixed')
+            TrialAnalyzer(cfg_file.get('Metric')).analyze(trial_folder)
+        self.phase('analysis', analyze)
+
+        exec_ms = np.asarray(runner.failure_manager.actuator.exec_ns, dtype=float) / 1e6
+        return {'request_ms': request_ms.tolist(), 'exec_ms': exec_ms.tolist(),
+                'max_lateness_ms': float(np.max(result['lateness'])) * 1000}
+
+    @staticmethod
+    def rest_load(threads=32, requests_per_thread=200, response_delay=0.0):
+        """Hammer a FakeONOSServer from threads sharing one ONOSClient, as the parallel sweep does"""
+        onos = FakeONOS(AlgorithmManager.APP_NAME)
+        onos.apps[AlgorithmManager.APP_NAME] = 'ACTIVE'
+        server = FakeONOSServer(onos, response_delay=response_delay).start()
+        client = server.client(pool_size=threads)
+        calls = [client.get_links, client.get_flows, functools.partial(client.get_app, AlgorithmManager.APP_NAME)]
+
+        def worker(index):
+            latencies = []
+            errors = 0
+            for count in range(requests_per_thread):
+                start_time = time.perf_counter()
+                try:
+                    calls[(index + count) % len(calls)]()
+                except Exception:
+                    errors = errors + 1
+                latencies.append(time.perf_counter() - start_time)
+            return latencies, errors
+
+        try:
+            start_time = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                results = list(executor.map(worker, range(threads)))
+            elapsed = time.perf_counter() - start_time
+        finally:
+            client.close()
+            server.stop()
+
+        latency_ms = np.concatenate([latencies for latencies, _ in results]) * 1000
+        return {
+            'threads': threads,
+            'requests': len(latency_ms),
+            'errors': sum(errors for _, errors in results),
+            'throughput': len(latency_ms) / elapsed,
+            'p50_ms': float(np.percentile(latency_ms, 50)),
+            'p99_ms': float(np.percentile(latency_ms, 99)),
+            'max_ms': float(np.max(latency_ms)),
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=self.root_dir, text=True,
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.strip() or None
+        except OSError:
+            return None
+
+    @staticmethod
+    def save(results, output_file):
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        with open(output_file, 'w') as f:
+            json.dump(results, f, indent=4)
+        return output_file
+
+    @classmethod
+    def compare(cls, results, baseline_file):
+        """Return a message for every phase that got slower than in the baseline results"""
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, phase in results['phases'].items():
+            if name not in baseline.get('phases', {}):
+                continue
+            before = baseline['phases'][name]['mean']
+            after = phase['mean']
+            if after > before * (1 + cls.REGRESSION_RATIO) and after - before > cls.MIN_REGRESSION:
+                regressions.append(f'{name}: {before:.3f}s -> {after:.3f}s')
+        return regressions
@@ -7,9 +7,8 @@ import json
 import os
 import pickle
 import subprocess
-import time
-import requests
-from requests.auth import HTTPBasicAuth
+
+from .onos_client import ONOSClient
 
 
 class ConfigManager:
@@ -21,7 +20,7 @@ class ConfigManager:
         with open(config_file_name, 'r') as load_f:
             return json.load(load_f)
     
-    def build_folder(self, folder, check):
+    def build_folder(self, folder, check=False):
         if check:
             if os.path.isdir(folder):
                 os.system('sudo rm -r ' + folder)
@@ -68,21 +67,48 @@ class ConfigManager:
 
 class ONOSConfig:
 
+    # REST endpoint of the controller; parallel sweep workers point this at their own instance
+    base_url = "http://localhost:8181/onos/v1"
+    reset_script = '~/yukai_thesis/reset_onos/reset_onos.py'
+    _client = None
+
+    @staticmethod
+    def rest_url(rest_port):
+        return f"http://localhost:{rest_port}/onos/v1"
+
+    @classmethod
+    def use_rest_port(cls, rest_port):
+        cls.base_url = cls.rest_url(rest_port)
+        cls._client = None
+
+    @classmethod
+    def use_client(cls, client, base_url=None):
+        """Share client with the whole process and return the (client, base_url) it replaces
+
+        base_url defaults to the client's own; use_client(*previous) puts the replaced pair back.
+        """
+        previous = cls._client, cls.base_url
+        cls._client = client
+        cls.base_url = base_url or (client.base_url if client is not None else cls.base_url)
+        return previous
+
+    @classmethod
+    def client(cls):
+        """Return the REST client shared by the whole process"""
+        if cls._client is None:
+            cls._client = ONOSClient(cls.base_url)
+        return cls._client
+
     @staticmethod
     def configure_onos():
-        base_url = "http://localhost:8181/onos/v1"
-        username = "onos"
-        password = "rocks"
-        
-        config_url = f"{base_url}/configuration/org.onosproject.net.flow.impl.FlowRuleManager"
-        
         payload = {
             "allowExtraneousRules": True,
             "importExtraneousRules": True
         }
         
         try:
-            response = requests.post(config_url, json=payload, auth=HTTPBasicAuth(username, password))
+            response = ONOSConfig.client().set_configuration(
+                'org.onosproject.net.flow.impl.FlowRuleManager', payload)
             if response.status_code == 200:
                 print("Configuration updated successfully!")
             else:
@@ -92,23 +118,66 @@ class ONOSConfig:
             print(f"Error: {e}")
     
     @staticmethod
-    def reset_onos():
-        script_path = os.path.expanduser('~/yukai_thesis/reset_onos/reset_onos.py')
-        subprocess.Popen(['sudo', 'python3', script_path])
-        time.sleep(30)
+    def reset_onos(readiness):
+        script_path = os.path.expanduser(ONOSConfig.reset_script)
+        if SystemManager.isolated:
+            subprocess.Popen(['sudo', 'python3', script_path, ONOSConfig.base_url])
+        else:
+            subprocess.Popen(['sudo', 'python3', script_path])
         
-        while True:
-            url = "http://localhost:8181/onos/v1/applications/org.onosproject.openflow/active"
-            auth = HTTPBasicAuth("onos", "rocks")
-            
-            response = requests.post(url, headers={"Accept": "application/json"}, auth=auth)
-            if response.status_code == 200:
-                return
-            time.sleep(10)
+        # The old instance may still answer until the reset script has stopped it
+        readiness.wait_for('onos stopped', readiness.onos_down, timeout=30, interval=0.5, required=False)
+        readiness.wait_for('onos openflow active', readiness.onos_openflow_activated,
+                           timeout=300, interval=0.5, max_interval=5)
+    
+    @staticmethod
+    def purge_onos():
+        """Remove every flow, device and host ONOS still remembers from the previous trial"""
+        client = ONOSConfig.client()
+        client.remove_flows(client.get_flows())
+        for device in client.get_devices():
+            client.remove_device(device['id'])
+        for host in client.get_hosts():
+            client.remove_host(host['mac'], host.get('vlan', 'None'))
+    
+    @staticmethod
+    def flow_ids():
+        return set(flow['id'] for flow in ONOSConfig.client().get_flows())
+    
+    @staticmethod
+    def restore_flows(baseline_flow_ids):
+        """Remove every flow rule installed after the baseline snapshot"""
+        client = ONOSConfig.client()
+        client.remove_flows([flow for flow in client.get_flows() if flow['id'] not in baseline_flow_ids])
 
 
 class SystemManager:
 
+    # OVS state directories; an isolated sweep worker runs its own ovsdb-server/ovs-vswitchd
+    # out of its working directory so that it never touches another worker's switches
+    ovs_rundir = '/usr/local/var/run/openvswitch'
+    ovs_dbdir = '/usr/local/etc/openvswitch'
+    ovs_schema = '/usr/local/share/openvswitch/vswitch.ovsschema'
+    isolated = False
+
+    @staticmethod
+    def use_worker_context(context):
+        SystemManager.ovs_rundir = context.ovs_dir
+        SystemManager.ovs_dbdir = context.ovs_dir
+        SystemManager.isolated = True
+        # Mininet runs ovs-vsctl itself, so the worker process environment has to point at its OVS too
+        os.environ['OVS_RUNDIR'] = context.ovs_dir
+        os.environ['OVS_DBDIR'] = context.ovs_dir
+        os.environ['OVS_LOGDIR'] = context.ovs_dir
+
+    @staticmethod
+    def ovs_sudo():
+        """Return the sudo prefix for OVS commands"""
+        if not SystemManager.isolated:
+            return 'sudo '
+        return (f'sudo env OVS_RUNDIR={SystemManager.ovs_rundir} OVS_DBDIR={SystemManager.ovs_dbdir} '
+                f'OVS_LOGDIR={SystemManager.ovs_rundir} ')
+
     @staticmethod
     def kill_process(cmd):
 
@@ -117,6 +186,13 @@ class SystemManager:
     @staticmethod
     def kill_ovs_pid():
 
+        if SystemManager.isolated:
+            # Only stop the daemons of this worker, the kernel module is shared
+            for daemon in ['ovs-vswitchd', 'ovsdb-server']:
+                pid_file = f'{SystemManager.ovs_rundir}/{daemon}.pid'
+                os.system(f'[ -f {pid_file} ] && sudo kill $(cat {pid_file})')
+            return
+
         os.system('sudo rmmod openvswitch')
         os.system('sudo killall ovsdb-server')
         os.system('sudo killall ovs-vswitchd')
@@ -124,26 +200,87 @@ class SystemManager:
     @staticmethod
     def setup_ovs_pid():
 
-        os.system('sudo modprobe gre')
-        os.system('sudo modprobe openvswitch')
-        os.system('sudo modprobe libcrc32c')
-        os.system('sudo rm /usr/local/etc/openvswitch/conf.db')
-        os.system('sudo ovsdb-tool create /usr/local/etc/openvswitch/conf.db /usr/local/share/openvswitch/vswitch.ovsschema')
-        os.system('sudo ovsdb-server --remote=punix:/usr/local/var/run/openvswitch/db.sock --remote=db:Open_vSwitch,Open_vSwitch,manager_options  --private-key=db:Open_vSwitch,SSL,private_key --certificate=db:Open_vSwitch,SSL,certificate --bootstrap-ca-cert=db:Open_vSwitch,SSL,ca_cert --pidfile --detach --log-file')
-        os.system('sudo ovs-vsctl --no-wait init')
-        os.system('sudo ovs-vswitchd --pidfile --detach --log-file')
-        os.system('sudo ovs-vsctl --version')
+        sudo = SystemManager.ovs_sudo()
+        rundir = SystemManager.ovs_rundir
+        db_file = f'{SystemManager.ovs_dbdir}/conf.db'
+        if not SystemManager.isolated:
+            os.system('sudo modprobe gre')
+            os.system('sudo modprobe openvswitch')
+            os.system('sudo modprobe libcrc32c')
+        os.system('sudo rm ' + db_file)
+        os.system(f'sudo ovsdb-tool create {db_file} {SystemManager.ovs_schema}')
+        os.system(sudo + f'ovsdb-server {db_file} --remote=punix:{rundir}/db.sock --remote=db:Open_vSwitch,Open_vSwitch,manager_options  --private-key=db:Open_vSwitch,SSL,private_key --certificate=db:Open_vSwitch,SSL,certificate --bootstrap-ca-cert=db:Open_vSwitch,SSL,ca_cert --pidfile --detach --log-file')
+        os.system(sudo + 'ovs-vsctl --no-wait init')
+        os.system(sudo + 'ovs-vswitchd --pidfile --detach --log-file')
+        os.system(sudo + 'ovs-vsctl --version')
     
     @staticmethod
-    def reset_all():
+    def cleanup_mininet():
+        """Remove leftover Mininet state"""
+        if SystemManager.isolated:
+            # `mn -c` kills every mnexec on the box, so only drop the bridges of this worker
+            os.system(SystemManager.ovs_sudo() + 'ovs-vsctl list-br | xargs -r -n1 '
+                      + SystemManager.ovs_sudo() + 'ovs-vsctl --if-exists del-br')
+        else:
+            os.system('sudo mn -c')
+    
+    @staticmethod
+    def reset_all(readiness):
 
-        os.system('sudo mn -c')
-        time.sleep(5)
+        SystemManager.cleanup_mininet()
+        readiness.wait_for('mininet links removed', readiness.mininet_links_removed, timeout=10, required=False)
         SystemManager.kill_ovs_pid()
-        time.sleep(3)
+        readiness.wait_for('ovs stopped', readiness.ovs_stopped, timeout=10)
         SystemManager.setup_ovs_pid()
-        time.sleep(3)
-        ONOSConfig.reset_onos()
+        readiness.wait_for('ovs ready', readiness.ovs_ready, timeout=30)
+        ONOSConfig.reset_onos(readiness)
+    
+    @staticmethod
+    def warm_reset(readiness):
+        """Clear bridges, flows, controller state and netem without restarting OVS or ONOS"""
+        sudo = SystemManager.ovs_sudo()
+        bridges = readiness.run_quiet(sudo + 'ovs-vsctl --timeout=5 list-br').stdout.split()
+        if bridges:
+            os.system(sudo + 'ovs-vsctl ' + ' -- '.join(f'--if-exists del-br {bridge}' for bridge in bridges))
+        if not SystemManager.isolated:
+            # Leftover Mininet host shells and veth pairs of an interrupted trial
+            os.system('sudo pkill -9 -f "mininet:" 2> /dev/null')
+            os.system("ip -o link show | awk -F': ' '{print $2}' | grep -- '-eth' | cut -d@ -f1 "
+                      "| xargs -r -n1 sudo ip link del 2> /dev/null")
+        os.system('sudo tc qdisc del dev lo root 2> /dev/null')
+        # The health probe only reads the app state; bringing openflow back is up to the reset
+        ONOSConfig.client().activate_app('org.onosproject.openflow')
+        ONOSConfig.purge_onos()
+    
+    @staticmethod
+    def healthy(readiness):
+        """Health probe deciding whether a warm reset left a usable system"""
+        checks = [readiness.ovs_ready, readiness.bridges_removed, readiness.mininet_links_removed,
+                  readiness.onos_openflow_active, readiness.onos_purged]
+        for check in checks:
+            try:
+                if not check():
+                    readiness.logger.log(f'Health probe failed: {check.__name__}')
+                    return False
+            except Exception as e:
+                readiness.logger.log(f'Health probe failed: {check.__name__}: {str(e)}')
+                return False
+        return True
+    
+    @staticmethod
+    def reset(readiness, mode='warm'):
+        """Reset the system, falling back to a cold reset when the warm one leaves it unhealthy"""
+        if mode == 'warm':
+            try:
+                SystemManager.warm_reset(readiness)
+            except Exception as e:
+                readiness.logger.log(f'Warm reset error: {str(e)}')
+            else:
+                if readiness.wait_for('warm reset healthy', lambda: SystemManager.healthy(readiness),
+                                      timeout=10, interval=0.2, required=False) is not None:
+                    return 'warm'
+        SystemManager.reset_all(readiness)
+        return 'cold'
     
     @staticmethod
     def control_plane_delay_setup(control_plane_delay, action):
@@ -0,0 +1,298 @@
+"""
+Control channel module
+Event-driven handshakes between the harness, the ONOS apps and the helper scripts
+
+Apps may connect to the Unix socket control.sock in the working directory and send one
+signal name per line (or {"event": name, ...} JSON lines), e.g. "Algorithm_state->Ready".
+Apps that still create the handshake files are picked up through inotify as soon as the
+file is written. Every connected client receives the harness notifications (trial
+configuration, link state) as JSON lines.
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+
+
+class Inotify:
+    """Minimal inotify binding through ctypes; raises OSError where inotify is unavailable"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, path):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('libc not found')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify not available')
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE | self.IN_MOVED_FROM
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch {path} failed')
+
+    def read(self):
+        """Return [(mask, file name)] of the pending events"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset = offset + self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset = offset + length
+            events.append((mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ControlChannel:
+    """Deliver handshake signals to waiting threads as soon as a socket message or file write arrives"""
+
+    SOCKET_FILE = 'control.sock'
+    # Existence check period when inotify is unavailable
+    POLL_INTERVAL = 0.05
+    # Notifications queued for a client that stopped reading before it is dropped
+    MAX_PENDING = 1 << 20
+
+    def __init__(self, logger, directory='.'):
+        self.logger = logger
+        self.directory = os.path.abspath(directory)
+        self.socket_path = os.path.join(self.directory, self.SOCKET_FILE)
+        self.condition = threading.Condition()
+        self.signals = {}
+        self.clients = []
+        # Notifications not yet written to each client, sent from the channel thread
+        self.outgoing = {}
+        self.selector = None
+        self.server = None
+        self.waker = None
+        self.inotify = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.selector = selectors.DefaultSelector()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.socket_path)
+        # The apps may run as another user (ONOS under sudo)
+        os.chmod(self.socket_path, 0o777)
+        self.server.listen()
+        self.server.setblocking(False)
+        self.selector.register(self.server, selectors.EVENT_READ, 'accept')
+        # publish() wakes the channel thread up through this pair
+        self.waker = socket.socketpair()
+        for end in self.waker:
+            end.setblocking(False)
+        self.selector.register(self.waker[0], selectors.EVENT_READ, 'wake')
+        try:
+            self.inotify = Inotify(self.directory)
+            self.selector.register(self.inotify.fd, selectors.EVENT_READ, 'inotify')
+        except OSError as e:
+            self.inotify = None
+            self.logger.log(f'Control channel: inotify unavailable ({str(e)}), polling handshake files')
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='control', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.running = False
+        self.thread.join()
+        self.thread = None
+        for client in self.clients:
+            client.close()
+        self.clients = []
+        self.outgoing = {}
+        self.server.close()
+        for end in self.waker:
+            end.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        if self.inotify is not None:
+            self.inotify.close()
+        self.selector.close()
+
+    def run(self):
+        buffers = {}
+        while self.running:
+            for key, events in self.selector.select(self.POLL_INTERVAL):
+                if key.data == 'accept':
+                    try:
+                        client, _ = self.server.accept()
+                    except BlockingIOError:
+                        continue
+                    client.setblocking(False)
+                    buffers[client] = b''
+                    with self.condition:
+                        self.clients.append(client)
+                        self.outgoing[client] = bytearray()
+                    self.selector.register(client, selectors.EVENT_READ, 'client')
+                elif key.data == 'wake':
+                    try:
+                        self.waker[0].recv(4096)
+                    except BlockingIOError:
+                        pass
+                elif key.data == 'inotify':
+                    for mask, name in self.inotify.read():
+                        if mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM):
+                            self.clear(name)
+                        else:
+                            self.signal(name, source='file')
+                elif events & selectors.EVENT_READ:
+                    self.read_client(key.fileobj, buffers)
+            with self.condition:
+                pending = [client for client, data in self.outgoing.items() if data]
+            for client in pending:
+                self.write_client(client, buffers)
+
+    def drop(self, client, buffers):
+        self.selector.unregister(client)
+        with self.condition:
+            if client in self.clients:
+                self.clients.remove(client)
+            self.outgoing.pop(client, None)
+        buffers.pop(client, None)
+        client.close()
+
+    def write_client(self, client, buffers):
+        """Send what the socket takes of the queued notifications; wait for it to be writable for the rest"""
+        with self.condition:
+            data = self.outgoing.get(client)
+            if not data:
+                return
+            try:
+                del data[:client.send(data)]
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError as e:
+                self.logger.log(f'Control channel: notifications to a client lost: {str(e)}')
+                data = None
+            remaining = bool(data)
+        if data is None:
+            self.drop(client, buffers)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if remaining else 0)
+        if self.selector.get_key(client).events != events:
+            self.selector.modify(client, events, 'client')
+
+    def read_client(self, client, buffers):
+        try:
+            data = client.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.drop(client, buffers)
+            return
+        buffers[client] = buffers[client] + data
+        *lines, buffers[client] = buffers[client].split(b'\n')
+        for line in lines:
+            line = line.decode(errors='replace').strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = {'event': line}
+            if isinstance(message, dict) and 'event' in message:
+                self.signal(str(message.pop('event')), source='socket', **message)
+
+    def signal(self, name, source='socket', **fields):
+        with self.condition:
+            self.signals[name] = (time.monotonic(), source, fields)
+            self.condition.notify_all()
+
+    def clear(self, name=None):
+        """Forget one signal, or every signal at the start of a trial"""
+        with self.condition:
+            if name is None:
+                self.signals = {}
+            else:
+                self.signals.pop(name, None)
+
+    def consume(self, name):
+        """Forget a signal and remove its compatibility file"""
+        self.clear(name)
+        path = os.path.join(self.directory, name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def pending(self, names):
+        for name in names:
+            if name in self.signals:
+                return name
+            # Files written before the wait started, or every file when inotify is unavailable
+            if os.path.isfile(os.path.join(self.directory, name)):
+                self.signals[name] = (time.monotonic(), 'file', {})
+                return name
+        return None
+
+    def wait_any(self, names, timeout=None):
+        """Block until one of the named signals is present; return its name, or None on timeout"""
+        self.start()
+        start_time = time.monotonic()
+        deadline = None if timeout is None else start_time + timeout
+        with self.condition:
+            while True:
+                name = self.pending(names)
+                if name is not None:
+                    source = self.signals[name][1]
+                    self.logger.log(f'Signal: {name} from {source} after {time.monotonic() - start_time:.3f}s',
+                                    event='signal', name=name, source=source)
+                    return name
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.logger.log(f'No signal from {names} after {timeout}s')
+                    return None
+                # Without inotify only the poll interval bounds how late a file is noticed
+                wait_time = remaining if self.inotify is not None else self.POLL_INTERVAL
+                if remaining is not None and wait_time is not None:
+                    wait_time = min(wait_time, remaining)
+                self.condition.wait(wait_time)
+
+    def publish(self, event, **fields):
+        """Send a notification to every connected app"""
+        if self.thread is None:
+            return
+        fields['event'] = event
+        data = (json.dumps(fields) + '\n').encode()
+        # Only the channel thread writes to the sockets, a partial write is finished there
+        with self.condition:
+            for client, pending in self.outgoing.items():
+                if len(pending) + len(data) > self.MAX_PENDING:
+                    self.logger.log(f'Control channel: client not reading, {event} notification dropped')
+                    continue
+                pending.extend(data)
+        try:
+            self.waker[1].send(b'\0')
+        except BlockingIOError:
+            # The channel thread has a wake-up pending already
+            pass
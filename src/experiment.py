@@ -5,39 +5,105 @@ Integrate all functions and provide unified experiment interface
 
 import gc
 import os
-import sys
 import time
 import traceback
 import random
+import subprocess
 from threading import Event, Thread
 
-from .config import ConfigManager, SystemManager
+from .config import ConfigManager, ONOSConfig, SystemManager
 from .logger import Logger
 from .topology import TopologyManager
+from .graph import TopologyGraph
 from .algorithm import AlgorithmManager
 from .traffic import TrafficManager
-from .failure import FailureManager
+from .failure import FailureManager, FailurePatternSet, LinkTimeline
+from .readiness import ReadinessManager
+from .iperf_parser import IperfParser
+from .analysis import TrialAnalyzer
+from .telemetry import PortStatsSampler
+from .control import ControlChannel
+from .run_index import RunIndex
+from .retry import RetryPolicy, TrialFailure
 
 
 class ExperimentRunner:
 
-    def __init__(self, config_file, username):
+    # Network used when the Topology config key is "fixed" (the default)
+    FIXED_VERTICES = list(range(1, 21))
+    FIXED_EDGES = [(1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11),
+                   (11, 12), (12, 13), (13, 14), (14, 15), (15, 16), (16, 17), (17, 18), (18, 19), (19, 20),
+                   (1, 20), (6, 2), (1, 17), (9, 11), (17, 14), (5, 11), (20, 9), (4, 18), (18, 6), (14, 11),
+                   (10, 4), (3, 19), (5, 12), (9, 12), (2, 16), (13, 3)]
+    FIXED_TRAFFIC_FLOWS = [('h20_0', 'h6_0'), ('h5_0', 'h9_0'), ('h7_0', 'h2_0'), ('h3_0', 'h15_0'),
+                           ('h6_0', 'h10_0'), ('h6_0', 'h8_0'), ('h18_0', 'h8_0'), ('h6_0', 'h18_0'),
+                           ('h4_0', 'h11_0'), ('h10_0', 'h8_0'), ('h12_0', 'h8_0'), ('h2_0', 'h17_0'),
+                           ('h11_0', 'h8_0'), ('h11_0', 'h20_0'), ('h8_0', 'h19_0'), ('h2_0', 'h8_0'),
+                           ('h3_0', 'h9_0'), ('h9_0', 'h15_0'), ('h18_0', 'h9_0'), ('h14_0', 'h6_0'),
+                           ('h4_0', 'h17_0'), ('h20_0', 'h8_0'), ('h5_0', 'h18_0'), ('h2_0', 'h14_0'),
+                           ('h8_0', 'h7_0'), ('h10_0', 'h5_0'), ('h13_0', 'h5_0'), ('h20_0', 'h14_0'),
+                           ('h4_0', 'h20_0'), ('h14_0', 'h8_0'), ('h18_0', 'h2_0')]
+
+    # Files describing the built topology, kept while the topology is reused
+    TOPOLOGY_FILES = ['./host_to_addr_location.json', './traffic_flows.pkl']
+
+    def __init__(self, config_file, username, worker_context=None):
         self.config_manager = ConfigManager(username)
         self.cfg_file = self.config_manager.read_config_file(config_file)
         self.logger = Logger()
-        self.topology_manager = TopologyManager(self.logger)
-        self.algorithm_manager = AlgorithmManager(self.logger)
-        self.traffic_manager = TrafficManager(self.logger, self.config_manager)
+        self.readiness = ReadinessManager(self.logger)
+        self.topology_manager = TopologyManager(self.logger, self.readiness)
+        self.control = ControlChannel(self.logger)
+        self.algorithm_manager = AlgorithmManager(self.logger, self.control)
+        self.traffic_manager = TrafficManager(self.logger, self.config_manager, self.readiness)
         self.failure_manager = FailureManager(self.logger, self.config_manager)
+        self.failure_manager.control = self.control
+        self.iperf_parser = IperfParser(self.logger)
+        if self.cfg_file.get('IperfJsonStream', False):
+            self.traffic_manager.json_flags = ['-J', '--json-stream']
+        # Traces replayed in every trial instead of the failure patterns, one per failed link or shared
+        self.link_timelines = None
+        if self.cfg_file.get('TimelineFile'):
+            self.link_timelines = LinkTimeline.load_all(self.cfg_file['TimelineFile'],
+                                                        self.cfg_file.get('LinkChangeTime', [5])[0])
+        self.retry_policy = RetryPolicy(self.logger, self.cfg_file.get('RetryBudget'),
+                                        self.cfg_file.get('RetryLimit', 6), self.cfg_file.get('RetryBackoff', 5))
+        self.telemetry = None
+        if self.cfg_file.get('TelemetryInterval'):
+            self.telemetry = PortStatsSampler(self.logger, self.cfg_file['TelemetryInterval'],
+                                              self.cfg_file.get('TelemetryCollapseTime', 3.0))
         
+        # Result folder number, taken from the digits of the configuration name
+        self.run_number = ''.join([x for x in os.path.basename(config_file) if x.isdigit()]) or 'run'
+        self.trace_root = './Trace_folder'
+        self.worker_context = worker_context
+        if worker_context is not None:
+            self.apply_worker_context(worker_context)
   
         self.trace_folder = None
         self.log_folder = None
         self.result_folder = None
+        self.topology = None
+        self.failure_pattern_set = None
+        self.run_index = None
+    
+    def apply_worker_context(self, context):
+        """Point every manager at the resources owned by a sweep worker"""
+        self.trace_root = context.trace_root
+        self.topology_manager.controller_port = context.controller_port
+        self.topology_manager.switch_prefix = context.bridge_prefix
+        self.failure_manager.switch_prefix = context.bridge_prefix
+        self.traffic_manager.BASE_PORT = context.base_port
+        SystemManager.use_worker_context(context)
+        ONOSConfig.use_rest_port(context.rest_port)
         
     def setup_experiment_environment(self, failure_mode):
-        self.trace_folder = self.config_manager.build_folder(f'./Trace_folder/{failure_mode}/')
-        num = self.config_manager.build_folder('./' + ''.join([x for x in str(sys.argv[2]) if x.isdigit()]))
+        self.config_manager.build_folder(self.trace_root)
+        self.trace_folder = self.config_manager.build_folder(f'{self.trace_root}/{failure_mode}/')
+        sub_folder = 'markov_chain' if self.cfg_file['Mode'] == 'markov' else 'fixed_version'
+        self.config_manager.build_folder(f'{self.trace_folder}{sub_folder}/')
+        self.run_index = RunIndex(f'{self.trace_folder}{sub_folder}/{RunIndex.FILE}')
+        num = self.config_manager.build_folder('./' + self.run_number)
         self.result_folder = self.config_manager.build_folder(num + '/result_folder/')
         self.log_folder = self.config_manager.build_folder(num + '/log_folder/')
         
@@ -49,43 +115,61 @@ class ExperimentRunner:
     def setup_experiment_files(self, label, failure_mode, mode):
         self.config_manager.build_text('./BW.txt', str(self.cfg_file['LinkBandwidth'][0]))
         self.config_manager.build_text('./flow_throughput.txt', str(self.cfg_file['Throughput'][0]))
-        self.config_manager.build_text('./result_folder_label.txt', ''.join([x for x in str(sys.argv[2]) if x.isdigit()]))
+        self.config_manager.build_text('./result_folder_label.txt', self.run_number)
         self.config_manager.build_text('./label.txt', str(label))
         self.config_manager.build_text('./linkdown_mode.txt', str(failure_mode))
         self.config_manager.build_text('./mode.txt', mode)
         self.config_manager.build_text('./failed_link_bw.txt', '')
+        self.control.publish('trial', label=label, bw=self.cfg_file['LinkBandwidth'][0],
+                             throughput=self.cfg_file['Throughput'][0], result_folder=self.run_number,
+                             linkdown_mode=failure_mode, mode=mode)
         
         ## note: maybe not necessary
         if os.path.isfile('traffic_mac.txt'):
             os.system('sudo rm ./traffic_mac.txt')
     
-    def setup_network_topology(self, edge_set, vertex_set, flow_count, link_bandwidth):
-        self.logger.log_timestamp('Build mininet topology')
-        net, host_map, switch_map, traffic_flows, host_to_IP = self.topology_manager.build_topo(
-            edge_set, vertex_set, flow_count, link_bandwidth)
-        
-        traffic_flows = [('h20_0', 'h6_0'), ('h5_0', 'h9_0'), ('h7_0', 'h2_0'), ('h3_0', 'h15_0'), 
-                        ('h6_0', 'h10_0'), ('h6_0', 'h8_0'), ('h18_0', 'h8_0'), ('h6_0', 'h18_0'), 
-                        ('h4_0', 'h11_0'), ('h10_0', 'h8_0'), ('h12_0', 'h8_0'), ('h2_0', 'h17_0'), 
-                        ('h11_0', 'h8_0'), ('h11_0', 'h20_0'), ('h8_0', 'h19_0'), ('h2_0', 'h8_0'), 
-                        ('h3_0', 'h9_0'), ('h9_0', 'h15_0'), ('h18_0', 'h9_0'), ('h14_0', 'h6_0'), 
-                        ('h4_0', 'h17_0'), ('h20_0', 'h8_0'), ('h5_0', 'h18_0'), ('h2_0', 'h14_0'), 
-                        ('h8_0', 'h7_0'), ('h10_0', 'h5_0'), ('h13_0', 'h5_0'), ('h20_0', 'h14_0'), 
-                        ('h4_0', 'h20_0'), ('h14_0', 'h8_0'), ('h18_0', 'h2_0')]
-        
-        self.logger.log_timestamp('Create host to address data')
-        host_to_addr, addr_to_host = self.topology_manager.create_host_to_addr_location_file(net, self.config_manager)
+    def trial_topology(self, trial):
+        """Return the switch graph and traffic flows of a trial, chosen by the Topology config key"""
+        topology = self.cfg_file.get('Topology', 'fixed')
+        flow_count = self.cfg_file['FlowCount'][0]
+        # Seeded per trial so every algorithm of a trial (and every worker) sees the same network
+        rng = random.Random(trial)
         
-        self.logger.log_timestamp('Create traffic flows file')
-        self.topology_manager.create_traffic_flows_file(traffic_flows, host_to_addr, self.config_manager)
-        
-        self.logger.log_timestamp('Create switch connection data')
-        u_v_connection = self.topology_manager.create_u_v_connection(switch_map, edge_set)
-        
-        time.sleep(10)
-        
-        self.logger.log_timestamp('Check controller connectivity')
-        self.topology_manager.check_controller_connectivity(len(edge_set))
+        if topology == 'fixed':
+            return TopologyGraph(self.FIXED_VERTICES, self.FIXED_EDGES), list(self.FIXED_TRAFFIC_FLOWS)
+        if topology == 'random':
+            graph = TopologyGraph.generate(self.cfg_file['Vertex'][0], self.cfg_file['Edge'][0], rng)
+        elif topology.startswith('sndlib:'):
+            graph = TopologyGraph.from_sndlib('./SNDlib/' + topology[len('sndlib:'):])
+        else:
+            raise ValueError(f'Unknown topology: {topology}')
+        return graph, graph.generate_flows(flow_count, rng)
+    
+    def setup_network_topology(self, graph, traffic_flows, link_bandwidth):
+        self.logger.log_timestamp('Build mininet topology')
+        net, host_map, switch_map, host_to_IP = self.topology_manager.build_topo(graph, link_bandwidth)
+        try:
+            self.failure_manager.topology_index = self.topology_manager.index
+            self.traffic_manager.topology_index = self.topology_manager.index
+            
+            self.logger.log_timestamp('Create host to address data')
+            host_to_addr, addr_to_host = self.topology_manager.create_host_to_addr_location_file(net, self.config_manager)
+            
+            self.logger.log_timestamp('Create traffic flows file')
+            self.topology_manager.create_traffic_flows_file(traffic_flows, host_to_addr, self.config_manager)
+            
+            self.logger.log_timestamp('Create switch connection data')
+            u_v_connection = self.topology_manager.create_u_v_connection(switch_map, graph.edges)
+            graph.load_ports(u_v_connection)
+            if self.telemetry is not None:
+                self.telemetry.configure(self.topology_manager.index, self.topology_manager.bridge_name)
+            
+            self.logger.log_timestamp('Check controller connectivity')
+            self.topology_manager.check_controller_connectivity(len(graph.edges))
+        except Exception:
+            # The caller never gets this network; its host shells, veths and qdiscs must not outlive the attempt
+            self.stop_network(net)
+            raise
         
         return net, host_map, switch_map, traffic_flows, host_to_IP, host_to_addr, addr_to_host, u_v_connection
     
@@ -93,11 +177,6 @@ class ExperimentRunner:
         try:
             # Read link_change_time parameter from config file
             link_change_time = self.cfg_file.get('LinkChangeTime', [5])[0]
-            status_start = []
-            status_stop = []
-            change = []
-            link_state_flag = True
-            change_counter = 0
             
             if mode == 'markov':
                 status_list = self.failure_manager.simulate_markov_chain(
@@ -115,151 +194,94 @@ class ExperimentRunner:
             
             # SDFFR special handling
             if algorithm.startswith('SDFFR'):
-                time.sleep(3)
+                self.wait_flows_installed()
                 SystemManager.control_plane_delay_setup(self.cfg_file['ControlPlaneDelay'][0], 'delete')
                 
                 os.system('sudo python3 /home/lce/yukai_thesis/experiment/SD-FFR/pre_install_select_novlan.py')
                 SystemManager.control_plane_delay_setup(self.cfg_file['ControlPlaneDelay'][0], 'add')
             
-            time.sleep(10)
+            self.wait_flows_installed()
             
             start_event = Event()
+            timeline = LinkTimeline.from_pattern(status_list, None, link_change_time)
+            self.traffic_manager.trial_duration = timeline.duration
             thread_manager = self.traffic_manager.setup_traffic_flows(
-                traffic_flows, host_map, self.trace_folder, label, traffic_model, throughput, start_event, mode)
-            
-            # Execute status changes
-            priority = 21
-            for idx, status in enumerate(status_list):
-                # SDFFR local rerouting handling
-                if algorithm.startswith('SDFFR') and status != 0:
-                    # Need to implement SDFFR local rerouting logic here
-                    pass
-                
-                status_start.append(time.time())
-                
-                if status == 0:
-                    self.logger.log_link_status(status)
-                    if idx == 0 or status != status_list[idx - 1]:
-                        change.append(self.failure_manager.bw_change(
-                            failed_link, u_v_connection, True, 1000, net, link_state_flag, algorithm))
-                        link_state_flag = True
-                        change_counter = change_counter + 1
-                    else:
-                        change.append(time.time())
-                elif status == 1:
-                    new_bw = random.randint(1, 999)
-                    self.logger.log_link_status(status, new_bw)
-                    change.append(self.failure_manager.bw_change(
-                        failed_link, u_v_connection, True, new_bw, net, link_state_flag, algorithm))
-                    link_state_flag = True
-                    change_counter = change_counter + 1
-                elif status == 2:
-                    self.logger.log_link_status(status)
-                    if status != status_list[idx - 1]:
-                        change.append(self.failure_manager.bw_change(
-                            failed_link, u_v_connection, True, 0, net, link_state_flag, algorithm))
-                        link_state_flag = True
-                        change_counter = change_counter + 1
-                    else:
-                        change.append(time.time())
-                
-                time.sleep(link_change_time)
-                status_stop.append(time.time())
+                traffic_flows, host_map, self.trace_folder, label, traffic_model, throughput, start_event, mode, affected_traffic_flows)
+            if self.telemetry is not None:
+                self.telemetry.start(lambda reason: self.traffic_manager.fail('telemetry', reason))
             
-            for idx, status in enumerate(status_list):
-                self.logger.log_link_status_timestamp(status, status_start[idx])
+            result = self.failure_manager.replay_timeline(
+                timeline, failed_link, u_v_connection, net, algorithm, self.traffic_manager.supervise)
+            self.stop_telemetry(label, mode)
             
-            time.sleep(3)
+            for status, start in zip(result['states'], result['status_start']):
+                self.logger.log_link_status_timestamp(status, start)
+            
+            self.wait_link_changes_recorded(label, mode, result['change_counter'])
+            # The affected clients run as long as the timeline; their reports are written when they exit
+            self.traffic_manager.wait_reports()
             self.failure_manager.path_record(self.trace_folder, label, 'after link failure', mode)
             
             self.traffic_manager.cleanup_processes()
             SystemManager.kill_process('record')
             
-            return {
-                "affected_traffic_flows": affected_traffic_flows,
-                "failed_link": failed_link,
-                "change": change,
-                'change_counter': change_counter,
-                "status1_start": status_start[0], "status1_stop": status_stop[0],
-                "status2_start": status_start[1], "status2_stop": status_stop[1],
-                "status3_start": status_start[2], "status3_stop": status_stop[2],
-                "status4_start": status_start[3], "status4_stop": status_stop[3],
-                "status5_start": status_start[4], "status5_stop": status_stop[4]
-            }
+            result.update({"affected_traffic_flows": affected_traffic_flows, "failed_link": failed_link})
+            return result
             
         except Exception as e:
             self.logger.log(f'single_link_failure error: {str(e)}')
-            self.traffic_manager.cleanup_processes()
+            self.stop_telemetry(label, mode)
+            self.traffic_manager.cleanup_processes(abort=True)
             return None
     
     def run_multiple_link_failure_experiment(self, traffic_model, traffic_flows, host_map, 
-                                           addr_to_host, u_v_connection, label, net, throughput):
+                                           addr_to_host, u_v_connection, label, net, throughput, mode='fixed'):
         try:
             link_change_time = self.cfg_file.get('LinkChangeTime', [5])[0]
             
-            self.logger.log(f'link_change_time: {link_change_time}')
-            
             failed_links, affected_traffic_flows = self.failure_manager.multiple_link_failure_model(
-                addr_to_host, traffic_flows)
+                addr_to_host, traffic_flows, self.cfg_file.get('FailedLinks', 2), self.cfg_file.get('FailureGroup', 'srlg'))
+            
+            if self.link_timelines is None:
+                timelines = LinkTimeline.staggered(len(failed_links), link_change_time)
+                self.logger.log(f'link_change_time: {link_change_time}')
+            elif len(self.link_timelines) == 1:
+                # One shared timeline: every failed link changes at the same instants
+                timelines = self.link_timelines * len(failed_links)
+            elif len(self.link_timelines) == len(failed_links):
+                timelines = self.link_timelines
+            else:
+                raise ValueError(f'{len(self.link_timelines)} timelines for {len(failed_links)} failed links')
             
-            self.traffic_manager.affected_traffic_flows = affected_traffic_flows
+            self.wait_flows_installed()
             
             start_event = Event()
+            self.traffic_manager.trial_duration = max(timeline.duration for timeline in timelines)
             thread_manager = self.traffic_manager.setup_traffic_flows(
-                traffic_flows, host_map, self.trace_folder, label, traffic_model, throughput, start_event, 'fixed')
-            
-            # status: los
-            los1_start = time.time()
-            self.logger.log(f'Collecting experimental data: {los1_start}')
-            time.sleep(link_change_time)
-            los1_stop = time.time()
-            
-            # status: fnlos1
-            fnlos1_start = time.time()
-            change_1 = self.failure_manager.link_state_change(failed_links[0], u_v_connection, "down", "fnlos")
-            time.sleep(link_change_time)
-            fnlos1_stop = time.time()
-            self.logger.log(f'fnlos_start: {fnlos1_start}')
-            
-            # status: fnlos2
-            fnlos2_start = time.time()
-            change_2 = self.failure_manager.link_state_change(failed_links[1], u_v_connection, "down", "fnlos")
-            time.sleep(link_change_time)
-            fnlos2_stop = time.time()
-            self.logger.log(f'fnlos_start: {fnlos2_start}')
-            
-            # status: los2
-            los2_start = time.time()
-            change_3 = self.failure_manager.link_state_change(failed_links[1], u_v_connection, "up", "los")
-            time.sleep(link_change_time)
-            los2_stop = time.time()
-            self.logger.log(f'los2_start: {los2_start}')
-            
-            # status: los3
-            los3_start = time.time()
-            change_4 = self.failure_manager.link_state_change(failed_links[0], u_v_connection, "up", "los")
-            time.sleep(link_change_time)
-            los3_stop = time.time()
-            self.logger.log(f'los3_start: {los3_start}')
-            
-            self.failure_manager.path_record(self.trace_folder, label, 'after link failure', 'fixed')
+                traffic_flows, host_map, self.trace_folder, label, traffic_model, throughput, start_event, mode, affected_traffic_flows)
+            if self.telemetry is not None:
+                self.telemetry.start(lambda reason: self.traffic_manager.fail('telemetry', reason))
+            
+            result = self.failure_manager.replay_link_timelines(
+                timelines, failed_links, u_v_connection, self.traffic_manager.supervise)
+            self.stop_telemetry(label, mode)
+            
+            self.wait_link_changes_recorded(label, mode, result['change_counter'])
+            # The affected clients run as long as the timeline; their reports are written when they exit
+            self.traffic_manager.wait_reports()
+            self.failure_manager.path_record(self.trace_folder, label, 'after link failure', mode)
             
             # Cleanup processes
             self.traffic_manager.cleanup_processes()
+            SystemManager.kill_process('record')
             
-            return {
-                "affected_traffic_flows": affected_traffic_flows,
-                "failed_links": failed_links,
-                "los1_start": los1_start, "los1_stop": los1_stop, "change_1": change_1,
-                "fnlos1_start": fnlos1_start, "fnlos1_stop": fnlos1_stop, "change_2": change_2,
-                "fnlos2_start": fnlos2_start, "fnlos_stop": fnlos2_stop, "change_3": change_3,
-                "los2_start": los2_start, "los2_stop": los2_stop, "change_4": change_4,
-                "los3_start": los3_start, "los3_stop": los3_stop
-            }
+            result.update({"affected_traffic_flows": affected_traffic_flows, "failed_links": failed_links})
+            return result
             
         except Exception as e:
             self.logger.log(f'multiple_link_failure error: {str(e)}')
-            self.traffic_manager.cleanup_processes()
+            self.stop_telemetry(label, mode)
+            self.traffic_manager.cleanup_processes(abort=True)
             return None
     
     def run_experiment(self, failure_mode, traffic_model, algorithm, traffic_flows, host_map, addr_to_host, u_v_connection, label, net, throughput, mode='markov'):
@@ -288,24 +310,109 @@ class ExperimentRunner:
         elif failure_mode == 'multiple':
             data = self.run_multiple_link_failure_experiment(
                 traffic_model, traffic_flows, host_map, addr_to_host, 
-                u_v_connection, label, net, throughput)
+                u_v_connection, label, net, throughput, mode)
         
         self.logger.log_timestamp('Testing Completed')
         self.logger.log(f'Test data: {data}')
         
         return data
     
-    def cleanup_experiment(self, algorithm):
+    def wait_flows_installed(self):
+        """Wait until the algorithm has finished installing its flow rules"""
+        self.readiness.wait_for('traffic flow paths', self.readiness.file_has_content('./traffic_flow_paths.txt'),
+                                timeout=30, required=False)
+        self.readiness.wait_for('flows installed', self.readiness.flows_settled(),
+                                timeout=30, interval=0.2, max_interval=1, required=False)
+    
+    def stop_telemetry(self, label, mode):
+        """Stop the port stats sampler and keep its samples in the trial folder"""
+        if self.telemetry is None:
+            return
+        sub_folder = 'markov_chain' if mode == 'markov' else 'fixed_version'
+        sample_file = f'{self.trace_folder}{sub_folder}/{label}/{PortStatsSampler.SAMPLE_FILE}'
+        try:
+            self.telemetry.stop(sample_file)
+        except Exception as e:
+            self.logger.log(f'Port stats save error: {str(e)}')
+    
+    def wait_link_changes_recorded(self, label, mode, change_counter):
+        """Wait until the controller has recorded every link change of the trial"""
+        sub_folder = 'markov_chain' if mode == 'markov' else 'fixed_version'
+        file_path = f'{self.trace_folder}{sub_folder}/{label}/detect_link_change.txt'
+        self.readiness.wait_for('link changes recorded', self.readiness.file_line_count(file_path, change_counter),
+                                timeout=10, required=False)
+    
+    def stop_network(self, net):
+        try:
+            net.stop()
+        except Exception as e:
+            self.logger.log(f"Stop network error: {str(e)}")
+    
+    def acquire_topology(self, graph, traffic_flows, link_bandwidth, reset_mode):
+        """Build the trial topology, or restore the one kept from the previous algorithm"""
+        if self.topology is not None:
+            self.logger.log_timestamp('Restore topology baseline')
+            self.restore_topology_baseline(link_bandwidth)
+            return self.topology['network']
+        
+        self.logger.log(f"Reset: {SystemManager.reset(self.readiness, reset_mode)}")
+        network = self.setup_network_topology(graph, traffic_flows, link_bandwidth)
+        if self.cfg_file.get('ReuseTopology', False):
+            self.readiness.wait_for('baseline flows', self.readiness.flows_settled(),
+                                    timeout=30, interval=0.2, max_interval=1, required=False)
+            self.failure_manager.changed_links = set()
+            try:
+                baseline_flows = ONOSConfig.flow_ids()
+            except Exception:
+                self.stop_network(network[0])
+                raise
+            self.topology = {
+                'network': network,
+                'edge_count': len(graph.edges),
+                'baseline_flows': baseline_flows
+            }
+        return network
+    
+    def restore_topology_baseline(self, link_bandwidth):
+        """Reset link state, bandwidth and flow tables to how they were right after the build"""
+        net, u_v_connection = self.topology['network'][0], self.topology['network'][7]
+        self.failure_manager.restore_links(net, u_v_connection, link_bandwidth)
+        ONOSConfig.restore_flows(self.topology['baseline_flows'])
+        self.topology_manager.check_controller_connectivity(self.topology['edge_count'])
+    
+    def release_topology(self):
+        """Tear down a topology kept across algorithms"""
+        if self.topology is None:
+            return
+        net = self.topology['network'][0]
+        self.topology = None
+        try:
+            if SystemManager.isolated:
+                net.stop()
+            else:
+                SystemManager.cleanup_mininet()
+        except Exception as e:
+            self.logger.log(f"Release topology error: {str(e)}")
+        for file_path in self.TOPOLOGY_FILES:
+            if os.path.isfile(file_path):
+                os.system('sudo rm ' + file_path)
+    
+    def cleanup_experiment(self, algorithm, net=None):
         self.algorithm_manager.close_algorithm()
-        time.sleep(5)
-        os.system('sudo mn -c')
+        self.readiness.wait_for('algorithm deactivated', self.readiness.app_inactive(AlgorithmManager.APP_NAME),
+                                timeout=30, required=False)
+        if self.topology is not None:
+            # Kept for the next algorithm of this trial
+            return
+        if SystemManager.isolated and net is not None:
+            net.stop()
+        else:
+            SystemManager.cleanup_mininet()
     
-    def cleanup_files(self):
+    def cleanup_files(self, keep_topology=False):
         files_to_clean = [
-            './host_to_addr_location.json',
             './Algorithm_state->Ready',
             './Algorithm_state->Error',
-            './traffic_flows.pkl',
             './traffic_flow_paths.txt',
             './traffic_flow_paths.pkl',
             './remove',
@@ -321,17 +428,18 @@ class ExperimentRunner:
             './SD-FFR/link_backup_path.txt',
             './traffic_mac.txt'
         ]
+        if not keep_topology:
+            files_to_clean = self.TOPOLOGY_FILES + files_to_clean
         
         for file_path in files_to_clean:
             if os.path.isfile(file_path):
-                os.system('sudo rm ' + file_path)
+                # No shell: the '>' of the handshake file names would be taken as a redirection
+                subprocess.run(['sudo', 'rm', file_path])
     
     def count_file(self, label, mode):
         try:
-            if mode == 'markov':
-                file_path = f'./Trace_folder/single/markov_chain/{label}/detect_link_change.txt'
-            else:
-                file_path = f'./Trace_folder/single/fixed_version/{label}/detect_link_change.txt'
+            sub_folder = 'markov_chain' if mode == 'markov' else 'fixed_version'
+            file_path = f'{self.trace_folder}{sub_folder}/{label}/detect_link_change.txt'
             
             with open(file_path, 'r') as file:
                 line_count = sum(1 for line in file)
@@ -345,10 +453,11 @@ class ExperimentRunner:
             self.logger.log("Error reading the file.")
             return 0
     
-    def run_experiments(self):
+    def run_experiments(self, trials=None):
         """Run all experiments"""
         try:
             num = self.setup_experiment_environment(self.cfg_file['FailureMode'])
+            self.control.start()
             result = {}
             
             failure_patterns = self.generate_failure_patterns()
@@ -362,19 +471,29 @@ class ExperimentRunner:
             flow_count = self.cfg_file['FlowCount'][0]
 
             # Iterate through all experiment parameter combinations
-            for i in range(self.cfg_file['Trial'][0], self.cfg_file['Trial'][1] + 1):
+            if trials is None:
+                trials = range(self.cfg_file['Trial'][0], self.cfg_file['Trial'][1] + 1)
+            sub_folder = 'markov_chain' if self.cfg_file['Mode'] == 'markov' else 'fixed_version'
+            self.run_index.plan(
+                [(self.create_experiment_label(algorithm, vertex, edge, link_bandwidth, throughput, traffic_model,
+                                               control_plane_delay, flow_count, i), i, algorithm)
+                 for i in trials for algorithm in self.cfg_file['Algorithm']],
+                f'{self.trace_folder}{sub_folder}')
+            self.logger.log(f'Run index: {self.run_index.summary()}')
+            
+            for i in trials:
+                graph, trial_flows = self.trial_topology(i)
 
                 for algorithm in self.cfg_file['Algorithm']:
                     label = self.create_experiment_label(
                         algorithm, vertex, edge, link_bandwidth, throughput,
                         traffic_model, control_plane_delay, flow_count, i)
                     
-                    if self.cfg_file['Mode'] == 'markov':
-                        if os.path.isdir(f"{self.trace_folder}markov_chain/{label}"):
-                            continue
-                    else:
-                        if os.path.isdir(f"{self.trace_folder}fixed_version/{label}"):
-                            continue
+                    changed = self.run_index.recheck(label, f'{self.trace_folder}{sub_folder}/{label}')
+                    if changed:
+                        self.logger.log(f'Rerunning {label}, artifacts changed since it was done: {", ".join(changed)}')
+                    if self.run_index.is_settled(label):
+                        continue
                     
                     print(f'Starting experiment: {label}')
                     
@@ -384,6 +503,7 @@ class ExperimentRunner:
                     # Get pre-generated failure pattern for this parameter combination
                     pattern_key = i
                     failure_pattern = failure_patterns.get(pattern_key)
+                    pattern_bandwidths = self.failure_pattern_set.bandwidths_of(pattern_key) if failure_pattern else None
                     
                     if failure_pattern is None:
                         self.logger.log(f"Error: No failure pattern found for {pattern_key}")
@@ -391,10 +511,20 @@ class ExperimentRunner:
                     
                     # Run experiment
                     success = False
+                    # Attempts of earlier runs count, so a label that keeps crashing the process gets quarantined
+                    self.retry_policy.begin(label, self.run_index.attempts(label))
+                    if self.retry_policy.exhausted():
+                        self.run_index.quarantine(label, f'{self.retry_policy.previous} attempts in earlier runs')
+                        self.logger.log(f'Quarantined {label} after {self.retry_policy.previous} attempts in earlier runs',
+                                        event='quarantine', attempts=self.retry_policy.previous)
+                        continue
                     while not success:
+                        attempt_start = time.monotonic()
+                        phase = RetryPolicy.SETUP
+                        net = None
+                        cleaned = False
+                        self.run_index.start(label)
                         try:
-                            SystemManager.reset_all()
-                            
                             if self.cfg_file['Mode'] == 'markov':
                                 self.config_manager.build_folder(f"{self.trace_folder}markov_chain/{label}", True)
                             else:
@@ -402,8 +532,16 @@ class ExperimentRunner:
                             self.config_manager.build_folder(f"{self.log_folder}{label}", True)
                             
                             log_file = self.config_manager.build_log_file(
-                                f"{self.trace_folder}{'markov' if self.cfg_file['Mode'] == 'markov' else 'fixed'}/{label}/{i}.log")
-                            self.logger.set_log_file(log_file)
+                                f"{self.trace_folder}{'markov_chain' if self.cfg_file['Mode'] == 'markov' else 'fixed_version'}/{label}/{i}.log")
+                            self.logger.set_log_file(log_file, label)
+                            self.readiness.reset()
+                            ONOSConfig.client().reset_metrics()
+                            self.failure_manager.actuator.reset_latencies()
+                            self.failure_manager.actuator.start()
+                            self.control.clear()
+                            
+                            # A retry only resets as deep as the failure class of the previous attempt requires
+                            reset_mode = self.retry_policy.reset_mode(self.cfg_file.get('ResetMode', 'warm'))
                             
                             # Log experiment parameters
                             self.logger.log(f"Experiment {i} start")
@@ -418,204 +556,241 @@ class ExperimentRunner:
                             self.logger.log(f"Failure mode: {self.cfg_file['FailureMode']}")
                             self.logger.log(f"Failure pattern: {failure_pattern}")
                             
-                            # Setup network topology
-                            edge_set = [(1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 7), (7, 8), (8, 9), (9, 10), (10, 11), (11, 12), (12, 13), (13, 14), (14, 15), (15, 16), (16, 17), (17, 18), (18, 19), (19, 20), (1, 20), (6, 2), (1, 17), (9, 11), (17, 14), (5, 11), (20, 9), (4, 18), (18, 6), (14, 11), (10, 4), (3, 19), (5, 12), (9, 12), (2, 16), (13, 3)]
-                            vertex_set = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20]
+                            self.logger.log(f"Topology: {self.cfg_file.get('Topology', 'fixed')}, "
+                                            f"{len(graph.vertices)} nodes, {len(graph.edges)} links, {len(trial_flows)} flows")
                             
-                            net, host_map, switch_map, traffic_flows, host_to_IP, host_to_addr, addr_to_host, u_v_connection = self.setup_network_topology(
-                                edge_set, vertex_set, flow_count, link_bandwidth)
+                            # Setup network topology
+                            net, host_map, switch_map, traffic_flows, host_to_IP, host_to_addr, addr_to_host, u_v_connection = self.acquire_topology(
+                                graph, trial_flows, link_bandwidth, reset_mode)
                             
+                            phase = RetryPolicy.CONTROLLER
                             self.logger.log_timestamp('Setup the algorithm')
+                            phase_start = time.monotonic()
                             algorithm_setup_state = self.algorithm_manager.setup_algorithm(algorithm)
+                            # An app error is retried on the running network before giving up the attempt
+                            while not algorithm_setup_state and self.retry_policy.retry_phase(
+                                    phase, time.monotonic() - phase_start, 'algorithm setup failed'):
+                                self.algorithm_manager.close_algorithm()
+                                self.control.clear()
+                                phase_start = time.monotonic()
+                                algorithm_setup_state = self.algorithm_manager.setup_algorithm(algorithm)
+                            if not algorithm_setup_state:
+                                raise TrialFailure(phase, 'algorithm setup failed')
                             
                             self.logger.log_timestamp('Setup control plane delay')
                             SystemManager.control_plane_delay_setup(control_plane_delay, 'add')
                             
-                            if algorithm_setup_state:
-                                self.logger.log_timestamp('Run the test case')
+                            phase = RetryPolicy.TRAFFIC
+                            self.logger.log_timestamp('Run the test case')
+                            if self.cfg_file['FailureMode'] == 'multiple':
+                                data = self.run_multiple_link_failure_experiment(
+                                    traffic_model, traffic_flows, host_map, addr_to_host,
+                                    u_v_connection, label, net, throughput, mode)
+                            else:
                                 data = self.run_single_link_failure_experiment_with_pattern(
-                                    self.cfg_file['FailureMode'], traffic_model, algorithm,
+                                    traffic_model, algorithm,
                                     traffic_flows, host_map, addr_to_host, u_v_connection,
-                                    label, net, throughput, mode, failure_pattern)
-                                
-                                # Cleanup network
-                                self.cleanup_experiment(algorithm)
-                                
-                                count_line = self.count_file(label, self.cfg_file['FailureMode'])
-                                
-                                if count_line != data['change_counter']:
-                                    print('======================================')
-                                    print('Data mismatch, rerunning experiment')
-                                    print(f'count_line: {count_line}')
-                                    print(f'change_counter: {data["change_counter"]}')
-                                    print('======================================')
-                                    self.cleanup_files()
-                                    SystemManager.control_plane_delay_setup(control_plane_delay, 'delete')
-                                    continue
-                                elif data is None:
-                                    self.cleanup_files()
-                                    SystemManager.control_plane_delay_setup(control_plane_delay, 'delete')
-                                    continue
-                                else:
-                                    self.logger.log_timestamp('Analysis result')
-                                    self.failure_manager.analysis_trace_file(
-                                        self.cfg_file['FailureMode'], algorithm,
-                                        self.trace_folder, label, data, host_map)
-                                    
-                                    SystemManager.control_plane_delay_setup(control_plane_delay, 'delete')
-                                    SystemManager.kill_process('kill')
-                                    success = True
-                            else:
-                                self.cleanup_files()
-                                SystemManager.control_plane_delay_setup(control_plane_delay, 'delete')
-                                continue
+                                    label, net, throughput, mode, failure_pattern, pattern_bandwidths)
+                            
+                            # Cleanup network
+                            cleaned = True
+                            self.cleanup_experiment(algorithm, net)
+                            self.readiness.log_summary()
+                            ONOSConfig.client().log_latency_summary(self.logger)
+                            self.failure_manager.actuator.log_latency_summary()
+                            
+                            count_line = self.count_file(label, mode)
+                            
+                            if data is None:
+                                raise TrialFailure(RetryPolicy.TRAFFIC, 'no trial data')
+                            if count_line != data['change_counter']:
+                                self.logger.log('Data mismatch, rerunning experiment', event='data_mismatch',
+                                                count_line=count_line, change_counter=data['change_counter'])
+                                raise TrialFailure(RetryPolicy.DATA,
+                                                   f'change count mismatch: {count_line} != {data["change_counter"]}')
+                            
+                            phase = RetryPolicy.DATA
+                            # The trial record goes last, a folder holding it is complete
+                            self.logger.log_timestamp('Collect iperf samples')
+                            self.iperf_parser.collect(
+                                f"{self.trace_folder}{'markov_chain' if mode == 'markov' else 'fixed_version'}/{label}",
+                                self.traffic_manager.flow_start_epochs(traffic_flows),
+                                remove_json=not self.cfg_file.get('KeepIperfJson', True))
+                            
+                            self.logger.log_timestamp('Analysis result')
+                            self.failure_manager.analysis_trace_file(
+                                self.cfg_file['FailureMode'], algorithm,
+                                self.trace_folder, label, data, host_map, mode)
+                            
+                            SystemManager.control_plane_delay_setup(control_plane_delay, 'delete')
+                            SystemManager.kill_process('kill')
+                            self.run_index.done(label, f'{self.trace_folder}{sub_folder}/{label}')
+                            success = True
                                 
                         except Exception as e:
+                            kind = e.kind if isinstance(e, TrialFailure) else phase
                             self.logger.log(f"Experiment run error: {str(e)}")
-                            self.cleanup_files()
+                            delay = self.retry_policy.record(kind, time.monotonic() - attempt_start, str(e))
+                            if net is not None and not cleaned:
+                                # Deactivate the app, and stop the network of the attempt unless it is kept
+                                try:
+                                    self.cleanup_experiment(algorithm, net)
+                                except Exception as cleanup_error:
+                                    self.logger.log(f"Cleanup experiment error: {str(cleanup_error)}")
+                            # The next attempt restores a kept network to its baseline instead of rebuilding it
+                            if delay is None or not self.retry_policy.keep_topology():
+                                self.release_topology()
+                            self.cleanup_files(keep_topology=self.topology is not None)
                             SystemManager.control_plane_delay_setup(control_plane_delay, 'delete')
-                            continue
+                            if delay is None:
+                                self.run_index.quarantine(label, f'{kind}: {str(e)}')
+                                self.logger.log(f'Quarantined {label} after {kind} failure: {str(e)}',
+                                                event='quarantine', kind=kind)
+                                break
+                            self.run_index.fail(label, f'{kind}: {str(e)}')
+                            self.retry_policy.wait(delay)
                     
                     print('Release resources')
-                    self.cleanup_files()
+                    self.cleanup_files(keep_topology=self.topology is not None)
                     SystemManager.kill_process('remove')
                     gc.collect()
-                    time.sleep(5)
+                    if self.topology is None:
+                        self.readiness.wait_for('network released', self.readiness.bridges_removed,
+                                                timeout=10, required=False)
+                
+                # The topology is only shared between the algorithms of one trial
+                self.release_topology()
+            
+            self.failure_manager.actuator.stop()
+            self.control.close()
+            self.logger.log(f'Retry summary (failures, wasted seconds): {self.retry_policy.summary()}')
+            
+            # Sweep workers leave the analysis to the scheduler, which runs it once all trials are done
+            if self.worker_context is None:
+                self.logger.log_timestamp('Analyze results')
+                self.analyze_results()
             
             print('Experiment completed')
-            os.system(f'sudo rm -r {num}')
+            self.run_index.close()
+            # num is always a sub folder of the working directory; never remove the directory itself
+            if os.path.realpath(num) != os.path.realpath('.'):
+                subprocess.run(['sudo', 'rm', '-r', num])
             
         except Exception as e:
             self.logger.log(f"Experiment run error: {str(e)}")
             raise
     
+    def pattern_file_path(self):
+        """PatternFile config value, resolved against the repository root for sweep workers"""
+        pattern_file = self.cfg_file.get('PatternFile')
+        if pattern_file and self.worker_context is not None:
+            pattern_file = os.path.join(self.worker_context.root_dir, pattern_file)
+        return pattern_file
+    
+    def analyze_results(self):
+        """Compute the configured metrics of every finished trial and merge them into OutputFile"""
+        trace_folder = f"{self.trace_root}/{self.cfg_file['FailureMode']}/"
+        sub_folder = 'markov_chain' if self.cfg_file.get('Mode') == 'markov' else 'fixed_version'
+        folders = TrialAnalyzer.trial_folders(trace_folder + sub_folder)
+        results = TrialAnalyzer(self.cfg_file.get('Metric')).analyze_all(
+            folders, trace_folder + self.cfg_file['OutputFile'], self.cfg_file.get('AnalysisWorkers'))
+        print(f'Analyzed {len(folders)} trials into {trace_folder + self.cfg_file["OutputFile"]}')
+        return results
+    
     def generate_failure_patterns(self):
-        failure_patterns = {}
-
-        for i in range(self.cfg_file['Trial'][0], self.cfg_file['Trial'][1] + 1):
-            pattern_key = (i)
-            
-            if self.cfg_file['Mode'] == 'markov':
-                status_count = 4
-                start_state = 0
-                failure_pattern = self.failure_manager.simulate_markov_chain(
-                    self.failure_manager.transition_matrix, start_state, status_count)
-            else:
-                failure_pattern = [0, 1, 2, 1, 0]  # los -> pnlos -> fnlos -> pnlos -> los
-                
-            failure_patterns[pattern_key] = failure_pattern
-            print(f"Generated failure pattern for trial[{pattern_key}]: {failure_pattern}")
+        trials = range(self.cfg_file['Trial'][0], self.cfg_file['Trial'][1] + 1)
+        pattern_file = self.pattern_file_path()
         
-        return failure_patterns
+        if pattern_file and os.path.isfile(pattern_file):
+            self.failure_pattern_set = FailurePatternSet.load(pattern_file)
+            print(f"Replay failure patterns from {pattern_file} (seed {self.failure_pattern_set.seed})")
+        else:
+            self.failure_pattern_set = FailurePatternSet.from_config(self.cfg_file, trials)
+            if pattern_file:
+                self.failure_pattern_set.save(pattern_file)
+            print(f"Generated failure patterns for {len(trials)} trials (seed {self.failure_pattern_set.seed})")
+        
+        return self.failure_pattern_set.as_dict()
     
-    def run_single_link_failure_experiment_with_pattern(self, traffic_model, algorithm, traffic_flows, host_map, addr_to_host, u_v_connection, label, net, throughput, mode, failure_pattern):
+    def run_single_link_failure_experiment_with_pattern(self, traffic_model, algorithm, traffic_flows, host_map, addr_to_host, u_v_connection, label, net, throughput, mode, failure_pattern, pattern_bandwidths=None):
         try:
             link_change_time = self.cfg_file.get('LinkChangeTime', [5])[0]
-            status_start = []
-            status_stop = []
-            change = []
-            link_state_flag = True
-            change_counter = 0
             thread_manager = []
-
-            status_list = failure_pattern
             
-            self.logger.log(f'Using pre-generated failure pattern: {status_list}')
-            self.logger.log(f'link_change_time: {link_change_time}')
+            if self.link_timelines is not None:
+                timeline = self.link_timelines[0]
+                self.logger.log(f'Using timeline {self.cfg_file["TimelineFile"]}: {len(timeline)} events, {timeline.duration}s')
+            else:
+                timeline = LinkTimeline.from_pattern(failure_pattern, pattern_bandwidths, link_change_time)
+                self.logger.log(f'Using pre-generated failure pattern: {failure_pattern}')
+                if pattern_bandwidths is not None:
+                    self.logger.log(f'Using pre-generated pnlos bandwidths: {pattern_bandwidths}')
+                self.logger.log(f'link_change_time: {link_change_time}')
             
             failed_link, affected_traffic_flows = self.failure_manager.single_link_failure_model(
                 addr_to_host, traffic_flows)
             
             # SDFFR special handling
             if algorithm.startswith('SDFFR'):
-                time.sleep(3)
+                self.wait_flows_installed()
                 SystemManager.control_plane_delay_setup(self.cfg_file['ControlPlaneDelay'][0], 'delete')
                 
                 os.system('sudo python3 /home/lce/yukai_thesis/experiment/SD-FFR/pre_install_select_novlan.py')
                 SystemManager.control_plane_delay_setup(self.cfg_file['ControlPlaneDelay'][0], 'add')
             
-            time.sleep(10)
+            self.wait_flows_installed()
             
             start_event = Event()
+            self.traffic_manager.trial_duration = timeline.duration
             thread_manager = self.traffic_manager.setup_traffic_flows(
                 traffic_flows, host_map, self.trace_folder, label, traffic_model, throughput, start_event, mode, affected_traffic_flows)
+            if self.telemetry is not None:
+                # A collapse is reported like a traffic failure, so supervise() ends the trial
+                self.telemetry.start(lambda reason: self.traffic_manager.fail('telemetry', reason))
             
-            # Execute status changes using pre-generated pattern
-            for idx, status in enumerate(status_list):
-                # SDFFR local rerouting handling
-                if algorithm.startswith('SDFFR') and status != 0:
-                    # Need to implement SDFFR local rerouting logic here
-                    pass
-                
-                status_start.append(time.time())
-                
-                if status == 0:
-                    self.logger.log_link_status(status)
-                    if idx == 0 or status != status_list[idx - 1]:
-                        change.append(self.failure_manager.bw_change(
-                            failed_link, u_v_connection, True, 1000, net, link_state_flag, algorithm))
-                        link_state_flag = True
-                        change_counter = change_counter + 1
-                    else:
-                        change.append(time.time())
-                elif status == 1:
-                    new_bw = random.randint(1, 999)
-                    self.logger.log_link_status(status, new_bw)
-                    change.append(self.failure_manager.bw_change(
-                        failed_link, u_v_connection, True, new_bw, net, link_state_flag, algorithm))
-                    link_state_flag = True
-                    change_counter = change_counter + 1
-                elif status == 2:
-                    self.logger.log_link_status(status)
-                    if status != status_list[idx - 1]:
-                        change.append(self.failure_manager.bw_change(
-                            failed_link, u_v_connection, True, 0, net, link_state_flag, algorithm))
-                        link_state_flag = True
-                        change_counter = change_counter + 1
-                    else:
-                        change.append(time.time())
-                
-                time.sleep(link_change_time)
-                status_stop.append(time.time())
+            # Events run against absolute deadlines; supervise() returns early with an error
+            # as soon as a traffic process fails
+            result = self.failure_manager.replay_timeline(
+                timeline, failed_link, u_v_connection, net, algorithm, self.traffic_manager.supervise)
+            self.stop_telemetry(label, mode)
             
             # Record status timestamps
-            for idx, status in enumerate(status_list):
-                self.logger.log_link_status_timestamp(status, status_start[idx])
+            for status, start in zip(result['states'], result['status_start']):
+                self.logger.log_link_status_timestamp(status, start)
             
-            time.sleep(3)
+            self.wait_link_changes_recorded(label, mode, result['change_counter'])
+            # The affected clients run as long as the timeline; their reports are written when they exit
+            self.traffic_manager.wait_reports()
             self.failure_manager.path_record(self.trace_folder, label, 'after link failure', mode)
             
             # Cleanup processes
             self.traffic_manager.cleanup_processes()
             SystemManager.kill_process('record')
             
-            return {
-                "affected_traffic_flows": affected_traffic_flows,
-                "failed_link": failed_link,
-                "change": change,
-                'change_counter': change_counter,
-                "status1_start": status_start[0], "status1_stop": status_stop[0],
-                "status2_start": status_start[1], "status2_stop": status_stop[1],
-                "status3_start": status_start[2], "status3_stop": status_stop[2],
-                "status4_start": status_start[3], "status4_stop": status_stop[3],
-                "status5_start": status_start[4], "status5_stop": status_stop[4]
-            }
+            result.update({"affected_traffic_flows": affected_traffic_flows, "failed_link": failed_link})
+            return result
             
         except Exception as e:
             self.logger.log(f"Single link failure experiment error: {str(e)}")
+            self.stop_telemetry(label, mode)
+            self.traffic_manager.cleanup_processes(abort=True)
             return None
     
     def cleanup_experiment_environment(self):
         try:
             # Cleanup all related files
             self.cleanup_files()
+            try:
+                self.algorithm_manager.uninstall_algorithm()
+            except Exception as e:
+                print(f"Failed to uninstall algorithm: {str(e)}")
             
             # Cleanup processes
             SystemManager.kill_process('kill')
             SystemManager.kill_process('remove')
             
             # Cleanup network
-            os.system('sudo mn -c')
+            SystemManager.cleanup_mininet()
             
             print("Experiment environment cleanup completed")
             
@@ -3,205 +3,448 @@ Failure management module
 Handle link failures and state changes
 """
 
+import json
 import os
 import random
 import re
+import selectors
+import subprocess
+import sys
 import time
 import numpy as np
 
+from .config import SystemManager
+
+
+# Root helper that applies link changes, see link_helper.py
+HELPER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'link_helper.py')
+
+
+class FailurePatternSet:
+    """Link state sequences and pnlos bandwidths of every planned trial, one row per trial"""
+
+    def __init__(self, trials, states, bandwidths, seed):
+        self.trials = np.asarray(trials, dtype=np.int64)
+        self.states = states
+        self.bandwidths = bandwidths
+        self.seed = seed
+        self.rows = {int(trial): row for row, trial in enumerate(self.trials)}
+
+    @classmethod
+    def from_config(cls, cfg_file, trials):
+        """Sample the patterns of all trials at once with a seeded Generator"""
+        seed = cfg_file.get('Seed')
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        rng = np.random.default_rng(seed)
+        trials = list(trials)
+
+        if cfg_file.get('Mode') == 'markov':
+            trans_matrix = np.asarray(cfg_file.get('TransitionMatrix', FailureManager.TRANSITION_MATRIX))
+            states = FailureManager.sample_markov_chains(
+                trans_matrix, 0, cfg_file.get('PatternSteps', 4), len(trials), rng)
+        else:
+            # los -> pnlos -> fnlos -> pnlos -> los
+            states = np.tile(np.array([0, 1, 2, 1, 0], dtype=np.uint8), (len(trials), 1))
+
+        # Bandwidth drawn for every pnlos step up front, 0 elsewhere
+        bandwidths = rng.integers(1, 1000, size=states.shape, dtype=np.uint16)
+        bandwidths[states != 1] = 0
+        return cls(trials, states, bandwidths, seed)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['trials'], data['states'], data['bandwidths'], int(str(data['seed'])))
+
+    def save(self, path):
+        """Write the set as a compressed .npz, replaced atomically"""
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, trials=self.trials, states=self.states,
+                            bandwidths=self.bandwidths, seed=np.array(str(self.seed)))
+        os.replace(tmp_path, path)
+
+    def states_of(self, trial):
+        return self.states[self.rows[trial]].tolist()
+
+    def bandwidths_of(self, trial):
+        return self.bandwidths[self.rows[trial]].tolist()
+
+    def as_dict(self):
+        return {trial: self.states_of(trial) for trial in self.rows}
+
+
+class LinkTimeline:
+    """Link state events of one trial as (time offset, state, bandwidth) columns"""
+
+    # Bandwidth handed to bw_change for los and fnlos
+    STATE_BANDWIDTH = {0: 1000, 2: 0}
+
+    def __init__(self, offsets, states, bandwidths, duration):
+        self.offsets = np.asarray(offsets, dtype=float)
+        self.states = np.asarray(states, dtype=np.uint8)
+        self.bandwidths = np.asarray(bandwidths, dtype=np.uint16)
+        # Time from the first event until the last state ends
+        self.duration = float(duration)
+        if len(self.offsets) and (np.any(np.diff(self.offsets) < 0) or self.duration < self.offsets[-1]):
+            raise ValueError('timeline offsets must be sorted and end before its duration')
+
+    @classmethod
+    def from_pattern(cls, states, bandwidths, step):
+        """Evenly spaced timeline of a failure pattern, one state every step seconds"""
+        states = list(states)
+        if bandwidths is None:
+            bandwidths = [random.randint(1, 999) if state == 1 else 0 for state in states]
+        bandwidths = [cls.STATE_BANDWIDTH.get(state, bw) for state, bw in zip(states, bandwidths)]
+        return cls(np.arange(len(states)) * step, states, bandwidths, len(states) * step)
+
+    @classmethod
+    def load(cls, path, hold=0):
+        """Read {"events": [[offset, state, bandwidth], ...], "duration": seconds} from a JSON file"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {'events': data}
+        events = np.asarray(data['events'], dtype=float).reshape(-1, 3)
+        bandwidths = [cls.STATE_BANDWIDTH.get(int(state), bw) for state, bw in events[:, 1:]]
+        duration = data.get('duration', events[-1, 0] + hold if len(events) else 0)
+        return cls(events[:, 0], events[:, 1], bandwidths, duration)
+
+    @classmethod
+    def load_all(cls, path, hold=0):
+        """Per-link timelines of {"links": [timeline, ...]}, or a single timeline shared by every link"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or 'links' not in data:
+            return [cls.load(path, hold)]
+        timelines = []
+        for link in data['links']:
+            link = {'events': link} if isinstance(link, list) else link
+            events = np.asarray(link['events'], dtype=float).reshape(-1, 3)
+            bandwidths = [cls.STATE_BANDWIDTH.get(int(state), bw) for state, bw in events[:, 1:]]
+            duration = link.get('duration', data.get('duration', events[-1, 0] + hold if len(events) else 0))
+            timelines.append(cls(events[:, 0], events[:, 1], bandwidths, duration))
+        return timelines
+
+    @classmethod
+    def staggered(cls, count, step):
+        """Links fail one after another every step seconds, then recover in reverse order"""
+        return [cls([(index + 1) * step, (2 * count - index) * step], [2, 0], [0, 1000], (2 * count + 1) * step)
+                for index in range(count)]
+
+    def __len__(self):
+        return len(self.states)
+
+
+class LinkActuator:
+    """Run link control commands through one pre-spawned root helper and keep their latencies"""
+
+    # A request still unanswered after this many seconds means a hung command; the helper is replaced
+    TIMEOUT = 10
+    # sudo and the interpreter startup of a new helper
+    START_TIMEOUT = 30
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.helper = None
+        self.selector = None
+        self.buffer = b''
+        # Time each command took inside the helper including its fork/exec, and each request from here, in ns
+        self.exec_ns = []
+        self.round_trip_ns = []
+
+    def start(self):
+        """Spawn the helper and wait until it answers, so the first link change does not pay for it"""
+        if self.helper is not None and self.helper.poll() is None:
+            return
+        argv = SystemManager.ovs_sudo().split() + [sys.executable, '-u', HELPER_SCRIPT]
+        self.helper = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.helper.stdout, selectors.EVENT_READ)
+        self.buffer = b''
+        self.request([], self.START_TIMEOUT)
+
+    def stop(self):
+        if self.helper is not None:
+            self.helper.stdin.close()
+            self.helper.wait()
+            self.close()
+
+    def kill(self):
+        if self.helper is None:
+            return
+        # sudo relays SIGTERM to the helper, a SIGKILL would only end sudo itself
+        self.helper.terminate()
+        try:
+            self.helper.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.helper.kill()
+            self.helper.wait()
+        self.close()
+
+    def close(self):
+        self.selector.close()
+        for pipe in [self.helper.stdin, self.helper.stdout]:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+        self.helper = None
+
+    def request(self, commands, timeout):
+        """Send one request and return the helper's answer line"""
+        try:
+            self.helper.stdin.write((json.dumps(commands) + '\n').encode())
+            self.helper.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            self.kill()
+            raise RuntimeError('link helper exited')
+        deadline = time.monotonic() + timeout
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.selector.select(remaining):
+                # The helper is stuck in a command (ovs-ofctl, tc); the next request gets a new one
+                self.kill()
+                raise RuntimeError(f'link helper did not answer within {timeout}s')
+            chunk = os.read(self.helper.stdout.fileno(), 65536)
+            if not chunk:
+                self.kill()
+                raise RuntimeError('link helper exited')
+            self.buffer = self.buffer + chunk
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line
+
+    def run(self, commands):
+        """Run commands (argv lists or {"argv", "input"} dicts) in order and return the helper's result for each
+
+        A link change is timed by the after_ns of its command; before_ns precedes the fork/exec.
+        """
+        self.start()
+        sent_ns = time.monotonic_ns()
+        line = self.request(commands, self.TIMEOUT)
+        received_ns = time.monotonic_ns()
+
+        results = json.loads(line)
+        self.round_trip_ns.append(received_ns - sent_ns)
+        for result in results:
+            self.exec_ns.append(result['after_mono_ns'] - result['before_mono_ns'])
+            if result['returncode'] != 0:
+                self.logger.log(f"Link command failed ({result['returncode']}): "
+                                f"{' '.join(result['argv'])}: {result['stderr']}")
+        return results
+
+    def reset_latencies(self):
+        self.exec_ns = []
+        self.round_trip_ns = []
+
+    def log_latency_summary(self):
+        for name, samples in [('exec', self.exec_ns), ('request', self.round_trip_ns)]:
+            if not samples:
+                continue
+            latencies = np.asarray(samples, dtype=float) / 1e6
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            self.logger.log(f'Link actuation {name}: {len(latencies)} samples, p50 {p50:.2f}ms, '
+                            f'p95 {p95:.2f}ms, p99 {p99:.2f}ms, max {latencies.max():.2f}ms',
+                            event='actuation_latency', kind=name, p50=p50, p95=p95, p99=p99, max=latencies.max())
+
 
 class FailureManager:
 
+    # Markov chain transition matrix (rows: los, pnlos, fnlos)
+    TRANSITION_MATRIX = [
+        [0.3, 0.5, 0.2],
+        [0.4, 0.2, 0.4],
+        [0.3, 0.5, 0.2]
+    ]
+
     def __init__(self, logger, config_manager):
         self.logger = logger
         self.config_manager = config_manager
+        self.switch_prefix = 's'
+        # TopologyIndex of the current network, set once the topology is built
+        self.topology_index = None
+        # Links touched since the last baseline restore
+        self.changed_links = set()
+        # Seconds the command of the last bw_change took, fork/exec included
+        self.last_exec = 0.0
+        self.actuator = LinkActuator(logger)
+        # ControlChannel the link state notifications go to, set by the experiment runner
+        self.control = None
         
-        # Markov chain transition matrix
-        self.transition_matrix = np.array([
-            [0.3, 0.5, 0.2],
-            [0.4, 0.2, 0.4],
-            [0.3, 0.5, 0.2]
-        ])
+        self.transition_matrix = np.array(self.TRANSITION_MATRIX)
+    
+    @staticmethod
+    def sample_markov_chains(trans_matrix, start_state, num_steps, chain_count, rng):
+        """Sample chain_count state sequences of num_steps transitions, one vectorized step at a time"""
+        trans_matrix = np.asarray(trans_matrix, dtype=float)
+        cumulative = np.cumsum(trans_matrix, axis=1)
+        # Guard against rows summing to slightly less than 1
+        cumulative[:, -1] = 1.0
+        states = np.empty((chain_count, num_steps + 1), dtype=np.min_scalar_type(len(trans_matrix) - 1))
+        states[:, 0] = start_state
+        draws = rng.random((chain_count, num_steps))
+        for step in range(num_steps):
+            states[:, step + 1] = (draws[:, step, None] >= cumulative[states[:, step]]).sum(axis=1)
+        return states
     
     def simulate_markov_chain(self, trans_matrix, start_state, num_steps):
         """Simulate Markov chain"""
-        current_state = start_state
-        sequence = [current_state]
-        
-        for _ in range(num_steps):
-            next_state = np.random.choice([0, 1, 2], p=trans_matrix[current_state])
-            sequence.append(next_state)
-            current_state = next_state
-        
-        return sequence
+        return self.sample_markov_chains(trans_matrix, start_state, num_steps, 1, np.random.default_rng())[0].tolist()
+    
+    def bridge_name(self, switch_name):
+        """Map logical switch name (s<N>) to its OVS bridge name"""
+        return self.switch_prefix + switch_name[1:]
     
     def extract_number_and_decrement(self, s):
         """Extract number and decrement by 1"""
         return str(int(s[1:]) - 1)
     
-    def single_link_failure_model(self, addr_to_host, traffic_flows):
-        """Single link failure model"""
+    def link_flow_index(self, addr_to_host, traffic_flows):
+        """Map every switch link on a main path to the traffic flows crossing it, in either direction
+
+        A link is keyed in the direction it was first seen; links appear in path file order.
+        """
         link_to_traffic_flows = {}
-        traffic_flow_paths = []
-        
-        f = open("./traffic_flow_paths.txt")
-        raw_data_set = f.read().splitlines()
+        with open('./traffic_flow_paths.txt') as f:
+            raw_data_set = f.read().splitlines()
         
         for raw_data in raw_data_set:
             raw_data = raw_data.split('|')
             traffic_flow = raw_data[0].split(',')
-            path = list(map(lambda x: 's' + str(x + 1), eval(raw_data[1])))
-            path.insert(0, traffic_flow[0].lower())
-            path.append(traffic_flow[1].lower())
-            traffic_flow_paths.append(path)
-        
-        for path in traffic_flow_paths:
-            path = list(map(lambda x: "s" + str(int(x.replace('of:', ""), 16))
-                           if "of:" in x else x, list(map(str, path))))
-            src = path.pop(0)
-            dst = path.pop()
-            
-            for i in range(len(path)):
-                j = i + 1
-                if j < len(path):
-                    uselink = (path[i], path[j])
-                    if uselink not in link_to_traffic_flows.keys():
-                        link_to_traffic_flows.setdefault(uselink, [])
-                    if (uselink[1], uselink[0]) not in link_to_traffic_flows.keys():
-                        link_to_traffic_flows.setdefault((uselink[1], uselink[0]), [])
-                    if (addr_to_host[src], addr_to_host[dst]) in traffic_flows:
-                        link_to_traffic_flows[uselink].append((addr_to_host[src], addr_to_host[dst]))
-        
-        max_flow = 0
-        for link in link_to_traffic_flows.keys():
-            if len(link_to_traffic_flows[link]) + len(link_to_traffic_flows[(link[1], link[0])]) > max_flow:
-                failed_link = link
-                max_flow = len(link_to_traffic_flows[link]) + len(link_to_traffic_flows[(link[1], link[0])])
-        
+            path = ['s' + str(x + 1) for x in eval(raw_data[1])]
+            flow = (addr_to_host[traffic_flow[0].lower()], addr_to_host[traffic_flow[1].lower()])
+            for u, v in zip(path, path[1:]):
+                link = (v, u) if (v, u) in link_to_traffic_flows else (u, v)
+                flows = link_to_traffic_flows.setdefault(link, [])
+                if flow in traffic_flows and flow not in flows:
+                    flows.append(flow)
+        return link_to_traffic_flows
+    
+    def single_link_failure_model(self, addr_to_host, traffic_flows):
+        """Single link failure model: the link carrying the most flows"""
+        link_to_traffic_flows = self.link_flow_index(addr_to_host, traffic_flows)
+        failed_link = max(link_to_traffic_flows, key=lambda link: len(link_to_traffic_flows[link]))
         self.logger.log_timestamp('Failed link generation Completed')
         
-        affected_traffic_flows = []
-        for affected_traffic_flow in link_to_traffic_flows[failed_link]:
-            if affected_traffic_flow not in affected_traffic_flows:
-                affected_traffic_flows.append(affected_traffic_flow)
-        
-        for affected_traffic_flow in link_to_traffic_flows[(failed_link[1], failed_link[0])]:
-            if affected_traffic_flow not in affected_traffic_flows:
-                affected_traffic_flows.append(affected_traffic_flow)
-        
+        affected_traffic_flows = list(link_to_traffic_flows[failed_link])
         self.logger.log_failed_link(failed_link)
         self.logger.log_affected_flows(affected_traffic_flows)
         
         return failed_link, affected_traffic_flows
     
-    def multiple_link_failure_model(self, addr_to_host, traffic_flows):
-        """Multiple link failure model"""
-        link_to_traffic_flows = {}
-        failed_links = []
-        affected_flows = []
-        affected_traffic_flows = []
+    def multiple_link_failure_model(self, addr_to_host, traffic_flows, count=2, group='srlg'):
+        """Pick count links by load; srlg grows a connected group of links around the busiest one"""
+        link_to_traffic_flows = self.link_flow_index(addr_to_host, traffic_flows)
+        if count > len(link_to_traffic_flows):
+            raise ValueError(f'{count} failed links requested, only {len(link_to_traffic_flows)} links carry traffic')
         
-        with open('./traffic_flow_backup_paths.txt', 'r') as fp:
-            lines = fp.readlines()
-            for line in lines:
-                addr, paths_s = line.split('|')
-                dict_now_mac = {int(k): [int(s) for s in v.split(', ')] for k, v in re.findall(r'(\d+)=\[([0-9, ]*)\]', paths_s[1:-1])}
-                
-                if len(dict_now_mac) == 2:
-                    with open('./traffic_flow_paths.txt', 'r') as fp_2:
-                        lines_2 = fp_2.readlines()
-                        for line_2 in lines_2:
-                            if addr in line_2:
-                                addr_2, paths_s_2 = line_2.split('|')
-                                paths_s_2 = paths_s_2[1:-1].rstrip(']')
-                                main_path = paths_s_2.split(',')
-                                main_path = [element.strip() for element in main_path]
-                                failed_links.append(('s' + str(int(main_path[0]) + 1), 's' + str(int(main_path[1]) + 1)))
-                                affected_flows.append(('h' + str(int(main_path[0]) + 1) + '_0', 'h' + str(int(main_path[len(main_path) - 1]) + 1) + '_0'))
-                                affected_flows.append(('h' + str(int(main_path[len(main_path) - 1]) + 1) + '_0', 'h' + str(int(main_path[0]) + 1) + '_0'))
-                                break
-                    
-                    for k in dict_now_mac:
-                        failed_links.append(('s' + str(dict_now_mac[k][0] + 1), 's' + str(dict_now_mac[k][1] + 1)))
-                        break
-                    break
+        def load(link):
+            return len(link_to_traffic_flows[link])
         
-        for flow in affected_flows:
-            if flow in traffic_flows:
-                affected_traffic_flows.append(flow)
+        if group == 'srlg':
+            # Shared risk: every further link touches a switch of the group already chosen
+            failed_links = [max(link_to_traffic_flows, key=load)]
+            switches = set(failed_links[0])
+            while len(failed_links) < count:
+                candidates = [link for link in link_to_traffic_flows
+                              if link not in failed_links and (link[0] in switches or link[1] in switches)]
+                if not candidates:
+                    candidates = [link for link in link_to_traffic_flows if link not in failed_links]
+                failed_links.append(max(candidates, key=load))
+                switches.update(failed_links[-1])
+        else:
+            failed_links = sorted(link_to_traffic_flows, key=load, reverse=True)[:count]
+        
+        affected_traffic_flows = []
+        for link in failed_links:
+            for flow in link_to_traffic_flows[link]:
+                if flow not in affected_traffic_flows:
+                    affected_traffic_flows.append(flow)
         
         self.logger.log_timestamp(f"Failed links: {failed_links}")
         self.logger.log_timestamp(f"Affected traffic flow set: {affected_traffic_flows}")
         
         return failed_links, affected_traffic_flows
     
+    def link_batch(self, links, state):
+        """One `ip -batch` command setting both ends of every link down or up, like mod-port does per port"""
+        lines = [f'link set dev {self.topology_index.intf(switch_name, neighbor)} {state}'
+                 for link in links for switch_name, neighbor in [link, (link[1], link[0])]]
+        return {'argv': ['ip', '-force', '-batch', '-'], 'input': '\n'.join(lines) + '\n'}
+    
+    def rate_lines(self, link, target_bw, smooth_change=True):
+        """tc -batch lines setting the htb rate of both ends of a switch link, as TCIntf.config(bw) would"""
+        verb = 'change' if smooth_change else 'replace'
+        lines = []
+        for switch_name, neighbor in [link, (link[1], link[0])]:
+            intf = self.topology_index.intf(switch_name, neighbor)
+            intf.params['bw'] = target_bw
+            lines.append(f'class {verb} dev {intf} parent 5:0 classid 5:1 htb rate {target_bw:f}Mbit burst 15k')
+        return lines
+    
+    @staticmethod
+    def tc_batch(lines):
+        return {'argv': ['tc', '-force', '-batch', '-'], 'input': '\n'.join(lines) + '\n'}
+    
+    def write_failed_link_bw(self, changes):
+        """Tell the controller side which links change next and to which bandwidth
+
+        changes holds (link, link_state, target_bw) of every link changing together; the file gets
+        one state, bandwidth, switch, switch block of four lines per link, in that order.
+        """
+        content = ''.join(f'{link_state}\n{target_bw}\n{self.extract_number_and_decrement(link[0])}\n'
+                          f'{self.extract_number_and_decrement(link[1])}\n' for link, link_state, target_bw in changes)
+        # Apps watching the file wake up on every write; an unchanged notification is left alone
+        try:
+            with open('./failed_link_bw.txt', 'r') as f:
+                unchanged = f.read() == content
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            with open('./failed_link_bw.txt', 'w') as f:
+                f.write(content)
+        if self.control is not None:
+            self.control.publish('link_state', links=[{'link': list(link), 'state': link_state, 'bw': target_bw}
+                                                      for link, link_state, target_bw in changes])
+    
     def link_state_change(self, link, u_v_connection, state, link_state='', target_bw=0):
         """Change link state"""
-        switch_name = link[0]
-        port = u_v_connection[link[0]][link[1]]
-        
-        cmd = "sudo ovs-ofctl mod-port " + switch_name + " " + port + " " + state
-        now_time = time.time()
+        self.changed_links.add(link)
+        if link_state:
+            self.write_failed_link_bw([(link, link_state, 0 if link_state == 'fnlos' else target_bw)])
         
-        if link_state == 'pnlos':
-            with open('./failed_link_bw.txt', 'w') as f:
-                f.write('pnlos\n')
-                f.write(f'{target_bw}\n')
-                f.write(f'{self.extract_number_and_decrement(link[0])}\n')
-                f.write(f'{self.extract_number_and_decrement(link[1])}\n')
-                f.close()
-        elif link_state == 'los':
-            with open('./failed_link_bw.txt', 'w') as f:
-                f.write('los\n')
-                f.write(f'{target_bw}\n')
-                f.write(f'{self.extract_number_and_decrement(link[0])}\n')
-                f.write(f'{self.extract_number_and_decrement(link[1])}\n')
-                f.close()
-        elif link_state == 'fnlos':
-            with open('./failed_link_bw.txt', 'w') as f:
-                f.write('fnlos\n')
-                f.write('0\n')
-                f.write(f'{self.extract_number_and_decrement(link[0])}\n')
-                f.write(f'{self.extract_number_and_decrement(link[1])}\n')
-                f.close()
-        
-        os.system(cmd)
-        return now_time
+        result = self.actuator.run([self.link_batch([link], state)])[0]
+        # The port change has been handed to the kernel once ip returns
+        return result['after_ns'] / 1e9
+    
+    def transition_commands(self, link, u_v_connection, target_bw, link_state_flag, smooth_change=True):
+        """Helper commands moving a link to target_bw (0 is fnlos, 1000 is los) and the new link state"""
+        self.changed_links.add(link)
+        if target_bw == 0:
+            return [self.link_batch([link], 'down')], 'fnlos'
+        commands = []
+        if link_state_flag:
+            commands.append(self.link_batch([link], 'down'))
+        commands.append(self.tc_batch(self.rate_lines(link, target_bw, smooth_change)))
+        commands.append(self.link_batch([link], 'up'))
+        return commands, 'los' if target_bw == 1000 else 'pnlos'
     
     def bw_change(self, link, u_v_connection, smooth_change, target_bw, net, link_state_flag, algorithm=''):
         """Change bandwidth"""
-        if target_bw != 0 and target_bw != 1000:
-            if link_state_flag:
-                self.link_state_change(link, u_v_connection, "down")
-            now_time = self.link_state_change(link, u_v_connection, "up", 'pnlos', target_bw)
-        elif target_bw == 1000:
-            if link_state_flag:
-                self.link_state_change(link, u_v_connection, "down")
-            now_time = self.link_state_change(link, u_v_connection, "up", 'los', target_bw)
-        elif target_bw == 0:
-            now_time = self.link_state_change(link, u_v_connection, "down", 'fnlos', 0)
+        # Port state and both tc rates go to the helper as one request
+        commands, link_state = self.transition_commands(link, u_v_connection, target_bw, link_state_flag, smooth_change)
+        self.write_failed_link_bw([(link, link_state, target_bw)])
         
-        if target_bw != 0:
-            switch_name = link[0]
-            switch_name2 = link[1]
-            port = u_v_connection[link[0]][link[1]]
-            port2 = u_v_connection[link[1]][link[0]]
-            switch = net.get(switch_name)
-            switch2 = net.get(switch_name2)
-            
-            for sw_port, intf in switch.intfs.items():
-                if str(sw_port) == port:
-                    intf.config(bw=target_bw, smooth_change=smooth_change)
-                    break
-            for sw_port, intf in switch2.intfs.items():
-                if str(sw_port) == port2:
-                    intf.config(bw=target_bw, smooth_change=smooth_change)
-                    break
+        # The change happens with the last port command: up for los/pnlos, down for fnlos
+        result = self.actuator.run(commands)[-1]
+        now_time = result['after_ns'] / 1e9
+        # Fork/exec and run time of that command, kept apart from the change time
+        self.last_exec = (result['after_ns'] - result['before_ns']) / 1e9
         
         # SDFFR special handling
         if algorithm.startswith('SDFFR'):
-            switch_name = link[0]
-            switch_name2 = link[1]
+            switch_name = self.bridge_name(link[0])
+            switch_name2 = self.bridge_name(link[1])
             port = u_v_connection[link[0]][link[1]]
             port2 = u_v_connection[link[1]][link[0]]
             self.logger.log(f'switch1 = {switch_name}, port1 = {port}, switch2 = {switch_name2}, port2 = {port2}, target_bw = {target_bw}')
@@ -224,6 +467,165 @@ class FailureManager:
         
         return now_time
     
+    def replay_timeline(self, timeline, link, u_v_connection, net, algorithm, wait):
+        """Apply every timeline event at its offset from the first one, against absolute deadlines
+
+        wait(seconds) is called between events so the caller can keep supervising the trial;
+        a late event does not push back the ones after it.
+        """
+        count = len(timeline)
+        status_start = np.zeros(count)
+        status_stop = np.zeros(count)
+        change = np.zeros(count)
+        exec_time = np.zeros(count)
+        lateness = np.zeros(count)
+        change_counter = 0
+        states = timeline.states.tolist()
+        bandwidths = timeline.bandwidths.tolist()
+
+        # Usually started with the trial already; never let the first change pay for the helper startup
+        self.actuator.start()
+        origin = time.monotonic()
+        origin_epoch = time.time()
+        for idx, status in enumerate(states):
+            status_start[idx] = time.time()
+            self.logger.log_link_status(status, bandwidths[idx] if status == 1 else None)
+
+            # A repeated los/fnlos keeps the link as it is, a repeated pnlos draws a new rate
+            if idx == 0 or status == 1 or status != states[idx - 1]:
+                change[idx] = self.bw_change(link, u_v_connection, True, bandwidths[idx], net, True, algorithm)
+                exec_time[idx] = self.last_exec
+                change_counter = change_counter + 1
+            else:
+                change[idx] = time.time()
+            # Measured at the port change itself, so the helper round trip counts as well
+            lateness[idx] = change[idx] - origin_epoch - timeline.offsets[idx]
+
+            next_offset = timeline.offsets[idx + 1] if idx + 1 < count else timeline.duration
+            wait(max(0.0, origin + next_offset - time.monotonic()))
+            status_stop[idx] = time.time()
+
+        if count:
+            self.logger.log(f'Timeline: {count} events, {change_counter} changes, '
+                            f'max lateness {lateness.max() * 1000:.2f}ms',
+                            event='timeline', events=count, changes=change_counter, max_lateness=lateness.max())
+        return {
+            "states": states,
+            "bandwidths": bandwidths,
+            "offsets": timeline.offsets.tolist(),
+            "status_start": status_start.tolist(),
+            "status_stop": status_stop.tolist(),
+            "change": change.tolist(),
+            "exec": exec_time.tolist(),
+            "lateness": lateness.tolist(),
+            "change_counter": change_counter
+        }
+    
+    def replay_link_timelines(self, timelines, links, u_v_connection, wait):
+        """Replay one timeline per link; events of all links due at the same offset go out as one request
+
+        Phases are the intervals between distinct event offsets. The state of a phase is the
+        worst link state in it, so TrialAnalyzer can treat the trial like a single link trial.
+        """
+        link_ids = np.concatenate([np.full(len(timeline), index) for index, timeline in enumerate(timelines)])
+        offsets = np.concatenate([timeline.offsets for timeline in timelines])
+        states = np.concatenate([timeline.states for timeline in timelines])
+        bandwidths = np.concatenate([timeline.bandwidths for timeline in timelines])
+        order = np.lexsort((link_ids, offsets))
+        link_ids, offsets, states, bandwidths = link_ids[order], offsets[order], states[order], bandwidths[order]
+        duration = max(timeline.duration for timeline in timelines)
+        
+        # Everything starts in los; a first phase covers the time before the first event
+        phase_offsets, group_starts = np.unique(offsets, return_index=True)
+        if not len(phase_offsets) or phase_offsets[0] > 0:
+            phase_offsets = np.concatenate([[0.0], phase_offsets])
+            group_starts = np.concatenate([[len(offsets)], group_starts])
+        group_stops = np.append(group_starts[1:], len(offsets))
+        
+        link_state = np.zeros(len(links), dtype=np.uint8)
+        phase_states = np.zeros((len(phase_offsets), len(links)), dtype=np.uint8)
+        status_start = np.zeros(len(phase_offsets))
+        status_stop = np.zeros(len(phase_offsets))
+        phase_change = np.zeros(len(phase_offsets))
+        event_change = np.full(len(offsets), np.nan)
+        event_exec = np.zeros(len(offsets))
+        lateness = np.zeros(len(phase_offsets))
+        change_counter = 0
+        
+        # Usually started with the trial already; never let the first change pay for the helper startup
+        self.actuator.start()
+        origin = time.monotonic()
+        origin_epoch = time.time()
+        for phase, phase_offset in enumerate(phase_offsets):
+            status_start[phase] = time.time()
+            phase_change[phase] = status_start[phase]
+            
+            commands = []
+            request = []
+            changes = []
+            for event in range(group_starts[phase], group_stops[phase]):
+                link_id, state = link_ids[event], states[event]
+                # A repeated los/fnlos keeps the link as it is, a repeated pnlos draws a new rate
+                if state == link_state[link_id] and state != 1:
+                    event_change[event] = status_start[phase]
+                    continue
+                link_commands, name = self.transition_commands(
+                    links[link_id], u_v_connection, int(bandwidths[event]), link_state[link_id] != 2)
+                changes.append((links[link_id], name, int(bandwidths[event])))
+                self.logger.log(f'{name}_start {links[link_id]}', event='link_status', link=links[link_id],
+                                status=int(state), bw=int(bandwidths[event]))
+                commands.extend(link_commands)
+                # The change of a link happens with its last command
+                request.append((event, len(commands) - 1))
+                link_state[link_id] = state
+            
+            if commands:
+                # All links of the phase in one notification, written before any of them changes
+                self.write_failed_link_bw(changes)
+                results = self.actuator.run(commands)
+                for event, last_command in request:
+                    event_change[event] = results[last_command]['after_ns'] / 1e9
+                    event_exec[event] = (results[last_command]['after_ns'] - results[last_command]['before_ns']) / 1e9
+                phase_change[phase] = min(event_change[event] for event, _ in request)
+                change_counter = change_counter + len(request)
+            # Up to the last link change of the phase, so the helper round trip counts as well
+            lateness[phase] = max([phase_change[phase]] + [event_change[event] for event, _ in request]) \
+                - origin_epoch - phase_offset
+            phase_states[phase] = link_state
+            
+            next_offset = phase_offsets[phase + 1] if phase + 1 < len(phase_offsets) else duration
+            wait(max(0.0, origin + next_offset - time.monotonic()))
+            status_stop[phase] = time.time()
+        
+        self.logger.log(f'Timelines: {len(links)} links, {len(offsets)} events, {change_counter} changes, '
+                        f'max lateness {lateness.max() * 1000:.2f}ms',
+                        event='timeline', links=len(links), events=len(offsets), changes=change_counter,
+                        max_lateness=lateness.max())
+        return {
+            "states": phase_states.max(axis=1).tolist(),
+            "link_states": phase_states.tolist(),
+            "offsets": phase_offsets.tolist(),
+            "status_start": status_start.tolist(),
+            "status_stop": status_stop.tolist(),
+            "change": phase_change.tolist(),
+            "lateness": lateness.tolist(),
+            "events": {"link": link_ids.tolist(), "offset": offsets.tolist(), "state": states.tolist(),
+                       "bandwidth": bandwidths.tolist(), "change": event_change.tolist(), "exec": event_exec.tolist()},
+            "change_counter": change_counter
+        }
+    
+    def restore_links(self, net, u_v_connection, link_bandwidth):
+        """Bring every changed link back up at its configured bandwidth"""
+        if not self.changed_links:
+            return
+        lines = []
+        for link in self.changed_links:
+            lines.extend(self.rate_lines(link, link_bandwidth))
+        self.actuator.run([self.tc_batch(lines), self.link_batch(self.changed_links, 'up')])
+        for link in self.changed_links:
+            self.logger.log(f'Restored link {link} to {link_bandwidth}')
+        self.changed_links = set()
+    
     def path_record(self, trace_folder, label, state, mode='markov'):
         """Record paths"""
         if state == 'after link failure':
@@ -243,23 +645,33 @@ class FailureManager:
                         os.system('sudo cp ./traffic_flow_backup_paths.txt ' + trace_folder + 'fixed_version/' + label + '/backup_path.txt')
                         os.system('sudo chown -R ' + self.config_manager.username + ' ' + trace_folder + 'fixed_version/' + label + '/backup_path.txt')
     
-    def analysis_trace_file(self, failure_mode, algorithm, trace_folder, label, data, host_map):
+    def analysis_trace_file(self, failure_mode, algorithm, trace_folder, label, data, host_map, mode=None):
         """Analyze trace file"""
-        if failure_mode == 'single':
+        if mode is not None:
+            sub_trace_folder = trace_folder + ('markov_chain/' if mode == 'markov' else 'fixed_version/') + label + '/'
+        elif failure_mode == 'single':
             sub_trace_folder = trace_folder + 'markov_chain/' + label + '/'
         else:
             sub_trace_folder = trace_folder + 'fixed_version/' + label + '/'
         
+        if 'states' in data:
+            # Everything TrialAnalyzer needs besides the interval samples
+            record = {key: data[key] for key in ['states', 'status_start', 'status_stop', 'change']
+                      + [key for key in ['bandwidths', 'offsets', 'exec', 'lateness', 'link_states', 'events'] if key in data]}
+            record['label'] = label
+            record['failed_link'] = list(data.get('failed_link', data.get('failed_links', [])))
+            record['affected_traffic_flows'] = [list(flow) for flow in data['affected_traffic_flows']]
+            # Written to a temporary file and renamed, a trial record on disk is always complete
+            with open(sub_trace_folder + 'trial_record.json.tmp', 'w') as f:
+                json.dump(record, f)
+            os.replace(sub_trace_folder + 'trial_record.json.tmp', sub_trace_folder + 'trial_record.json')
+        
         if failure_mode == 'single':
             file_path = sub_trace_folder + 'timestamp_record.txt'
-            order = ['status1_start', 'status1_stop', 'status2_start', 'status2_stop',
-                     'status3_start','status3_stop','status4_start', 'status4_stop',
-                     'status5_start','status5_stop']
             with open(file_path, 'w') as f:
-                for key in order:
-                    if key in data:
-                        value = data[key]
-                        f.write(str(value)+'\n')
+                for start, stop in zip(data['status_start'], data['status_stop']):
+                    f.write(str(start)+'\n')
+                    f.write(str(stop)+'\n')
 
             file_path = sub_trace_folder + 'Affected_traffic_flows_rocord.txt'
             order = ['affected_traffic_flows']
@@ -290,14 +702,10 @@ class FailureManager:
                         f.write(str(value[0])+' '+str(value[1])+' '+host_map[value[0]].MAC().upper()+','+host_map[value[1]].MAC().upper()+'\n')
         elif failure_mode == 'multiple':
             file_path = sub_trace_folder + 'timestamp_record.txt'
-            order = ['los1_start', 'los1_stop', 'fnlos1_start', 'fnlos1_stop',
-                     'fnlos2_start','fnlos2_stop','los2_start', 'los2_stop',
-                     'los3_start','los3_stop']
             with open(file_path, 'w') as f:
-                for key in order:
-                    if key in data:
-                        value = data[key]
-                        f.write(str(value)+'\n')
+                for start, stop in zip(data['status_start'], data['status_stop']):
+                    f.write(str(start)+'\n')
+                    f.write(str(stop)+'\n')
 
             file_path = sub_trace_folder + 'Affected_traffic_flows_rocord.txt'
             order = ['affected_traffic_flows']
@@ -308,12 +716,9 @@ class FailureManager:
                         f.write(str(value)+'\n')
 
             file_path = sub_trace_folder + 'link_change_time.txt'
-            order = ['change_1', 'change_2','change_3','change_4']
             with open(file_path, 'w') as f:
-                for key in order:
-                    if key in data:
-                        value = data[key]
-                        f.write(str(value)+'\n')
+                for link_change_time in data['events']['change']:
+                    f.write(str(link_change_time)+'\n')
             
             file_path = sub_trace_folder + 'failed_link_rocord.txt'
             order = ['failed_links']
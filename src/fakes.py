@@ -0,0 +1,536 @@
+"""
+Stand-ins module
+Local fakes of Mininet, OVS and ONOS so the harness can run on a plain Linux box
+
+FakeOVS puts stub executables for the OVS, tc, ip and iperf3 commands first on PATH and
+logs every call; FakeMininet builds an in-memory network whose hosts run their commands in
+the root namespace; FakeONOS answers the REST paths ONOSClient uses from in-memory state,
+either in-process through FakeONOSSession or over HTTP through FakeONOSServer, and
+FakeRoutingApp plays the part of the ONOS app of a trial.
+"""
+
+import base64
+import json
+import os
+import pickle
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from .config import SystemManager
+from .onos_client import ONOSClient
+
+
+class FakeOVS:
+    """Stub executables first on PATH; every call is appended to a shared command log"""
+
+    STATE_VARIABLE = 'FAKE_OVS_STATE'
+    # Commands that only have to succeed
+    COMMANDS = ['ovs-vsctl', 'ovs-ofctl', 'ovsdb-tool', 'ovsdb-server', 'ovs-vswitchd', 'tc', 'ip', 'mn',
+                'pkill', 'killall', 'rmmod', 'modprobe', 'iptables', 'ping', 'python3', 'chown']
+    LOG = 'echo "$(basename "$0") $*" >> "$FAKE_OVS_STATE/commands"\n'
+    STUBS = {
+        'sudo': 'exec "$@"\n',
+        # Nothing of OVS is running once it has been stopped
+        'pgrep': LOG + 'exit 1\n',
+        # A server registers its listening port under its own pid, a client runs for its -t time
+        'iperf3': LOG + (
+            'port=5201; server=0; duration=10\n'
+            'while [ $# -gt 0 ]; do\n'
+            '    case "$1" in -s) server=1 ;; -p) shift; port=$1 ;; -t) shift; duration=$1 ;; esac\n'
+            '    shift\n'
+            'done\n'
+            'if [ $server = 1 ]; then\n'
+            '    echo "tcp LISTEN 0 5 *:$port *:* users:((\\"iperf3\\",pid=$$,fd=3))" >> "$FAKE_OVS_STATE/listeners"\n'
+            '    exec sleep 86400\n'
+            'fi\n'
+            'exec sleep "$duration"\n'),
+        'ss': LOG + 'cat "$FAKE_OVS_STATE/listeners" 2> /dev/null\n',
+    }
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.bin_dir = os.path.join(directory, 'bin')
+        self.state_dir = os.path.join(directory, 'state')
+        self.command_file = os.path.join(self.state_dir, 'commands')
+        self.saved = None
+
+    def install(self):
+        os.makedirs(self.bin_dir, exist_ok=True)
+        os.makedirs(self.state_dir, exist_ok=True)
+        stubs = dict({command: self.LOG for command in self.COMMANDS}, **self.STUBS)
+        for command, body in stubs.items():
+            path = os.path.join(self.bin_dir, command)
+            with open(path, 'w') as f:
+                f.write('#!/bin/sh\n' + body)
+            os.chmod(path, 0o755)
+        # ovs_ready() looks for the db socket and the vswitchd pid file
+        for name in ['db.sock', 'ovs-vswitchd.pid']:
+            open(os.path.join(self.state_dir, name), 'w').close()
+        open(self.command_file, 'w').close()
+
+        self.saved = (os.environ.get('PATH', ''), os.environ.get(self.STATE_VARIABLE),
+                      SystemManager.ovs_rundir, SystemManager.ovs_dbdir)
+        os.environ['PATH'] = self.bin_dir + os.pathsep + self.saved[0]
+        os.environ[self.STATE_VARIABLE] = self.state_dir
+        SystemManager.ovs_rundir = self.state_dir
+        SystemManager.ovs_dbdir = self.state_dir
+
+    def uninstall(self):
+        if self.saved is None:
+            return
+        path, state, SystemManager.ovs_rundir, SystemManager.ovs_dbdir = self.saved
+        os.environ['PATH'] = path
+        if state is None:
+            os.environ.pop(self.STATE_VARIABLE, None)
+        else:
+            os.environ[self.STATE_VARIABLE] = state
+        self.saved = None
+
+    def commands(self):
+        with open(self.command_file) as f:
+            return f.read().splitlines()
+
+    def command_count(self):
+        with open(self.command_file, 'rb') as f:
+            return f.read().count(b'\n')
+
+
+class FakeIntf:
+
+    def __init__(self, node, port):
+        self.node = node
+        self.name = f'{node.name}-eth{port}'
+        self.params = {}
+
+    def __str__(self):
+        return self.name
+
+
+class FakeNode:
+    """Host or switch; commands run in the root namespace, where the stub executables are"""
+
+    def __init__(self, net, name, in_namespace, ip=None, mac=None, dpid=None):
+        self.net = net
+        self.name = name
+        self.inNamespace = in_namespace
+        self.ip = ip.split('/')[0] if ip else None
+        self.mac = mac
+        self.dpid = dpid
+        self.ports = {}
+        self.batch = False
+
+    def IP(self):
+        return self.ip
+
+    def MAC(self):
+        return self.mac
+
+    def cmd(self, command):
+        return subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              text=True).stdout
+
+    def popen(self, argv, **kwargs):
+        return subprocess.Popen(argv, **kwargs)
+
+    def start(self, controllers):
+        pass
+
+
+class FakeSwitch(FakeNode):
+
+    @classmethod
+    def batchStartup(cls, switches):
+        """One ovs-vsctl call for every bridge, after which the switches reach the controller"""
+        if switches:
+            subprocess.run(['ovs-vsctl', 'add-br'] + [switch.name for switch in switches])
+            switches[0].net.connect()
+        return switches
+
+
+class FakeLink:
+
+    def __init__(self, node1, node2):
+        self.intf1 = FakeIntf(node1, len(node1.ports) + 1)
+        node1.ports[self.intf1] = len(node1.ports) + 1
+        self.intf2 = FakeIntf(node2, len(node2.ports) + 1)
+        node2.ports[self.intf2] = len(node2.ports) + 1
+
+
+class FakeController:
+
+    def __init__(self, name):
+        self.name = name
+
+    def start(self):
+        pass
+
+
+class FakeMininet:
+    """The subset of the Mininet API that TopologyManager.build_topo uses"""
+
+    def __init__(self, controller=None, switch=None, link=None, onos=None):
+        self.onos = onos
+        self.hosts = []
+        self.switches = []
+        self.links = []
+
+    def addController(self, name, ip=None, port=None):
+        return FakeController(name)
+
+    def addSwitch(self, name, dpid=None):
+        switch = FakeSwitch(self, name, False, dpid=dpid)
+        self.switches.append(switch)
+        return switch
+
+    def addHost(self, name, ip=None):
+        index = len(self.hosts) + 1
+        host = FakeNode(self, name, True, ip=ip, mac=f'00:00:00:00:{index >> 8:02x}:{index & 255:02x}')
+        self.hosts.append(host)
+        return host
+
+    def addLink(self, node1, node2):
+        link = FakeLink(node1, node2)
+        self.links.append(link)
+        return link
+
+    def build(self):
+        pass
+
+    def connect(self):
+        if self.onos is not None:
+            self.onos.connect(self)
+
+    def stop(self):
+        pass
+
+
+class FakeONOS:
+    """In-memory controller state behind the REST paths ONOSClient uses"""
+
+    OPENFLOW_APP = 'org.onosproject.openflow'
+
+    def __init__(self, app_name='org.foo.app', convergence=0.0):
+        self.app_name = app_name
+        # Seconds between the switches connecting and ONOS reporting their links
+        self.convergence = convergence
+        self.lock = threading.Lock()
+        self.apps = {self.OPENFLOW_APP: 'ACTIVE'}
+        self.on_activate = {}
+        self.devices = {}
+        self.hosts = {}
+        self.links = []
+        self.flows = {}
+        self.connected_at = None
+        self.next_flow_id = 1
+
+    def client(self, base_url='http://localhost:8181/onos/v1'):
+        """ONOSClient answering from this fake in process, without HTTP"""
+        client = ONOSClient(base_url)
+        client.session = FakeONOSSession(self)
+        return client
+
+    @staticmethod
+    def device_id(switch):
+        return f'of:{switch.dpid}'
+
+    def connect(self, net):
+        """Learn the devices, links and hosts of a started network"""
+        with self.lock:
+            for switch in net.switches:
+                self.devices[self.device_id(switch)] = {'id': self.device_id(switch), 'available': True}
+            for link in net.links:
+                ends = [(link.intf1.node, link.intf1), (link.intf2.node, link.intf2)]
+                switches = [(node, intf) for node, intf in ends if isinstance(node, FakeSwitch)]
+                if len(switches) == 2:
+                    for (src, src_intf), (dst, dst_intf) in [switches, switches[::-1]]:
+                        self.links.append({'src': {'device': self.device_id(src), 'port': str(src.ports[src_intf])},
+                                           'dst': {'device': self.device_id(dst), 'port': str(dst.ports[dst_intf])}})
+                elif len(switches) == 1:
+                    switch, intf = switches[0]
+                    host = link.intf2.node if switch is link.intf1.node else link.intf1.node
+                    self.hosts[host.MAC()] = {'id': f'{host.MAC()}/None', 'mac': host.MAC(), 'vlan': 'None',
+                                              'locations': [{'elementId': self.device_id(switch),
+                                                             'port': str(switch.ports[intf])}]}
+            self.connected_at = time.monotonic()
+
+    def add_flows(self, device_ids):
+        with self.lock:
+            for device_id in device_ids:
+                flow_id = str(self.next_flow_id)
+                self.next_flow_id = self.next_flow_id + 1
+                self.flows[flow_id] = {'id': flow_id, 'deviceId': device_id, 'state': 'ADDED'}
+
+    def visible_links(self):
+        if self.connected_at is None or time.monotonic() - self.connected_at < self.convergence:
+            return []
+        return list(self.links)
+
+    def handle(self, method, path, body=None):
+        """Return (status code, JSON payload) of one REST request"""
+        with self.lock:
+            activate = None
+            result = self.route(method, path, body)
+            if method == 'POST' and path == f'/applications/{self.app_name}/active':
+                activate = self.on_activate.get(self.app_name)
+        # The app starts its work after ONOS has answered, as a real app would
+        if activate is not None and result[0] == 200:
+            activate()
+        return result
+
+    def route(self, method, path, body):
+        match = re.fullmatch(r'/applications(?:/([^/]+))?(/active)?', path)
+        if match:
+            name, active = match.groups()
+            if name is None:
+                if method == 'POST':
+                    self.apps[self.app_name] = 'INSTALLED'
+                    return 200, {}
+                return 200, {'applications': [{'name': app, 'state': state} for app, state in self.apps.items()]}
+            if name not in self.apps:
+                return 404, {}
+            if active and method == 'POST':
+                self.apps[name] = 'ACTIVE'
+            elif active and method == 'DELETE':
+                self.apps[name] = 'INSTALLED'
+            elif method == 'DELETE':
+                del self.apps[name]
+                return 204, {}
+            return 200, {'name': name, 'state': self.apps[name]}
+        if path.startswith('/configuration/'):
+            return 200, {}
+        if path == '/devices':
+            return 200, {'devices': list(self.devices.values())}
+        if path.startswith('/devices/') and method == 'DELETE':
+            device_id = path[len('/devices/'):]
+            self.devices.pop(device_id, None)
+            self.links = [link for link in self.links
+                          if device_id not in (link['src']['device'], link['dst']['device'])]
+            return 204, {}
+        if path == '/hosts':
+            return 200, {'hosts': list(self.hosts.values())}
+        if path.startswith('/hosts/') and method == 'DELETE':
+            self.hosts.pop(path.split('/')[2], None)
+            return 204, {}
+        if path == '/topology/clusters/0/links':
+            return 200, {'links': self.visible_links()}
+        if path == '/flows' and method == 'GET':
+            return 200, {'flows': list(self.flows.values())}
+        if path == '/flows' and method == 'DELETE':
+            for flow in (body or {}).get('flows', []):
+                self.flows.pop(flow['flowId'], None)
+            return 204, {}
+        return 404, {}
+
+
+class FakeONOSSession:
+    """requests.Session replacement that hands every request to a FakeONOS"""
+
+    def __init__(self, onos, prefix='/onos/v1'):
+        self.onos = onos
+        self.prefix = prefix
+
+    def request(self, method, url, timeout=None, **kwargs):
+        path = url[url.index(self.prefix) + len(self.prefix):] if self.prefix in url else url
+        status, payload = self.onos.handle(method, path, kwargs.get('json'))
+        response = requests.models.Response()
+        response.status_code = status
+        response.url = url
+        response.reason = 'OK' if status < 400 else 'Not Found'
+        response._content = json.dumps(payload).encode()
+        response.headers['Content-Type'] = 'application/json'
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeONOSHandler(BaseHTTPRequestHandler):
+    """REST front of the FakeONOS held by the server"""
+
+    # Keep-alive, so the pooled connections of ONOSClient are reused as with ONOS
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in two writes; with Nagle each answer would wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        if self.headers.get('Authorization') != self.server.authorization:
+            self.reply(401, {'message': 'unauthorized'})
+            return
+        path = urllib.parse.urlsplit(self.path).path
+        if not path.startswith(self.server.prefix):
+            self.reply(404, {})
+            return
+        body = None
+        if data and 'json' in (self.headers.get('Content-Type') or ''):
+            body = json.loads(data)
+        if self.server.response_delay:
+            time.sleep(self.server.response_delay)
+        self.reply(*self.server.onos.handle(method, path[len(self.server.prefix):], body))
+
+    def reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeONOSServer(ThreadingHTTPServer):
+    """In-process HTTP server answering the ONOS REST API from a FakeONOS, one thread per connection"""
+
+    daemon_threads = True
+    # The listen backlog of socketserver (5) resets connections when many sweep workers connect at once
+    request_queue_size = 128
+
+    def __init__(self, onos, port=0, username='onos', password='rocks', response_delay=0.0, prefix='/onos/v1'):
+        super().__init__(('127.0.0.1', port), FakeONOSHandler)
+        self.onos = onos
+        self.prefix = prefix
+        self.authorization = 'Basic ' + base64.b64encode(f'{username}:{password}'.encode()).decode()
+        # Added to every answer, to load test the clients against a slower controller
+        self.response_delay = response_delay
+        self.thread = None
+
+    def handle_error(self, request, client_address):
+        # Clients dropping a pooled connection are not an error of the stand-in
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def base_url(self):
+        return f'http://localhost:{self.port}{self.prefix}'
+
+    def client(self, **kwargs):
+        """ONOSClient talking to this server over HTTP"""
+        return ONOSClient(self.base_url, **kwargs)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='fake-onos', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server_close()
+
+
+class FakeRoutingApp:
+    """Stand-in for the ONOS app: shortest paths for every flow, one rule per hop, then its state
+
+    The handshake goes over the control socket when one is given, otherwise through the
+    config_done and Algorithm_state-><state> files the real apps write into workdir.
+    """
+
+    def __init__(self, onos, control_socket=None, workdir='.', ready_latency=0.0, state='Ready'):
+        self.onos = onos
+        self.control_socket = control_socket
+        self.workdir = workdir
+        # Seconds the app takes to report after its activation
+        self.ready_latency = ready_latency
+        self.state = state
+
+    def activate(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        start_time = time.monotonic()
+        if os.path.isfile(os.path.join(self.workdir, 'traffic_flows.pkl')):
+            self.install_paths()
+        time.sleep(max(0.0, start_time + self.ready_latency - time.monotonic()))
+        self.signal('config_done')
+        self.signal(f'Algorithm_state->{self.state}')
+
+    def signal(self, name):
+        if self.control_socket is None:
+            with open(os.path.join(self.workdir, name), 'w') as f:
+                f.write('\n')
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(self.control_socket)
+            client.sendall(name.encode() + b'\n')
+
+    def install_paths(self):
+        with open(os.path.join(self.workdir, 'traffic_flows.pkl'), 'rb') as f:
+            traffic_flows = pickle.load(f)
+        with open(os.path.join(self.workdir, 'host_to_addr_location.json')) as f:
+            host_switch = {mac: next(iter(location)) for mac, location in json.load(f).items()}
+
+        neighbors = {}
+        with self.onos.lock:
+            links = list(self.onos.links)
+        for link in links:
+            src = int(link['src']['device'][len('of:'):], 16)
+            dst = int(link['dst']['device'][len('of:'):], 16)
+            neighbors.setdefault(src, []).append(dst)
+
+        lines = []
+        devices = []
+        for src_mac, dst_mac in traffic_flows:
+            path = self.shortest_path(neighbors, int(host_switch[src_mac][1:]), int(host_switch[dst_mac][1:]))
+            lines.append(f'{src_mac},{dst_mac}|{[vertex - 1 for vertex in path]}')
+            devices.extend(f'of:{vertex:016x}' for vertex in path)
+        with open(os.path.join(self.workdir, 'traffic_flow_paths.txt'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        self.onos.add_flows(devices)
+
+    @staticmethod
+    def shortest_path(neighbors, src, dst):
+        previous = {src: None}
+        queue = deque([src])
+        while queue:
+            vertex = queue.popleft()
+            if vertex == dst:
+                break
+            for neighbor in neighbors.get(vertex, []):
+                if neighbor not in previous:
+                    previous[neighbor] = vertex
+                    queue.append(neighbor)
+        path = [dst]
+        while previous.get(path[-1]) is not None:
+            path.append(previous[path[-1]])
+        return path[::-1]
+
+
+def write_iperf_reports(folder, flows, start_epochs, duration, rate, interval=1.0):
+    """Write the JSON report iperf3 -J would leave for each client flow, at a constant rate"""
+    steps = max(1, int(round(duration / interval)))
+    for src_host, dst_host in flows:
+        intervals = [{'sum': {'start': step * interval, 'end': (step + 1) * interval, 'bits_per_second': rate,
+                              'bytes': int(rate * interval / 8), 'jitter_ms': 0.0, 'lost_packets': 0,
+                              'packets': int(rate * interval / 8 / 1470), 'retransmits': 0}}
+                     for step in range(steps)]
+        report = {'start': {'timestamp': {'timesecs': int(start_epochs.get(f'{src_host}_{dst_host}', time.time()))}},
+                  'intervals': intervals, 'end': {}}
+        with open(os.path.join(folder, f'{src_host}_{dst_host}.json'), 'w') as f:
+            json.dump(report, f)
@@ -0,0 +1,139 @@
+"""
+Graph model module
+Indexed switch graph built from SNDlib files or generated from the configuration
+"""
+
+import random
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+class TopologyGraph:
+    """Undirected switch graph with adjacency, edge and edge->port indexes"""
+
+    def __init__(self, vertices=(), edges=()):
+        self.vertices = []
+        self.adjacency = {}
+        self.edges = []
+        self.edge_index = {}
+        self.edge_ports = {}
+        for vertex in vertices:
+            self.add_vertex(vertex)
+        for u, v in edges:
+            self.add_edge(u, v)
+
+    @staticmethod
+    def edge_key(u, v):
+        return (u, v) if u < v else (v, u)
+
+    def add_vertex(self, vertex):
+        if vertex not in self.adjacency:
+            self.adjacency[vertex] = set()
+            self.vertices.append(vertex)
+
+    def add_edge(self, u, v):
+        """Add an undirected edge; return False for self-loops and duplicates"""
+        if u == v or self.has_edge(u, v):
+            return False
+        self.add_vertex(u)
+        self.add_vertex(v)
+        self.edge_index[self.edge_key(u, v)] = len(self.edges)
+        self.edges.append((u, v))
+        self.adjacency[u].add(v)
+        self.adjacency[v].add(u)
+        return True
+
+    def has_edge(self, u, v):
+        return self.edge_key(u, v) in self.edge_index
+
+    def neighbors(self, vertex):
+        return self.adjacency[vertex]
+
+    def set_port(self, u, v, port):
+        """Record the port of switch u that faces switch v"""
+        self.edge_ports[(u, v)] = port
+
+    def port(self, u, v):
+        return self.edge_ports[(u, v)]
+
+    def load_ports(self, u_v_connection):
+        """Fill the edge->port index from the {'s<u>': {'s<v>': port}} switch connection data"""
+        for u_name, neighbors in u_v_connection.items():
+            for v_name, port in neighbors.items():
+                self.set_port(int(u_name[1:]), int(v_name[1:]), port)
+
+    @property
+    def max_edges(self):
+        return len(self.vertices) * (len(self.vertices) - 1) // 2
+
+    @classmethod
+    def from_sndlib(cls, file_name):
+        """Stream-parse an SNDlib XML network; vertices are numbered 1..n in file order"""
+        graph = cls()
+        node_ids = {}
+        link = {}
+        for event, element in ET.iterparse(file_name, events=('end',)):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if tag == 'node' and 'id' in element.attrib:
+                node_ids[element.attrib['id']] = len(node_ids) + 1
+                graph.add_vertex(node_ids[element.attrib['id']])
+                element.clear()
+            elif tag in ('source', 'target'):
+                link[tag] = element.text
+            elif tag == 'link':
+                if 'source' in link and 'target' in link:
+                    graph.add_edge(node_ids[link['source']], node_ids[link['target']])
+                link = {}
+                element.clear()
+            elif tag == 'demand':
+                link = {}
+                element.clear()
+        return graph
+
+    @classmethod
+    def generate(cls, vertex_count, edge_count, rng=None):
+        """Ring over 1..n plus random chords, sampled without O(E) membership checks"""
+        rng = rng or random
+        graph = cls(range(1, vertex_count + 1))
+        for i in range(1, vertex_count):
+            graph.add_edge(i, i + 1)
+        graph.add_edge(1, vertex_count)
+
+        if edge_count > graph.max_edges:
+            raise ValueError(f'{edge_count} edges do not fit in {vertex_count} vertices')
+        missing = edge_count - len(graph.edges)
+        if missing <= 0:
+            return graph
+
+        if missing * 2 > graph.max_edges - len(graph.edges):
+            # Dense: pick directly from the complement instead of rejection sampling
+            candidates = [(u, v) for u in range(1, vertex_count + 1)
+                          for v in range(u + 1, vertex_count + 1) if not graph.has_edge(u, v)]
+            for u, v in rng.sample(candidates, missing):
+                graph.add_edge(u, v)
+        else:
+            while missing > 0:
+                u, v = rng.sample(graph.vertices, 2)
+                if graph.add_edge(u, v):
+                    missing = missing - 1
+        return graph
+
+    def generate_flows(self, flow_count, rng=None, host_num=0):
+        """Pick flow_count host pairs, unique regardless of direction"""
+        rng = rng or random
+        max_flows = self.max_edges
+        if flow_count > max_flows:
+            raise ValueError(f'{flow_count} flows do not fit in {len(self.vertices)} hosts')
+        seen = set()
+        traffic_flows = []
+        while len(traffic_flows) < flow_count:
+            src, dst = rng.sample(self.vertices, 2)
+            key = self.edge_key(src, dst)
+            if key in seen:
+                continue
+            seen.add(key)
+            traffic_flows.append((f'h{src}_{host_num}', f'h{dst}_{host_num}'))
+        return traffic_flows
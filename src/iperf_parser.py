@@ -0,0 +1,124 @@
+"""
+iperf parser module
+Collect the per-interval samples of every iperf3 report of a trial into one columnar file
+"""
+
+import glob
+import json
+import os
+
+import numpy as np
+
+
+class IperfParser:
+    """Parse iperf3 -J / --json-stream reports and store their intervals as NumPy columns"""
+
+    SAMPLE_FILE = 'intervals.npz'
+
+    def __init__(self, logger=None):
+        self.logger = logger
+
+    @staticmethod
+    def iter_events(path):
+        """Yield (event, data) pairs; --json-stream files are read line by line"""
+        with open(path, 'r') as f:
+            first_line = f.readline()
+            try:
+                first = json.loads(first_line)
+            except ValueError:
+                first = None
+            if isinstance(first, dict) and 'event' in first:
+                yield first['event'], first.get('data', {})
+                for line in f:
+                    if line.strip():
+                        message = json.loads(line)
+                        yield message['event'], message.get('data', {})
+                return
+            # Plain -J writes a single document, only complete once iperf3 has exited
+            report = json.loads(first_line + f.read())
+        if 'start' in report:
+            yield 'start', report['start']
+        for interval in report.get('intervals', []):
+            yield 'interval', interval
+        if 'error' in report:
+            yield 'error', report['error']
+        if 'end' in report:
+            yield 'end', report['end']
+
+    @staticmethod
+    def flow_of(path):
+        """Map <src>_<dst>.json / <src>_<dst>_s.json to (src, dst, role)"""
+        name = os.path.basename(path)[:-len('.json')]
+        role = 'client'
+        if name.endswith('_s'):
+            name, role = name[:-len('_s')], 'server'
+        parts = name.split('_')
+        # Host names are h<N>_<M>, so the flow name is h<a>_<m>_h<b>_<n>
+        return '_'.join(parts[:2]), '_'.join(parts[2:]), role
+
+    def parse_file(self, path):
+        """Return (start epoch, error, interval rows) of one report"""
+        start_epoch = np.nan
+        error = ''
+        rows = []
+        try:
+            for event, data in self.iter_events(path):
+                if event == 'start':
+                    timestamp = data.get('timestamp', {})
+                    start_epoch = float(timestamp.get('timesecs', np.nan))
+                elif event == 'interval':
+                    total = data['sum']
+                    rows.append((total.get('start', np.nan), total.get('end', np.nan),
+                                 total.get('bits_per_second', np.nan), total.get('bytes', 0),
+                                 total.get('jitter_ms', np.nan), total.get('lost_packets', -1),
+                                 total.get('packets', -1), total.get('retransmits', -1)))
+                elif event == 'error':
+                    error = str(data)
+        except (ValueError, KeyError) as e:
+            # Truncated report of a killed iperf3, keep what was read
+            error = error or f'unreadable report: {str(e)}'
+        return start_epoch, error, rows
+
+    def collect(self, folder, start_epochs=None, remove_json=False):
+        """Write every report of a trial folder into folder/intervals.npz and return its path"""
+        # Client launch times ('<src>_<dst>' -> epoch) beat the whole seconds iperf3 reports
+        start_epochs = start_epochs or {}
+        paths = sorted(glob.glob(os.path.join(folder, 'h*_h*.json')))
+        flow_src, flow_dst, flow_role, flow_start, flow_error = [], [], [], [], []
+        flow_ids, columns = [], []
+
+        for flow_id, path in enumerate(paths):
+            src, dst, role = self.flow_of(path)
+            start_epoch, error, rows = self.parse_file(path)
+            flow_src.append(src)
+            flow_dst.append(dst)
+            flow_role.append(role)
+            flow_start.append(start_epochs.get(f'{src}_{dst}', start_epoch))
+            flow_error.append(error)
+            flow_ids.extend([flow_id] * len(rows))
+            columns.extend(rows)
+            if error and self.logger is not None:
+                self.logger.log(f'iperf report {os.path.basename(path)}: {error}')
+
+        columns = np.array(columns, dtype=float).reshape(-1, 8)
+        sample_file = os.path.join(folder, self.SAMPLE_FILE)
+        np.savez_compressed(
+            sample_file,
+            flow_src=np.array(flow_src, dtype=str), flow_dst=np.array(flow_dst, dtype=str),
+            flow_role=np.array(flow_role, dtype=str), flow_start=np.array(flow_start, dtype=float),
+            flow_error=np.array(flow_error, dtype=str),
+            flow_id=np.array(flow_ids, dtype=np.int32),
+            start=columns[:, 0], end=columns[:, 1],
+            bits_per_second=columns[:, 2], bytes=columns[:, 3].astype(np.int64),
+            jitter_ms=columns[:, 4].astype(np.float32), lost_packets=columns[:, 5].astype(np.int64),
+            packets=columns[:, 6].astype(np.int64), retransmits=columns[:, 7].astype(np.int64))
+
+        if remove_json:
+            for path in paths:
+                os.remove(path)
+        return sample_file
+
+    @staticmethod
+    def load(sample_file):
+        with np.load(sample_file) as data:
+            return {key: data[key] for key in data.files}
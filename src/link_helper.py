@@ -0,0 +1,49 @@
+"""
+Link actuation helper
+Long-lived root process that runs link control commands without a shell or sudo per change
+
+Each stdin line is a JSON list of commands, run in order; a command is an argv list or
+{"argv": [...], "input": "..."} for commands reading stdin such as `tc -batch -`. One JSON
+line is written back per request with the clock readings taken right before and after
+every command.
+
+Every command is a new process, so before_ns is taken ahead of fork/exec: the change happens
+somewhere between the two readings and after_ns is the only edge that bounds it. after - before
+is the exec overhead plus the command itself.
+"""
+
+import json
+import subprocess
+import sys
+import time
+
+
+def run(commands):
+    results = []
+    for command in commands:
+        argv, stdin = (command['argv'], command.get('input')) if isinstance(command, dict) else (command, None)
+        before_mono_ns = time.monotonic_ns()
+        before_ns = time.time_ns()
+        try:
+            process = subprocess.run(argv, input=stdin.encode() if stdin is not None else None,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            returncode, stderr = process.returncode, process.stderr.decode(errors='replace').strip()
+        except OSError as e:
+            returncode, stderr = -1, str(e)
+        after_ns = time.time_ns()
+        after_mono_ns = time.monotonic_ns()
+        results.append({'argv': argv, 'returncode': returncode, 'stderr': stderr,
+                        'before_ns': before_ns, 'after_ns': after_ns,
+                        'before_mono_ns': before_mono_ns, 'after_mono_ns': after_mono_ns})
+    return results
+
+
+def main():
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(json.dumps(run(json.loads(line))) + '\n')
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
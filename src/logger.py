@@ -3,28 +3,117 @@ Log management module
 Handle experiment logging
 """
 
-import time
+import atexit
 import json
+import queue
+import threading
+import time
 
 class Logger:
+    """JSON lines logger; callers only enqueue, a background thread owns the file and batches the writes"""
 
-    def __init__(self, log_file=None):
-        self.log_file = log_file
-    
-    def set_log_file(self, log_file):
+    # Longest time a record may sit in the buffer before it reaches the file
+    FLUSH_INTERVAL = 0.2
+    BATCH_SIZE = 256
+
+    def __init__(self, log_file=None, label=None):
+        self.log_file = None
+        self.label = label
+        self.queue = queue.Queue()
+        self.writer = None
+        atexit.register(self.close)
+        if log_file:
+            self.set_log_file(log_file, label)
+
+    def set_log_file(self, log_file, label=None):
+        """Send the following records to log_file, tagged with the trial label"""
+        self.start_writer()
+        self.queue.put(('open', log_file))
         self.log_file = log_file
-    
-    def log(self, data=""):
+        self.label = label
+
+    def start_writer(self):
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_loop, name='logger', daemon=True)
+            self.writer.start()
+
+    def write_loop(self):
+        handle = None
+        dirty = False
+        last_flush = time.monotonic()
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.FLUSH_INTERVAL if dirty else None)]
+            except queue.Empty:
+                handle.flush()
+                dirty = False
+                last_flush = time.monotonic()
+                continue
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for kind, payload in batch:
+                if kind == 'record':
+                    lines.append(json.dumps(payload, default=str) + '\n')
+                    continue
+                # Control messages apply in order, after the records queued before them
+                if handle is not None:
+                    handle.writelines(lines)
+                    lines = []
+                if kind == 'open':
+                    if handle is not None:
+                        handle.close()
+                    handle = open(payload, 'a')
+                    dirty = False
+                elif kind == 'flush':
+                    if handle is not None:
+                        handle.flush()
+                    payload.set()
+                elif kind == 'close':
+                    if handle is not None:
+                        handle.close()
+                    payload.set()
+                    return
+
+            if handle is not None and lines:
+                handle.writelines(lines)
+                dirty = True
+                if time.monotonic() - last_flush >= self.FLUSH_INTERVAL:
+                    handle.flush()
+                    dirty = False
+                    last_flush = time.monotonic()
+
+    def flush(self, timeout=5):
+        """Block until every record logged so far is in the file"""
+        if self.writer is None:
+            return
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        done.wait(timeout)
+
+    def close(self, timeout=5):
+        if self.writer is None:
+            return
+        done = threading.Event()
+        self.queue.put(('close', done))
+        done.wait(timeout)
+        self.writer = None
+        self.log_file = None
+
+    def log(self, data="", **fields):
         if self.log_file and data != "":
-            with open(self.log_file, 'a') as f:
-                f.write(str(data))
-                f.write('\n')
-    
+            record = {'time': time.time(), 'mono': time.monotonic(), 'label': self.label, 'message': str(data)}
+            record.update(fields)
+            self.queue.put(('record', record))
+
     def log_timestamp(self, message):
-        timestamp = time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime())
-        self.log(f"{timestamp} {message}")
-    
-    def log_experiment_info(self, algorithm, vertex, edge, link_bandwidth, throughput, 
+        self.log(message, local_time=time.strftime("%Y-%m-%d-%H:%M:%S", time.localtime()))
+
+    def log_experiment_info(self, algorithm, vertex, edge, link_bandwidth, throughput,
                            traffic_model, control_plane_delay, flow_count, failure_mode):
         self.log(f"Experiment start")
         self.log(f"Algorithm: {algorithm}")
@@ -36,31 +125,32 @@ class Logger:
         self.log(f"Control plane delay: {control_plane_delay}")
         self.log(f"Flow count: {flow_count}")
         self.log(f"Failure mode: {failure_mode}")
-    
+
     def log_traffic_flow(self, index, src_host, dst_host):
-        self.log_timestamp(f"{index:5}: {src_host.name:5} {src_host.MAC():5} {src_host.IP():5}-> {dst_host.name:5} {dst_host.MAC():5} {dst_host.IP():5}")
-    
+        self.log(f"{index:5}: {src_host.name:5} {src_host.MAC():5} {src_host.IP():5}-> {dst_host.name:5} {dst_host.MAC():5} {dst_host.IP():5}",
+                 event='traffic_flow', index=index, src=src_host.name, dst=dst_host.name)
+
     def log_link_status(self, status, bw=None):
         if status == 0:
-            self.log('los_start')
+            self.log('los_start', event='link_status', status=status)
         elif status == 1:
-            self.log(f'pnlos_start, bw = {bw}')
+            self.log(f'pnlos_start, bw = {bw}', event='link_status', status=status, bw=bw)
         elif status == 2:
-            self.log('fnlos_start')
-    
+            self.log('fnlos_start', event='link_status', status=status)
+
     def log_link_status_timestamp(self, status, timestamp):
         if status == 0:
-            self.log(f'los_start: {timestamp}')
+            self.log(f'los_start: {timestamp}', event='link_status_time', status=status, timestamp=timestamp)
         elif status == 1:
-            self.log(f'pnlos_start: {timestamp}')
+            self.log(f'pnlos_start: {timestamp}', event='link_status_time', status=status, timestamp=timestamp)
         elif status == 2:
-            self.log(f'fnlos_start: {timestamp}')
-    
+            self.log(f'fnlos_start: {timestamp}', event='link_status_time', status=status, timestamp=timestamp)
+
     def log_failed_link(self, failed_link):
         self.log_timestamp(f"Failed link: {failed_link}")
-    
+
     def log_affected_flows(self, affected_traffic_flows):
         self.log_timestamp(f"Affected traffic flow set: {affected_traffic_flows}")
-    
+
     def log_completion(self, message):
-        self.log_timestamp(f"{message} completed") 
\ No newline at end of file
+        self.log_timestamp(f"{message} completed")
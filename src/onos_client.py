@@ -0,0 +1,157 @@
+"""
+ONOS client module
+Pooled keep-alive REST client shared by every controller interaction
+"""
+
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ONOSClient:
+    """ONOS REST client with connection pooling, retries, timeouts and latency metrics"""
+
+    RETRY_STATUS = (502, 503, 504)
+
+    def __init__(self, base_url, username='onos', password='rocks', timeout=5, retries=3,
+                 backoff=0.2, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.latencies = {}
+
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        self.session.headers.update({'Accept': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, name, method, path, retries=None, timeout=None, **kwargs):
+        """Send a request, retrying connection errors and 5xx answers"""
+        retries = self.retries if retries is None else retries
+        timeout = self.timeout if timeout is None else timeout
+        url = self.base_url + path
+        attempt = 0
+        while True:
+            start_time = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.record(name, time.perf_counter() - start_time)
+                if attempt >= retries:
+                    raise
+            else:
+                self.record(name, time.perf_counter() - start_time)
+                if response.status_code not in self.RETRY_STATUS or attempt >= retries:
+                    return response
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt = attempt + 1
+
+    def record(self, name, elapsed):
+        self.latencies.setdefault(name, []).append(elapsed)
+
+    def reset_metrics(self):
+        self.latencies = {}
+
+    def latency_summary(self):
+        """Return {call name: (count, mean, max)} in seconds"""
+        summary = {}
+        for name, samples in self.latencies.items():
+            summary[name] = (len(samples), sum(samples) / len(samples), max(samples))
+        return summary
+
+    def log_latency_summary(self, logger):
+        for name, (count, mean, maximum) in sorted(self.latency_summary().items()):
+            logger.log(f'ONOS {name}: {count} calls, mean {mean * 1000:.1f}ms, max {maximum * 1000:.1f}ms')
+
+    def close(self):
+        self.session.close()
+
+    # Applications
+
+    def upload_app(self, oar_path, activate=False):
+        """Install an application bundle; return True on success"""
+        with open(oar_path, 'rb') as f:
+            bundle = f.read()
+        params = {'activate': 'true'} if activate else None
+        response = self.request('upload_app', 'POST', '/applications', data=bundle, params=params,
+                                headers={'Content-Type': 'application/octet-stream'})
+        return response.status_code in (200, 201, 409)
+
+    def get_app(self, app_name, retries=None, timeout=None):
+        """Return the application description, or None if it is not installed"""
+        response = self.request('get_app', 'GET', f'/applications/{app_name}', retries=retries, timeout=timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def activate_app(self, app_name, retries=None, timeout=None):
+        response = self.request('activate_app', 'POST', f'/applications/{app_name}/active',
+                                retries=retries, timeout=timeout)
+        return response.status_code == 200
+
+    def deactivate_app(self, app_name):
+        response = self.request('deactivate_app', 'DELETE', f'/applications/{app_name}/active')
+        return response.status_code in (200, 204, 404)
+
+    def uninstall_app(self, app_name):
+        response = self.request('uninstall_app', 'DELETE', f'/applications/{app_name}')
+        return response.status_code in (200, 204, 404)
+
+    def is_available(self):
+        """Return True if the REST API answers at all (no retries)"""
+        try:
+            self.request('ping', 'GET', '/applications', retries=0, timeout=2)
+        except requests.exceptions.RequestException:
+            return False
+        return True
+
+    # Configuration
+
+    def set_configuration(self, component, payload):
+        response = self.request('set_configuration', 'POST', f'/configuration/{component}', json=payload)
+        return response
+
+    # Devices and hosts
+
+    def get_devices(self, retries=None):
+        response = self.request('get_devices', 'GET', '/devices', retries=retries, timeout=2)
+        response.raise_for_status()
+        return response.json()['devices']
+
+    def remove_device(self, device_id):
+        response = self.request('remove_device', 'DELETE', f'/devices/{device_id}')
+        return response.status_code in (200, 204, 404)
+
+    def get_hosts(self, retries=None):
+        response = self.request('get_hosts', 'GET', '/hosts', retries=retries, timeout=2)
+        response.raise_for_status()
+        return response.json()['hosts']
+
+    def remove_host(self, mac, vlan='None'):
+        response = self.request('remove_host', 'DELETE', f'/hosts/{mac}/{vlan}')
+        return response.status_code in (200, 204, 404)
+
+    # Topology and flows
+
+    def get_links(self, retries=None):
+        """Return the links of the first topology cluster"""
+        response = self.request('get_links', 'GET', '/topology/clusters/0/links', retries=retries, timeout=2)
+        response.raise_for_status()
+        return response.json()['links']
+
+    def get_flows(self, retries=None):
+        response = self.request('get_flows', 'GET', '/flows', retries=retries, timeout=2)
+        response.raise_for_status()
+        return response.json()['flows']
+
+    def remove_flows(self, flows):
+        """Remove flow rules in one batch request"""
+        if not flows:
+            return True
+        payload = {'flows': [{'deviceId': flow['deviceId'], 'flowId': flow['id']} for flow in flows]}
+        response = self.request('remove_flows', 'DELETE', '/flows', json=payload)
+        return response.status_code in (200, 204)
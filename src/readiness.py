@@ -0,0 +1,169 @@
+"""
+Readiness management module
+Wait on real system conditions instead of fixed sleeps
+"""
+
+import os
+import subprocess
+import time
+
+from .config import ONOSConfig, SystemManager
+
+
+class ReadinessManager:
+    """Poll a condition with timeout and backoff, recording how long each wait took"""
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.wait_times = []
+
+    def reset(self):
+        self.wait_times = []
+
+    def wait_for(self, name, condition, timeout=60, interval=0.05, backoff=1.5, max_interval=2, required=True):
+        """Wait until condition() is true; raise TimeoutError (or return None if not required)"""
+        start_time = time.monotonic()
+        delay = interval
+        while True:
+            try:
+                ready = condition()
+            except Exception:
+                ready = False
+            elapsed = time.monotonic() - start_time
+            if ready:
+                self.wait_times.append((name, elapsed))
+                self.logger.log(f'Ready: {name} after {elapsed:.3f}s')
+                return elapsed
+            if elapsed >= timeout:
+                self.wait_times.append((name, elapsed))
+                self.logger.log(f'Not ready: {name} after {elapsed:.3f}s')
+                if required:
+                    raise TimeoutError(f'{name} not ready after {timeout}s')
+                return None
+            time.sleep(min(delay, timeout - elapsed))
+            delay = min(delay * backoff, max_interval)
+
+    def log_summary(self):
+        total = sum(elapsed for _, elapsed in self.wait_times)
+        self.logger.log(f'Readiness waits: {len(self.wait_times)}, total {total:.3f}s')
+        for name, elapsed in self.wait_times:
+            self.logger.log(f'  {name}: {elapsed:.3f}s')
+
+    # Conditions
+
+    @staticmethod
+    def run_quiet(cmd):
+        return subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+
+    @staticmethod
+    def mininet_links_removed():
+        """No Mininet veth interface is left in this namespace"""
+        output = ReadinessManager.run_quiet('ip -o link show').stdout
+        return '-eth' not in output
+
+    @staticmethod
+    def ovs_stopped():
+        """ovsdb-server and ovs-vswitchd have exited"""
+        if SystemManager.isolated:
+            for daemon in ['ovs-vswitchd', 'ovsdb-server']:
+                pid_file = f'{SystemManager.ovs_rundir}/{daemon}.pid'
+                if os.path.isfile(pid_file):
+                    with open(pid_file) as f:
+                        if os.path.exists('/proc/' + f.read().strip()):
+                            return False
+            return True
+        return ReadinessManager.run_quiet('pgrep -x "ovsdb-server|ovs-vswitchd"').returncode != 0
+
+    @staticmethod
+    def ovs_ready():
+        """OVS db socket exists, ovs-vswitchd is up and the database answers"""
+        if not os.path.exists(f'{SystemManager.ovs_rundir}/db.sock'):
+            return False
+        if not os.path.exists(f'{SystemManager.ovs_rundir}/ovs-vswitchd.pid'):
+            return False
+        return ReadinessManager.run_quiet(SystemManager.ovs_sudo() + 'ovs-vsctl --timeout=1 show').returncode == 0
+
+    @staticmethod
+    def bridges_removed():
+        """No OVS bridge is left"""
+        result = ReadinessManager.run_quiet(SystemManager.ovs_sudo() + 'ovs-vsctl --timeout=1 list-br')
+        return result.returncode == 0 and result.stdout.strip() == ''
+
+    @staticmethod
+    def onos_down():
+        return not ONOSConfig.client().is_available()
+
+    @staticmethod
+    def onos_openflow_active():
+        """ONOS REST answers and the openflow application is active, without changing anything"""
+        app = ONOSConfig.client().get_app('org.onosproject.openflow', retries=0, timeout=2)
+        return app is not None and app.get('state') == 'ACTIVE'
+
+    @staticmethod
+    def onos_openflow_activated():
+        """ONOS REST answers and accepted the activation of the openflow application"""
+        return ONOSConfig.client().activate_app('org.onosproject.openflow', retries=0, timeout=2)
+
+    @staticmethod
+    def onos_purged():
+        """ONOS holds no device, host or link from a previous trial"""
+        client = ONOSConfig.client()
+        return not client.get_devices(retries=0) and not client.get_hosts(retries=0)
+
+    @staticmethod
+    def controller_links(edge):
+        """Return a condition that is true once ONOS sees every link in both directions"""
+        def condition():
+            raw_topo = ONOSConfig.client().get_links(retries=0)
+            return int(len(raw_topo) / 2) == edge
+        return condition
+
+    @staticmethod
+    def app_inactive(app_name):
+        def condition():
+            app = ONOSConfig.client().get_app(app_name)
+            return app is None or app.get('state') != 'ACTIVE'
+        return condition
+
+    @staticmethod
+    def flows_settled():
+        """Return a condition that is true once every flow is ADDED and the count is stable"""
+        previous = {'count': -1}
+
+        def condition():
+            flows = ONOSConfig.client().get_flows(retries=0)
+            count = len(flows)
+            settled = count == previous['count'] and all(flow.get('state') == 'ADDED' for flow in flows)
+            previous['count'] = count
+            return settled
+        return condition
+
+    @staticmethod
+    def file_has_content(path):
+        def condition():
+            return os.path.isfile(path) and os.path.getsize(path) > 0
+        return condition
+
+    @staticmethod
+    def file_line_count(path, expected):
+        def condition():
+            with open(path) as f:
+                return sum(1 for _ in f) >= expected
+        return condition
+
+    @staticmethod
+    def ports_listening(host, ports):
+        """Return a condition that is true once host has TCP/UDP listeners on all ports"""
+        ports = set(ports)
+
+        def condition():
+            output = host.cmd('ss -ltunH')
+            listening = set()
+            for line in output.splitlines():
+                fields = line.split()
+                if len(fields) >= 5:
+                    port = fields[4].rsplit(':', 1)[-1]
+                    if port.isdigit():
+                        listening.add(int(port))
+            return ports <= listening
+        return condition
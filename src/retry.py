@@ -0,0 +1,96 @@
+"""
+Retry policy module
+Classify failed trial attempts and decide whether, and how, to retry them
+"""
+
+import time
+
+
+class TrialFailure(Exception):
+    """A trial attempt that failed in a known phase"""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+class RetryPolicy:
+    """Per failure class retry budgets with exponential backoff and wasted time accounting"""
+
+    SETUP = 'setup'
+    CONTROLLER = 'controller'
+    TRAFFIC = 'traffic'
+    DATA = 'data'
+    KINDS = (SETUP, CONTROLLER, TRAFFIC, DATA)
+
+    # Retries allowed per label for each failure class
+    BUDGETS = {SETUP: 3, CONTROLLER: 3, TRAFFIC: 2, DATA: 2}
+    # Only a broken environment needs the cold reset; the other classes keep ONOS and the topology
+    RESET_MODES = {SETUP: 'cold', CONTROLLER: 'warm', TRAFFIC: 'warm', DATA: 'warm'}
+    # Reinstalling the app is the only phase that can be retried without rerunning the trial
+    PHASE_RETRIES = {CONTROLLER: 2}
+
+    def __init__(self, logger, budgets=None, limit=6, backoff=5, max_backoff=120):
+        self.logger = logger
+        self.budgets = dict(self.BUDGETS, **(budgets or {}))
+        self.limit = limit
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.wasted = {kind: 0.0 for kind in self.KINDS}
+        self.failures = {kind: 0 for kind in self.KINDS}
+        self.begin(None)
+
+    def begin(self, label, previous=0):
+        """Start counting the attempts of a new label, after previous attempts made by earlier runs"""
+        self.label = label
+        self.previous = previous
+        self.attempts = {kind: 0 for kind in self.KINDS}
+        self.phase_attempts = {kind: 0 for kind in self.KINDS}
+        self.last_kind = None
+
+    def record(self, kind, elapsed, error):
+        """Account one failed attempt; return the backoff before the retry, or None to quarantine"""
+        self.failures[kind] = self.failures[kind] + 1
+        self.wasted[kind] = self.wasted[kind] + elapsed
+        self.attempts[kind] = self.attempts[kind] + 1
+        self.last_kind = kind
+        total = self.previous + sum(self.attempts.values())
+        self.logger.log(f'Attempt {total} failed ({kind}, {elapsed:.1f}s): {error}',
+                        event='trial_failure', kind=kind, elapsed=elapsed, attempt=total)
+        if self.attempts[kind] > self.budgets[kind] or total >= self.limit:
+            return None
+        return min(self.max_backoff, self.backoff * 2 ** (self.attempts[kind] - 1))
+
+    def exhausted(self):
+        """Whether earlier runs already used up the attempt limit of the current label"""
+        return self.previous >= self.limit
+
+    def retry_phase(self, kind, elapsed, error):
+        """Account a failed phase; return True when the phase alone may be run again"""
+        if self.phase_attempts[kind] >= self.PHASE_RETRIES.get(kind, 0):
+            return False
+        self.phase_attempts[kind] = self.phase_attempts[kind] + 1
+        self.failures[kind] = self.failures[kind] + 1
+        self.wasted[kind] = self.wasted[kind] + elapsed
+        self.logger.log(f'{kind} phase failed ({elapsed:.1f}s): {error}, retrying the phase',
+                        event='phase_failure', kind=kind, elapsed=elapsed)
+        return True
+
+    def reset_mode(self, default):
+        """Reset mode of the next attempt of the current label"""
+        if self.last_kind is None:
+            return default
+        return self.RESET_MODES[self.last_kind]
+
+    def keep_topology(self):
+        """A failure outside the setup phase leaves the kept topology usable"""
+        return self.last_kind in (self.TRAFFIC, self.DATA, self.CONTROLLER)
+
+    def wait(self, delay):
+        if delay:
+            self.logger.log(f'Retry backoff {delay}s')
+            time.sleep(delay)
+
+    def summary(self):
+        """{failure class: (failures, wasted seconds)} over all labels"""
+        return {kind: (self.failures[kind], round(self.wasted[kind], 1)) for kind in self.KINDS}
@@ -0,0 +1,140 @@
+"""
+Run index module
+Transactional record of every trial label of a sweep, used to resume after a crash
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+class RunIndex:
+    """State (planned, running, done, failed, quarantined), attempts and artifact checksums per label in SQLite"""
+
+    FILE = 'run_index.sqlite'
+    # A trial folder holding all of these was completed before the index existed; the trial record
+    # is written last, after the interval samples
+    DONE_MARKERS = ('intervals.npz', 'trial_record.json')
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS trials (
+            label TEXT PRIMARY KEY,
+            trial INTEGER NOT NULL,
+            algorithm TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'planned',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            checksums TEXT,
+            updated REAL NOT NULL
+        )
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Sweep workers write to the same index; a writer waits for the lock instead of failing
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute(self.SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def execute(self, sql, parameters=()):
+        """Run one statement in its own immediate transaction"""
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            return self.connection.execute(sql, parameters)
+
+    def plan(self, entries, trace_folder=None):
+        """Add (label, trial, algorithm) entries not yet known; folders finished earlier count as done"""
+        now = time.time()
+        rows = []
+        for label, trial, algorithm in entries:
+            done = trace_folder is not None and all(
+                os.path.isfile(os.path.join(trace_folder, label, marker)) for marker in self.DONE_MARKERS)
+            rows.append((label, trial, algorithm, 'done' if done else 'planned', now))
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO trials (label, trial, algorithm, state, updated) VALUES (?, ?, ?, ?, ?)', rows)
+
+    def start(self, label):
+        """Mark a new attempt of label as running and return its attempt number"""
+        self.execute("UPDATE trials SET state = 'running', attempts = attempts + 1, error = NULL, updated = ? "
+                     "WHERE label = ?", (time.time(), label))
+        return self.connection.execute('SELECT attempts FROM trials WHERE label = ?', (label,)).fetchone()[0]
+
+    def attempts(self, label):
+        """Attempts started for label so far, by this run and the earlier ones"""
+        row = self.connection.execute('SELECT attempts FROM trials WHERE label = ?', (label,)).fetchone()
+        return row[0] if row else 0
+
+    def fail(self, label, error):
+        self.execute("UPDATE trials SET state = 'failed', error = ?, updated = ? WHERE label = ?",
+                     (str(error), time.time(), label))
+
+    def quarantine(self, label, error):
+        """Give up on label; a resumed sweep skips it until its state is reset to planned"""
+        self.execute("UPDATE trials SET state = 'quarantined', error = ?, updated = ? WHERE label = ?",
+                     (str(error), time.time(), label))
+
+    def done(self, label, folder=None):
+        """Mark label done, keeping the sha256 of every artifact in its trace folder"""
+        checksums = self.checksums(folder) if folder is not None else {}
+        self.execute("UPDATE trials SET state = 'done', error = NULL, checksums = ?, updated = ? WHERE label = ?",
+                     (json.dumps(checksums), time.time(), label))
+
+    def state(self, label):
+        row = self.connection.execute('SELECT state FROM trials WHERE label = ?', (label,)).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, label):
+        return self.state(label) == 'done'
+
+    def is_settled(self, label):
+        """Whether a resumed sweep should leave label alone"""
+        return self.state(label) in ('done', 'quarantined')
+
+    def summary(self):
+        """{state: number of labels}"""
+        return dict(self.connection.execute('SELECT state, COUNT(*) FROM trials GROUP BY state').fetchall())
+
+    def artifacts(self, label):
+        row = self.connection.execute('SELECT checksums FROM trials WHERE label = ?', (label,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def verify(self, label, folder):
+        """Return the artifacts of label that are missing or changed since it was marked done"""
+        recorded = self.artifacts(label)
+        current = self.checksums(folder)
+        return sorted(name for name, digest in recorded.items() if current.get(name) != digest)
+
+    def recheck(self, label, folder):
+        """Set a done label back to planned when its artifacts went missing or changed, and return them"""
+        if not self.is_done(label):
+            return []
+        if os.path.isdir(folder):
+            changed = self.verify(label, folder)
+            missing = [marker for marker in self.DONE_MARKERS if not os.path.isfile(os.path.join(folder, marker))]
+        else:
+            changed, missing = sorted(self.artifacts(label)), list(self.DONE_MARKERS)
+        changed = sorted(set(changed) | set(missing))
+        if changed:
+            self.execute("UPDATE trials SET state = 'planned', error = ?, checksums = NULL, updated = ? "
+                         "WHERE label = ?", (f'artifacts changed: {", ".join(changed)}', time.time(), label))
+        return changed
+
+    @staticmethod
+    def checksums(folder):
+        result = {}
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if not os.path.isfile(path):
+                continue
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+            result[name] = sha.hexdigest()
+        return result
@@ -0,0 +1,203 @@
+"""
+Sweep scheduler module
+Run independent trials in parallel, each worker isolated in its own network namespace
+"""
+
+import os
+import queue
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .analysis import TrialAnalyzer
+from .config import ONOSConfig
+from .failure import FailurePatternSet
+from .run_index import RunIndex
+
+
+class WorkerContext:
+    """Resources owned by one sweep worker"""
+
+    PORT_SPAN = 1000
+    HELPER_SCRIPTS = ['pid_kill.py', 'switch_ff.py']
+
+    def __init__(self, index, root_dir):
+        self.index = index
+        self.root_dir = os.path.abspath(root_dir)
+        self.namespace = f'sdnw{index}'
+        self.bridge_prefix = f'w{index}s'
+        self.controller_port = 6633 + index
+        self.rest_port = 8181 + index
+        self.base_port = 50000 + index * self.PORT_SPAN
+        self.workdir = os.path.join(self.root_dir, '.sweep', f'worker{index}')
+        self.ovs_dir = os.path.join(self.workdir, 'ovs')
+        self.trace_root = os.path.join(self.root_dir, 'Trace_folder')
+
+    def enter(self):
+        """Prepare the working directory and switch into it"""
+        os.makedirs(self.ovs_dir, exist_ok=True)
+        # Handshake files and helper scripts are resolved relative to the CWD
+        for script in self.HELPER_SCRIPTS:
+            src = os.path.join(self.root_dir, script)
+            dst = os.path.join(self.workdir, script)
+            if os.path.isfile(src) and not os.path.lexists(dst):
+                os.symlink(src, dst)
+        os.chdir(self.workdir)
+
+    def __repr__(self):
+        return (f'WorkerContext(index={self.index}, namespace={self.namespace}, '
+                f'controller_port={self.controller_port}, base_port={self.base_port})')
+
+
+class SweepScheduler:
+    """Worker pool that runs one trial per worker slot"""
+
+    # Seconds the ONOS instances of all workers get to answer on their REST port
+    CONTROLLER_TIMEOUT = 300
+    # Any HTTP answer, even 401, shows the REST port is served from inside the namespace
+    REST_PROBE = ('import sys, urllib.error, urllib.request\n'
+                  'try:\n'
+                  '    urllib.request.urlopen(sys.argv[1] + "/applications", timeout=2)\n'
+                  'except urllib.error.HTTPError:\n'
+                  '    pass\n')
+
+    def __init__(self, config_file, cfg_file, workers, root_dir='.'):
+        self.config_file = os.path.abspath(config_file)
+        self.cfg_file = cfg_file
+        self.workers = workers
+        self.root_dir = os.path.abspath(root_dir)
+        self.main_script = os.path.join(self.root_dir, 'main.py')
+        self.slots = [WorkerContext(index, self.root_dir) for index in range(1, workers + 1)]
+
+    def trial_labels(self, trial):
+        labels = []
+        for algorithm in self.cfg_file['Algorithm']:
+            labels.append(f"{algorithm}_{self.cfg_file['Vertex'][0]}_{self.cfg_file['Edge'][0]}_"
+                          f"{self.cfg_file['LinkBandwidth'][0]}_{self.cfg_file['Throughput'][0]}_"
+                          f"{self.cfg_file['TrafficModel'][0]}_{self.cfg_file['ControlPlaneDelay'][0]}_"
+                          f"{self.cfg_file['FlowCount'][0]}_{trial}")
+        return labels
+
+    def pending_trials(self):
+        sub_folder = 'markov_chain' if self.cfg_file['Mode'] == 'markov' else 'fixed_version'
+        trace_folder = os.path.join(self.root_dir, 'Trace_folder', self.cfg_file['FailureMode'], sub_folder)
+        os.makedirs(trace_folder, exist_ok=True)
+        run_index = RunIndex(os.path.join(trace_folder, RunIndex.FILE))
+        trials = range(self.cfg_file['Trial'][0], self.cfg_file['Trial'][1] + 1)
+        labels = {trial: self.trial_labels(trial) for trial in trials}
+        run_index.plan([(label, trial, algorithm) for trial in trials
+                        for algorithm, label in zip(self.cfg_file['Algorithm'], labels[trial])], trace_folder)
+        for trial in trials:
+            for label in labels[trial]:
+                changed = run_index.recheck(label, os.path.join(trace_folder, label))
+                if changed:
+                    print(f'Rerunning {label}, artifacts changed since it was done: {", ".join(changed)}')
+        print(f'Run index: {run_index.summary()}')
+        pending = [trial for trial in trials if not all(run_index.is_settled(label) for label in labels[trial])]
+        run_index.close()
+        return pending
+
+    def prepare_failure_patterns(self):
+        """Write the PatternFile once so that every worker replays the same patterns"""
+        pattern_file = self.cfg_file.get('PatternFile')
+        if not pattern_file:
+            return
+        pattern_file = os.path.join(self.root_dir, pattern_file)
+        if not os.path.isfile(pattern_file):
+            trials = range(self.cfg_file['Trial'][0], self.cfg_file['Trial'][1] + 1)
+            FailurePatternSet.from_config(self.cfg_file, trials).save(pattern_file)
+
+    def setup_namespaces(self):
+        for slot in self.slots:
+            os.system(f'sudo ip netns add {slot.namespace}')
+            os.system(f'sudo ip netns exec {slot.namespace} ip link set lo up')
+
+    def start_controllers(self):
+        """Start the ONOS of every worker inside its namespace and fail fast unless its REST port answers"""
+        script_path = os.path.expanduser(ONOSConfig.reset_script)
+        if not os.path.isfile(script_path):
+            raise RuntimeError(f'ONOS reset script {script_path} not found; every sweep worker needs it '
+                               f'to start its own ONOS')
+        for slot in self.slots:
+            subprocess.Popen(['sudo', 'ip', 'netns', 'exec', slot.namespace, 'python3', script_path,
+                              ONOSConfig.rest_url(slot.rest_port)],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        pending = list(self.slots)
+        deadline = time.monotonic() + self.CONTROLLER_TIMEOUT
+        while pending:
+            pending = [slot for slot in pending if not self.rest_answers(slot)]
+            if not pending:
+                break
+            if time.monotonic() > deadline:
+                raise RuntimeError(
+                    'ONOS did not answer within {}s for {}; {} must start an ONOS whose REST API listens on '
+                    'the URL it gets as argument inside the worker namespace'.format(
+                        self.CONTROLLER_TIMEOUT,
+                        ', '.join(f'worker{slot.index} ({slot.namespace}, {ONOSConfig.rest_url(slot.rest_port)})'
+                                  for slot in pending), script_path))
+            time.sleep(2)
+        print(f'ONOS answers for all {len(self.slots)} workers')
+
+    def rest_answers(self, slot):
+        cmd = ['sudo', 'ip', 'netns', 'exec', slot.namespace, sys.executable, '-c', self.REST_PROBE,
+               ONOSConfig.rest_url(slot.rest_port)]
+        return subprocess.call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+
+    def teardown_namespaces(self):
+        for slot in self.slots:
+            os.system(f'sudo ip netns del {slot.namespace}')
+
+    def run_trial(self, trial, free_slots):
+        slot = free_slots.get()
+        try:
+            os.makedirs(slot.workdir, exist_ok=True)
+            config_base = self.config_file[:-len('.json')] if self.config_file.endswith('.json') else self.config_file
+            cmd = ['sudo', 'ip', 'netns', 'exec', slot.namespace, sys.executable, self.main_script,
+                   'run', config_base, '--worker', str(slot.index), '--trial', str(trial)]
+            start_time = time.time()
+            print(f'[worker{slot.index}] Starting trial {trial}')
+            with open(os.path.join(slot.workdir, 'worker.log'), 'a') as log_file:
+                returncode = subprocess.call(cmd, cwd=slot.workdir, stdout=log_file, stderr=subprocess.STDOUT)
+            print(f'[worker{slot.index}] Trial {trial} finished with code {returncode} '
+                  f'in {time.time() - start_time:.1f}s')
+            return trial, returncode
+        finally:
+            free_slots.put(slot)
+
+    def run(self):
+        """Run all pending trials"""
+        trials = self.pending_trials()
+        print(f'Pending trials: {trials}, workers: {self.workers}')
+        if not trials:
+            return {}
+
+        self.prepare_failure_patterns()
+        free_slots = queue.Queue()
+        for slot in self.slots:
+            free_slots.put(slot)
+
+        self.setup_namespaces()
+        try:
+            self.start_controllers()
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self.run_trial, trial, free_slots) for trial in trials]
+                results = dict(future.result() for future in futures)
+        finally:
+            self.teardown_namespaces()
+
+        failed = [trial for trial, returncode in results.items() if returncode != 0]
+        if failed:
+            print(f'Failed trials: {failed}')
+        self.analyze_results()
+        return results
+
+    def analyze_results(self):
+        """Merge the metrics of every finished trial into OutputFile, in parallel across trial folders"""
+        trace_folder = os.path.join(self.root_dir, 'Trace_folder', self.cfg_file['FailureMode'])
+        sub_folder = 'markov_chain' if self.cfg_file['Mode'] == 'markov' else 'fixed_version'
+        folders = TrialAnalyzer.trial_folders(os.path.join(trace_folder, sub_folder))
+        TrialAnalyzer(self.cfg_file.get('Metric')).analyze_all(
+            folders, os.path.join(trace_folder, self.cfg_file['OutputFile']), self.cfg_file.get('AnalysisWorkers'))
+        print(f'Analyzed {len(folders)} trials')
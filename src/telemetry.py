@@ -0,0 +1,138 @@
+"""
+Telemetry module
+Sample OVS port counters of every inter-switch link while a trial is running
+"""
+
+import re
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from .config import SystemManager
+
+
+class PortStatsSampler:
+    """Poll `ovs-ofctl dump-ports` of all switches into a fixed-size ring buffer of link byte counters"""
+
+    SAMPLE_FILE = 'port_stats.npz'
+    # Samples kept per trial; older samples are overwritten
+    CAPACITY = 4096
+    # The trial has collapsed once the traffic over all links stays under this share of its peak
+    COLLAPSE_RATIO = 0.1
+    PORT_PATTERN = re.compile(r'port\s+"?([^:"\s]+)"?:\s*rx pkts=\d+, bytes=(\d+).*?tx pkts=\d+, bytes=(\d+)', re.S)
+    SWITCH_MARK = '### '
+
+    def __init__(self, logger, interval=0.5, collapse_time=3.0, capacity=CAPACITY):
+        self.logger = logger
+        self.interval = interval
+        self.collapse_time = collapse_time
+        self.capacity = capacity
+        self.on_collapse = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def configure(self, topology_index, bridge_name):
+        """Index both directions of every switch-to-switch link of the built network"""
+        links = sorted(set((u, v) for u, v in topology_index.ports
+                           if u.startswith('s') and v.startswith('s') and int(u[1:]) < int(v[1:])))
+        self.links = links
+        self.bridges = sorted(set(bridge_name(switch) for link in links for switch in link))
+        # (bridge, port) -> (link, direction); direction 0 is u->v, 1 is v->u, counted on the sending port
+        self.port_slots = {}
+        for link, (u, v) in enumerate(links):
+            self.port_slots[(bridge_name(u), topology_index.port(u, v))] = (link, 0)
+            self.port_slots[(bridge_name(v), topology_index.port(v, u))] = (link, 1)
+
+    def dump_ports(self):
+        """Return {(bridge, port): tx bytes} from one sudo shell covering every bridge"""
+        script = '; '.join(f'echo "{self.SWITCH_MARK}{bridge}"; ovs-ofctl dump-ports {bridge}' for bridge in self.bridges)
+        result = subprocess.run(SystemManager.ovs_sudo() + f"sh -c '{script}'", shell=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        counters = {}
+        for block in result.stdout.split(self.SWITCH_MARK)[1:]:
+            bridge, _, body = block.partition('\n')
+            for port, rx_bytes, tx_bytes in self.PORT_PATTERN.findall(body):
+                counters[(bridge.strip(), port)] = int(tx_bytes)
+        return counters
+
+    def start(self, on_collapse=None):
+        self.on_collapse = on_collapse
+        self.times = np.zeros(self.capacity)
+        self.tx_bytes = np.zeros((self.capacity, len(self.links), 2), dtype=np.int64)
+        self.count = 0
+        self.collapsed_at = None
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        started = time.monotonic()
+        peak = 0.0
+        low_since = None
+        tick = 0
+        while not self.stop_event.is_set():
+            try:
+                counters = self.dump_ports()
+            except Exception as e:
+                self.logger.log(f'Port stats error: {str(e)}')
+                counters = {}
+            slot = self.count % self.capacity
+            self.times[slot] = time.time()
+            row = self.tx_bytes[slot]
+            row[:] = -1
+            for key, value in counters.items():
+                if key in self.port_slots:
+                    row[self.port_slots[key]] = value
+            self.count = self.count + 1
+
+            if self.count > 1:
+                rate = self.total_rate()
+                peak = max(peak, rate)
+                if peak > 0 and rate < self.COLLAPSE_RATIO * peak:
+                    low_since = low_since or self.times[slot]
+                    if self.collapsed_at is None and self.times[slot] - low_since >= self.collapse_time:
+                        self.collapse(rate, peak)
+                else:
+                    low_since = None
+
+            # Absolute deadlines so that the dump time does not stretch the sampling period
+            tick = tick + 1
+            self.stop_event.wait(max(0.0, started + tick * self.interval - time.monotonic()))
+
+    def total_rate(self):
+        """Bits per second over all links between the last two samples"""
+        last = (self.count - 1) % self.capacity
+        previous = (self.count - 2) % self.capacity
+        elapsed = self.times[last] - self.times[previous]
+        valid = (self.tx_bytes[last] >= 0) & (self.tx_bytes[previous] >= 0)
+        delta = np.clip(self.tx_bytes[last] - self.tx_bytes[previous], 0, None)
+        return float(delta[valid].sum() * 8 / elapsed) if elapsed > 0 else 0.0
+
+    def collapse(self, rate, peak):
+        self.collapsed_at = self.times[(self.count - 1) % self.capacity]
+        reason = (f'link traffic collapsed to {rate / 1e6:.2f} Mbit/s '
+                  f'(peak {peak / 1e6:.2f} Mbit/s) for {self.collapse_time}s')
+        self.logger.log(f'Telemetry: {reason}')
+        if self.on_collapse is not None:
+            self.on_collapse(reason)
+
+    def stop(self, sample_file=None):
+        """Stop sampling and write the buffered samples in time order"""
+        if self.thread is None:
+            return None
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        if sample_file is None:
+            return None
+
+        order = np.arange(max(0, self.count - self.capacity), self.count) % self.capacity
+        np.savez_compressed(
+            sample_file,
+            link_u=np.array([u for u, v in self.links], dtype=str),
+            link_v=np.array([v for u, v in self.links], dtype=str),
+            times=self.times[order], tx_bytes=self.tx_bytes[order],
+            collapsed_at=np.array(np.nan if self.collapsed_at is None else self.collapsed_at))
+        return sample_file
@@ -3,174 +3,225 @@ Topology management module
 Handle network topology creation and management
 """
 
-import random
+import os
+import tempfile
 import time
-import requests
-from threading import Thread
+from types import MappingProxyType
 from mininet.cli import CLI
 from mininet.link import TCLink
 from mininet.net import Mininet
-from mininet.node import RemoteController
+from mininet.node import OVSSwitch, RemoteController
+from mininet.util import quietRun
 
-try:
-    import xml.etree.cElementTree as ET
-except ImportError:
-    import xml.etree.ElementTree as ET
+from .graph import TopologyGraph
+
+
+class PhaseTimer:
+    """Measure consecutive phases of a long operation"""
+    
+    def __init__(self, logger):
+        self.logger = logger
+        self.timings = {}
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+    
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.timings[phase] = now - self.last_time
+        self.last_time = now
+        self.logger.log(f'{phase} phase: {self.timings[phase]:.3f}s')
+    
+    def log_total(self, name):
+        self.logger.log(f'{name} total: {self.last_time - self.start_time:.3f}s')
+
+
+class TopologyIndex:
+    """Read-only lookups over a built network, computed with one pass over net.links"""
+    
+    def __init__(self, net, logical_name):
+        host_names = set(host.name for host in net.hosts)
+        ports = {}
+        intfs = {}
+        host_location = {}
+        for link in net.links:
+            for intf, peer in [(link.intf1, link.intf2), (link.intf2, link.intf1)]:
+                key = (logical_name(intf.node.name), logical_name(peer.node.name))
+                ports[key] = str(intf.node.ports[intf])
+                intfs[key] = intf
+                if peer.node.name in host_names and intf.node.name not in host_names:
+                    host_location[peer.node.MAC()] = key[0], ports[key]
+        self.ports = MappingProxyType(ports)
+        self.intfs = MappingProxyType(intfs)
+        self.host_location = MappingProxyType(host_location)
+        self.host_ip = MappingProxyType({host.name: host.IP() for host in net.hosts})
+    
+    def port(self, node, neighbor):
+        """Port number (as a string) of node facing neighbor"""
+        return self.ports[(node, neighbor)]
+    
+    def intf(self, node, neighbor):
+        """Interface object of node facing neighbor"""
+        return self.intfs[(node, neighbor)]
 
 
 class TopologyManager:
     """Topology manager"""
     
-    def __init__(self, logger):
+    # Network and switch classes used by build_topo; the benchmark plugs in local stand-ins
+    network_class = Mininet
+    switch_class = OVSSwitch
+    
+    def __init__(self, logger, readiness):
         self.logger = logger
+        self.readiness = readiness
+        self.controller_port = 6633
+        self.switch_prefix = 's'
+        self.build_timings = {}
+        self.index = None
+    
+    def bridge_name(self, switch_name):
+        """Map logical switch name (s<N>) to its OVS bridge name"""
+        return self.switch_prefix + switch_name[1:]
+    
+    def logical_name(self, bridge_name):
+        """Map OVS bridge name back to logical switch name (s<N>)"""
+        if bridge_name.startswith(self.switch_prefix):
+            return 's' + bridge_name[len(self.switch_prefix):]
+        return bridge_name
     
     ## note: no reference to this function in the original code, but keeping it for completeness
     def read_topo_file(self, file_name):
         """Read topology from SNDlib file"""
         file_name = './SNDlib/' + file_name
-        raw_edge_data = []
-        raw_vertex_data = {}
-        count = 0
-        tree = ET.ElementTree(file=file_name)
-        root = tree.getroot()
-        
-        for child in root:
-            for sub_child in child:
-                if sub_child.attrib != {}:
-                    if list(sub_child.attrib.keys())[0] == 'coordinatesType':
-                        for sub_sub_child in sub_child:
-                            count = count + 1
-                            raw_vertex_data[sub_sub_child.attrib['id']] = count
-        
-        for child in root:
-            for sub_child in child:
-                if sub_child.attrib == {}:
-                    for sub_sub_child in sub_child:
-                        edge = []
-                        for sub_sub_sub_child in sub_sub_child:
-                            if sub_sub_sub_child.tag == '{http://sndlib.zib.de/network}target' or sub_sub_sub_child.tag == '{http://sndlib.zib.de/network}source':
-                                edge.append(raw_vertex_data[sub_sub_sub_child.text])
-                        raw_edge_data.append(tuple(edge))
-        
-        raw_edge_data = sorted(raw_edge_data)
-        raw_vertex_data = sorted(list(raw_vertex_data.values()))
-        return raw_edge_data, raw_vertex_data, file_name
+        graph = TopologyGraph.from_sndlib(file_name)
+        return sorted(graph.edges), sorted(graph.vertices), file_name
     
     ## note: no reference to this function in the original code, but keeping it for completeness
     def create_topo(self, edge, vertex):
         """Create topology"""
-        raw_edge_data = []
-        raw_vertex_data = []
-        
-        for i in range(1, vertex + 1):
-            raw_vertex_data.append(i)
-            j = i + 1
-            if j < vertex + 1:
-                raw_edge_data.append((i, j))
-        
-        self.logger.log(f"raw_edge_data : {raw_edge_data}")
-        raw_edge_data.append((raw_edge_data[0][0], raw_edge_data[len(raw_edge_data) - 1][1]))
-        self.logger.log(f"raw_edge_data : {raw_edge_data}")
-        
-        for i in range(edge - len(raw_edge_data)):
-            while True:
-                random_edge = random.sample(raw_vertex_data, 2)
-                if tuple(random_edge) not in raw_edge_data and (random_edge[1], random_edge[0]) not in raw_edge_data:
-                    raw_edge_data.append(tuple(random_edge))
-                    break
-        
-        self.logger.log(f"raw_edge_data : {raw_edge_data}")
-        self.logger.log(f"raw_vertex_data : {raw_vertex_data}")
-        return raw_edge_data, raw_vertex_data
+        graph = TopologyGraph.generate(vertex, edge)
+        self.logger.log(f"raw_edge_data : {graph.edges}")
+        self.logger.log(f"raw_vertex_data : {graph.vertices}")
+        return graph.edges, graph.vertices
     
     def add_switch(self, net, switch_name):
-        net.addSwitch(switch_name)
+        # dpid is pinned to the vertex number so prefixed bridge names keep the same ONOS device ids
+        net.addSwitch(self.bridge_name(switch_name), dpid=format(int(switch_name[1:]), '016x'))
     
     def add_host(self, net, host_name, host_ip):
         net.addHost(host_name, ip=host_ip)
     
-    def build_topo(self, edge_set, vertex_set, flow_count, link_bandwidth):
+    def host_ip(self, vertex, vertex_count):
+        """10.0.0.<vertex>/24 as before, spread over a /8 once there are more hosts than a /24 holds"""
+        if vertex_count < 255:
+            return '10.0.0.' + str(vertex) + '/24'
+        return f'10.{(vertex >> 16) & 255}.{(vertex >> 8) & 255}.{vertex & 255}/8'
+    
+    def build_topo(self, graph, link_bandwidth):
         """Build Mininet topology"""
-        self.logger.log(f'Number of nodes: {len(vertex_set)}')
-        self.logger.log(f'Number of links: {len(edge_set)}')
+        self.logger.log(f'Number of nodes: {len(graph.vertices)}')
+        self.logger.log(f'Number of links: {len(graph.edges)}')
         
-        for s_node, d_node in edge_set:
+        for s_node, d_node in graph.edges:
             self.logger.log(f"{s_node-1}, {d_node-1}")
             self.logger.log(f"{d_node-1}, {s_node-1}")
         
         self.logger.log('Topology file reading completed')
         
-        thread_manager = []
+        timer = PhaseTimer(self.logger)
         host_list = [0]
-        net = Mininet(controller=RemoteController, link=TCLink)
-        c0 = net.addController('c0', ip='127.0.0.1', port=6633)
+        net = self.network_class(controller=RemoteController, switch=self.switch_class, link=TCLink)
+        c0 = net.addController('c0', ip='127.0.0.1', port=self.controller_port)
         switch_map = {}
         host_map = {}
         host_to_IP = {}
-        traffic_flows = []
-        edge_switches = random.sample(vertex_set, int(len(vertex_set)))
-        
-        # Add switches
-        for vertex in vertex_set:
-            switch_name = 's' + str(vertex)
-            add_switch_thread = Thread(target=self.add_switch, args=(net, switch_name))
-            add_switch_thread.start()
-            thread_manager.append(add_switch_thread)
+        shaping = []
+        edge_switches = graph.vertices
+        vertex_count = max(graph.vertices)
         
-        # Generate traffic flows
-        for i in range(flow_count):
-            while True:
-                host_num = random.sample(host_list, 1)
-                traffic_flow = list(map(lambda x: 'h' + str(x) + '_' + str(host_num[0]), 
-                                       random.sample(edge_switches, 2)))
-                if (tuple(traffic_flow) not in traffic_flows and 
-                    tuple((traffic_flow[1], traffic_flow[0])) not in traffic_flows and 
-                    traffic_flow[0][1] != traffic_flow[1][1]):
-                    traffic_flows.append(tuple(traffic_flow))
-                    break
+        # Add switches (cheap, no OVS call happens before start)
+        for vertex in graph.vertices:
+            self.add_switch(net, 's' + str(vertex))
         
         # Add hosts
         for switch in edge_switches:
             for host_num in host_list:
                 host_name = 'h' + str(switch) + '_' + str(host_num)
-                host_ip = '10.0.0.' + str(switch) + '/24'
-                add_host_thread = Thread(target=self.add_host, args=(net, host_name, host_ip))
-                add_host_thread.start()
-                thread_manager.append(add_host_thread)
-        
-        # Wait for all threads to complete
-        for thread in thread_manager:
-            thread.join()
+                self.add_host(net, host_name, self.host_ip(switch, vertex_count))
+        timer.lap('nodes')
         
         # Create mappings
         for host in net.hosts:
             host_map[host.name] = host
         for switch in net.switches:
-            switch_map[switch.name] = switch
+            switch_map[self.logical_name(switch.name)] = switch
         
-        # Add host to switch links
+        # Links are created without shaping, the tc setup is applied in batch once OVS owns the ports
         for switch in edge_switches:
             for host_num in host_list:
-                net.addLink(switch_map['s' + str(switch)], 
-                           host_map['h' + str(switch) + '_' + str(host_num)],
-                           bw=1000, max_queue_size=1000, delay='0.5ms', use_htb=True)
+                link = net.addLink(switch_map['s' + str(switch)], 
+                                   host_map['h' + str(switch) + '_' + str(host_num)])
+                shaping.append((link, 1000))
         
-        # Add switch to switch links
-        for edge in edge_set:
-            net.addLink(switch_map['s' + str(edge[0])], switch_map['s' + str(edge[1])],
-                       bw=link_bandwidth, max_queue_size=1000, delay='0.5ms', use_htb=True)
+        for edge in graph.edges:
+            link = net.addLink(switch_map['s' + str(edge[0])], switch_map['s' + str(edge[1])])
+            shaping.append((link, link_bandwidth))
+        timer.lap('links')
         
         net.build()
         
-        for host in net.hosts:
-            host_to_IP[host.name] = host.IP()
+        self.index = TopologyIndex(net, self.logical_name)
+        host_to_IP.update(self.index.host_ip)
+        timer.lap('build')
         
         c0.start()
-        for switch in switch_map.values():
+        # One ovs-vsctl transaction creates every bridge, port and controller entry
+        switches = list(switch_map.values())
+        for switch in switches:
+            switch.batch = True
             switch.start([c0])
+        self.switch_class.batchStartup(switches)
+        timer.lap('switches')
+        
+        self.apply_link_shaping(net, shaping)
+        timer.lap('shaping')
         
+        timer.log_total('Topology build')
+        self.build_timings = timer.timings
         self.logger.log('Mininet topology deployment completed')
-        return net, host_map, switch_map, traffic_flows, host_to_IP
+        return net, host_map, switch_map, host_to_IP
+    
+    def shaping_commands(self, intf, bw):
+        """tc -batch lines equivalent to TCIntf.config(bw, delay='0.5ms', max_queue_size=1000, use_htb=True)"""
+        return [
+            f'qdisc replace dev {intf} root handle 5:0 htb default 1',
+            f'class replace dev {intf} parent 5:0 classid 5:1 htb rate {bw:f}Mbit burst 15k',
+            f'qdisc replace dev {intf} parent 5:1 handle 10: netem delay 0.5ms limit 1000',
+        ]
+    
+    def apply_link_shaping(self, net, shaping):
+        """Shape every link with one tc -batch run per network namespace"""
+        batches = {}
+        for link, bw in shaping:
+            for intf in [link.intf1, link.intf2]:
+                # Switch ports all live in the root namespace, host ports in their host's namespace
+                node = intf.node if intf.node.inNamespace else None
+                batches.setdefault(node, []).extend(self.shaping_commands(intf, bw))
+                intf.params.update(bw=bw, delay='0.5ms', max_queue_size=1000, use_htb=True)
+        
+        for node, commands in batches.items():
+            with tempfile.NamedTemporaryFile('w', suffix='.tc', delete=False) as f:
+                f.write('\n'.join(commands) + '\n')
+                batch_file = f.name
+            try:
+                if node is None:
+                    output = quietRun(f'tc -force -batch {batch_file}')
+                else:
+                    output = node.cmd(f'tc -force -batch {batch_file}')
+                if output.strip():
+                    self.logger.log(f'tc batch output: {output.strip()}')
+            finally:
+                os.remove(batch_file)
     
     def create_host_to_addr_location_file(self, net, config_manager):
         """Create host address location file"""
@@ -180,22 +231,9 @@ class TopologyManager:
         for host in net.hosts:
             host_map[host.name] = host.MAC()
         
-        for switch in net.switches:
-            for _host in net.hosts:
-                connection_list = switch.connectionsTo(_host)
-                if connection_list != []:
-                    for connection in connection_list:
-                        node = connection[0].name
-                        host = connection[1].name
-                        node_split = node.split('-')
-                        node_name = node_split[0]
-                        node_port = node_split[1].replace('eth', '')
-                        host_split = host.split('-')
-                        host_name = host_split[0]
-                        host_mac = host_map[host_name]
-                        host_port = host_split[1].replace('eth', '')
-                        host_to_addr_location.setdefault(host_mac, {})
-                        host_to_addr_location[host_mac][node_name] = node_port
+        for host_mac, (node_name, node_port) in self.index.host_location.items():
+            host_to_addr_location.setdefault(host_mac, {})
+            host_to_addr_location[host_mac][node_name] = node_port
         
         config_manager.build_json('./host_to_addr_location.json', host_to_addr_location)
         self.logger.log('Host location file creation completed')
@@ -213,24 +251,12 @@ class TopologyManager:
         """Create switch connection data"""
         u_v_connection = {}
         for edge in edge_set:
-            connection_list = switch_map['s' + str(edge[0])].connectionsTo(switch_map['s' + str(edge[1])])
-            for connection in connection_list:
-                u = connection[0].name
-                v = connection[1].name
-                u_split = u.split('-')
-                u_name = u_split[0]
-                u_port = u_split[1].replace('eth', '')
-                v_split = v.split('-')
-                v_name = v_split[0]
-                v_port = v_split[1].replace('eth', '')
-                
-                if u not in u_v_connection.keys():
-                    u_v_connection.setdefault(u_name, {})
-                if v not in u_v_connection.keys():
-                    u_v_connection.setdefault(v_name, {})
-                
-                u_v_connection[u_name][v_name] = u_port
-                u_v_connection[v_name][u_name] = v_port
+            u_name = 's' + str(edge[0])
+            v_name = 's' + str(edge[1])
+            u_v_connection.setdefault(u_name, {})
+            u_v_connection.setdefault(v_name, {})
+            u_v_connection[u_name][v_name] = self.index.port(u_name, v_name)
+            u_v_connection[v_name][u_name] = self.index.port(v_name, u_name)
         
         self.logger.log('Switch connection data creation completed')
         return u_v_connection
@@ -238,19 +264,7 @@ class TopologyManager:
     def check_controller_connectivity(self, edge):
         """Check controller connectivity"""
         self.logger.log('Check the connectivity of SDN controller')
-        url = 'http://localhost:8181/onos/v1/topology/clusters/0/links'
-        headers = {'Accept': 'application/json'}
-        auth = ('onos', 'rocks')
-        
-        while True:
-            time.sleep(5)
-            try:
-                r = requests.get(url, headers=headers, auth=auth)
-                raw_topo = r.json()['links']
-                if int(len(raw_topo) / 2) == edge:
-                    break
-            except:
-                self.logger.log('check_controller_connectivity error')
-                continue
+        self.readiness.wait_for('controller links', self.readiness.controller_links(edge),
+                                timeout=300, interval=0.2, max_interval=2)
         
         self.logger.log('All SDN switches and SDN controller connections are established') 
\ No newline at end of file
@@ -3,182 +3,269 @@ Traffic management module
 Handle traffic generation, testing and data collection
 """
 
+import json
+import math
 import os
-import random
+import selectors
 import subprocess
+import sys
 import time
-from threading import Thread, Event
+
+
+# Started once in every host that takes part in a trial, see traffic_agent.py
+AGENT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traffic_agent.py')
 
 
 class TrafficManager:
     
-    def __init__(self, logger, config_manager):
+    # Extra time a client gets beyond its -t duration before the agent kills it
+    CLIENT_GRACE = 15
+    # Shortest -t of an affected client, in seconds
+    MIN_CLIENT_TIME = 25
+    
+    SETUP_COMMANDS = [
+        "sudo iptables -P INPUT ACCEPT",
+        "sudo iptables -P FORWARD ACCEPT",
+        "sudo iptables -P OUTPUT ACCEPT",
+        "sudo iptables -F"
+    ]
+    
+    def __init__(self, logger, config_manager, readiness):
         self.logger = logger
         self.config_manager = config_manager
+        self.readiness = readiness
         self.sub_process_manager = []
         self.BASE_PORT = 50000
+        # TopologyIndex of the current network, set once the topology is built
+        self.topology_index = None
+        self.agents = {}
+        self.agent_events = {}
+        self.agent_buffers = {}
+        # {host: {client process: deadline}} of the affected clients whose report is not written yet
+        self.pending_reports = {}
+        self.selector = None
+        self.failures = []
+        # Launch epoch of every client of the last trial, by flow index
+        self.client_epochs = {}
+        # -J, or -J --json-stream for iperf3 >= 3.17
+        self.json_flags = ['-J']
+        # Length of the link timeline the affected flows have to cover, in seconds
+        self.trial_duration = 25
     
-    def ping(self, src_host, dst_host):
-        """Execute ping test"""
-        src_host.pexec('ping -c1 ' + dst_host.IP())
-    
-    def tcpdump(self, host, cmd):
-        """Execute tcpdump"""
-        host.cmd(cmd)
-    
-    def iperf_server_1(self, dst_host, cmd):
-        """Start iperf server (simple version)"""
-        process = dst_host.popen(str(cmd))
-        self.sub_process_manager.append(process)
-    
-    def iperf_server_2(self, src_host, dst_host, cmd, trace_folder, label):
-        """Start iperf server (with data collection)"""
-        path = trace_folder + 'markov_chain/' + label + '/' + str(src_host) + '_' + str(dst_host) + '_s.json'
-        with open(path, 'w') as outfile:
-            process = dst_host.popen(str(cmd), shell=True, stdout=outfile, stderr=subprocess.PIPE)
-            self.sub_process_manager.append(process)
-    
-    def iperf_server_2_fixed(self, src_host, dst_host, cmd, trace_folder, label):
-        """Start iperf server (fixed version)"""
-        path = trace_folder + 'fixed_version/' + label + '/' + str(src_host) + '_' + str(dst_host) + '_s.json'
-        with open(path, 'w') as outfile:
-            process = dst_host.popen(str(cmd), shell=True, stdout=outfile, stderr=subprocess.PIPE)
-            self.sub_process_manager.append(process)
-    
-    def iperf_send_1(self, traffic_model, src_host, dst_host, index, flow_count, throughput, start_event, use_port, trace_folder, label):
-        """Send iperf traffic (collect data)"""
-        if traffic_model == 1:
-            cmd = ['iperf3', '-c', dst_host.IP(), '-t', '25', '-b', str(throughput) + 'M', '-J', '-p', str(use_port)]
-            path = trace_folder + 'markov_chain/' + label + '/' + str(src_host) + '_' + str(dst_host) + '.json'
-        elif traffic_model == 2:
-            cmd = ['iperf3', '-c', dst_host.IP(), '-t', '25', '-b', str(throughput) + 'M', '-u', '-J', '-p', str(use_port)]
-            path = trace_folder + 'markov_chain/' + label + '/' + str(src_host) + '_' + str(dst_host) + '.json'
-        
-        start_event.wait()
-        with open(path, 'w') as outfile:
-            process = src_host.popen(cmd, shell=True, stdout=outfile, stderr=subprocess.PIPE)
-            self.sub_process_manager.append(process)
-            self.logger.log_traffic_flow(index, src_host, dst_host)
-            self.logger.log(f'here!!!!,src:{src_host.IP()} ,dst:{dst_host.IP()}, cmd:{" ".join(cmd)} ,TraceFolder:{trace_folder} , label:{label}')
-    
-    def iperf_send_1_fixed(self, traffic_model, src_host, dst_host, index, flow_count, throughput, start_event, use_port, trace_folder, label):
-        """Send iperf traffic (fixed version, collect data)"""
-        if traffic_model == 1:
-            cmd = ['iperf3', '-c', dst_host.IP(), '-t', '25', '-b', str(throughput) + 'M', '-J', '-i', '1', '-p', str(use_port)]
-            path = trace_folder + 'fixed_version/' + label + '/' + str(src_host) + '_' + str(dst_host) + '.json'
-        elif traffic_model == 2:
-            cmd = ['iperf3', '-c', dst_host.IP(), '-t', '25', '-b', str(throughput) + 'M', '-u', '-J', '-i', '1', '-p', str(use_port)]
-            path = trace_folder + 'fixed_version/' + label + '/' + str(src_host) + '_' + str(dst_host) + '.json'
-        
-        start_event.wait()
-        with open(path, 'w') as outfile:
-            process = src_host.popen(cmd, shell=True, stdout=outfile, stderr=subprocess.PIPE)
-            self.sub_process_manager.append(process)
-            self.logger.log_traffic_flow(index, src_host, dst_host)
-            self.logger.log(f'here!!!!,src:{src_host.IP()} ,dst:{dst_host.IP()}, cmd:{" ".join(cmd)} ,TraceFolder:{trace_folder} , label:{label}')
-    
-    def iperf_send_2(self, traffic_model, src_host, dst_host, index, flow_count, throughput, start_event, use_port):
-        """Send iperf traffic (no data collection)"""
-        if traffic_model == 1:
-            cmd = ['iperf3', '-c', dst_host.IP(), '-t', '60', '-b', str(throughput) + 'M', '-p', str(use_port)]
-        elif traffic_model == 2:
-            cmd = ['iperf3', '-c', dst_host.IP(), '-t', '60', '-b', str(throughput) + 'M', '-u', '-p', str(use_port)]
-        
-        process = src_host.popen(str(cmd))
-        self.sub_process_manager.append(process)
-        self.logger.log_traffic_flow(index, src_host, dst_host)
-        self.logger.log(f'here!!!!,src:{src_host.IP()} ,dst:{dst_host.IP()}, cmd:{" ".join(cmd)}')
+    def host_ip(self, host):
+        return self.topology_index.host_ip[host.name]
     
-    def setup_traffic_flows(self, traffic_flows, host_map, trace_folder, label, traffic_model, throughput, start_event, mode, affected_traffic_flows):
-        """Setup traffic flows"""
-        thread_manager = []
+    def server_job(self, traffic_model, src_host, dst_host, use_port, affected, mode, trace_folder, label):
+        """iperf server of one flow; UDP servers of affected flows keep their JSON report"""
+        job = {'port': use_port, 'argv': ['iperf3', '-s', '-p', str(use_port)], 'output': None}
+        if affected and traffic_model == 2:
+            sub_folder = 'markov_chain' if mode == 'markov' else 'fixed_version'
+            job['argv'] = ['iperf3', '-s'] + self.json_flags + ['-p', str(use_port)]
+            if mode != 'markov':
+                job['argv'] += ['-i', '0.1']
+            job['output'] = trace_folder + sub_folder + '/' + label + '/' + src_host + '_' + dst_host + '_s.json'
+        return job
+    
+    def client_job(self, traffic_model, src_host, dst_host, index, throughput, use_port, affected, mode, trace_folder, label):
+        """iperf client of one flow; affected flows cover the link timeline and keep their JSON report"""
+        dst_ip = self.topology_index.host_ip[dst_host]
+        udp = ['-u'] if traffic_model == 2 else []
+        affected_time = max(self.MIN_CLIENT_TIME, math.ceil(self.trial_duration))
+        if not affected:
+            background_time = max(60, affected_time + 35)
+            argv = ['iperf3', '-c', dst_ip, '-t', str(background_time), '-b', str(throughput) + 'M'] + udp + ['-p', str(use_port)]
+            return {'index': index, 'argv': argv, 'output': None, 'deadline': background_time + self.CLIENT_GRACE}
         
-        # Setup iptables
-        commands = [
-            "sudo iptables -P INPUT ACCEPT",
-            "sudo iptables -P FORWARD ACCEPT",
-            "sudo iptables -P OUTPUT ACCEPT",
-            "sudo iptables -F"
-        ]
+        sub_folder = 'markov_chain' if mode == 'markov' else 'fixed_version'
+        argv = ['iperf3', '-c', dst_ip, '-t', str(affected_time), '-b', str(throughput) + 'M'] + udp + self.json_flags
+        if mode != 'markov':
+            argv += ['-i', '1']
+        argv += ['-p', str(use_port)]
+        output = trace_folder + sub_folder + '/' + label + '/' + src_host + '_' + dst_host + '.json'
+        return {'index': index, 'argv': argv, 'output': output, 'deadline': affected_time + self.CLIENT_GRACE}
+    
+    def plan_host_jobs(self, traffic_flows, trace_folder, label, traffic_model, throughput, mode, affected_traffic_flows):
+        """Group every setup, ping, server and client of the trial by the host that runs it"""
+        jobs = {}
         
-        for cmd in commands:
-            for src_host, dst_host in traffic_flows:
-                host_map[src_host].popen(cmd, shell=True)
-                host_map[dst_host].popen(cmd, shell=True)
+        def host_job(host_name):
+            return jobs.setdefault(host_name, {'host': host_name, 'setup': list(self.SETUP_COMMANDS),
+                                               'ping': [], 'servers': [], 'clients': []})
         
-        # Execute ping tests
+        affected_traffic_flows = set(affected_traffic_flows)
         for idx, (src_host, dst_host) in enumerate(traffic_flows):
-            ping_thread = Thread(target=self.ping, args=(host_map[src_host], host_map[dst_host]))
-            ping_thread.start()
-            thread_manager.append(ping_thread)
-            time.sleep(0.05)
-        
-        for thread in thread_manager:
-            thread.join()
+            use_port = self.BASE_PORT + idx
+            affected = (src_host, dst_host) in affected_traffic_flows
+            src_job = host_job(src_host)
+            dst_job = host_job(dst_host)
+            dst_ip = self.topology_index.host_ip[dst_host]
+            if dst_ip not in src_job['ping']:
+                src_job['ping'].append(dst_ip)
+            dst_job['servers'].append(self.server_job(
+                traffic_model, src_host, dst_host, use_port, affected, mode, trace_folder, label))
+            src_job['clients'].append(self.client_job(
+                traffic_model, src_host, dst_host, idx + 1, throughput, use_port, affected, mode, trace_folder, label))
+        return jobs
+    
+    def start_agents(self, jobs, host_map):
+        """Start one traffic agent per host and hand it its job spec"""
+        self.selector = selectors.DefaultSelector()
+        for host_name, job in jobs.items():
+            agent = host_map[host_name].popen([sys.executable, '-u', AGENT_SCRIPT], stdin=subprocess.PIPE,
+                                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            agent.stdin.write((json.dumps(job) + '\n').encode())
+            agent.stdin.flush()
+            self.agents[host_name] = agent
+            self.agent_events[host_name] = set()
+            self.agent_buffers[host_name] = b''
+            self.pending_reports[host_name] = {f"client:{client['index']}": client['deadline']
+                                               for client in job['clients'] if client['output']}
+            self.sub_process_manager.append(agent)
+            self.selector.register(agent.stdout, selectors.EVENT_READ, host_name)
+    
+    def send_agents(self, command):
+        for host_name, agent in self.agents.items():
+            try:
+                agent.stdin.write((command + '\n').encode())
+                agent.stdin.flush()
+            except (BrokenPipeError, ValueError):
+                self.logger.log(f'Traffic agent {host_name} is gone')
+    
+    def poll_agents(self, timeout):
+        """Read what the agents wrote within timeout and record their events"""
+        for key, _ in self.selector.select(timeout):
+            host_name = key.data
+            chunk = os.read(key.fd, 65536)
+            if not chunk:
+                self.selector.unregister(key.fileobj)
+                self.agent_events[host_name].add('exited')
+                continue
+            *lines, self.agent_buffers[host_name] = (self.agent_buffers[host_name] + chunk).split(b'\n')
+            for line in lines:
+                self.handle_agent_line(host_name, line.decode(errors='replace'))
+    
+    def handle_agent_line(self, host_name, line):
+        try:
+            message = json.loads(line)
+        except ValueError:
+            if line.strip():
+                self.logger.log(f'Traffic agent {host_name}: {line.strip()}')
+            return
+        event = message['event']
+        self.agent_events[host_name].add(event)
+        if event == 'error':
+            self.fail(host_name, f"{message.get('process')}: {message['message']}")
+        elif event == 'deadline':
+            self.fail(host_name, f"{message['process']}: killed after its {message['deadline']}s deadline")
+        elif event == 'exit':
+            self.pending_reports.get(host_name, {}).pop(message['process'], None)
+            if message['returncode'] != 0 and not message['expected']:
+                self.fail(host_name, f"{message['process']}: exited with {message['returncode']} {message['stderr']}")
+        elif event == 'started':
+            for index, epoch in message['epochs'].items():
+                self.client_epochs[int(index)] = epoch
+        elif event == 'stopped':
+            self.logger.log(f"Traffic agent {host_name} exit codes: {message['exit_codes']}")
+    
+    def fail(self, host_name, reason):
+        self.failures.append((host_name, reason))
+        self.logger.log(f'Traffic failure on {host_name}: {reason}')
+    
+    def check_processes(self):
+        """Raise as soon as an agent reported a failed traffic process"""
+        if self.failures:
+            raise RuntimeError(f'Traffic failure: {self.failures[0][0]} {self.failures[0][1]}')
+    
+    def supervise(self, duration):
+        """Sleep for duration while handling agent events, raising on the first failure"""
+        deadline = time.monotonic() + duration
+        while True:
+            self.check_processes()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self.selector is None or not self.selector.get_map():
+                time.sleep(remaining)
+            else:
+                self.poll_agents(remaining)
+    
+    def wait_agents(self, event, timeout=30, fail_fast=True):
+        """Wait until every agent reported event; fail at once if one exited or reported a failure"""
+        def condition():
+            self.poll_agents(0.05)
+            pending = [events for events in self.agent_events.values() if event not in events]
+            return (not pending or any('exited' in events for events in pending)
+                    or (fail_fast and bool(self.failures)))
         
-        thread_manager = []
+        self.readiness.wait_for(f'traffic agents {event}', condition, timeout=timeout, interval=0.001, max_interval=0.01)
+        exited = [host_name for host_name, events in self.agent_events.items()
+                  if event not in events and 'exited' in events]
+        if exited:
+            raise RuntimeError(f'Traffic agents exited before {event}: {exited}')
+        if fail_fast:
+            self.check_processes()
+    
+    def wait_reports(self):
+        """Wait until every affected client exited and wrote its report, at most until its deadline"""
+        pending = [(int(name.split(':')[1]), deadline) for clients in self.pending_reports.values()
+                   for name, deadline in clients.items()]
+        if not pending or self.selector is None:
+            return
+        now = time.time()
+        timeout = max(self.client_epochs.get(index, now) + deadline for index, deadline in pending) - now
         
-        # Start iperf servers and clients
-        for idx, (src_host, dst_host) in enumerate(traffic_flows):
-            use_port = self.BASE_PORT + idx
-            
-            # Non-affected traffic flows
-            if (src_host, dst_host) not in affected_traffic_flows:
-                cmd = "iperf3 -s -p " + str(use_port)
-                iperf_server_thread = Thread(target=self.iperf_server_1, args=(host_map[dst_host], cmd))
-                iperf_server_thread.setDaemon(True)
-                iperf_server_thread.start()
-                thread_manager.append(iperf_server_thread)
-                
-                iperf_send_thread = Thread(target=self.iperf_send_2, 
-                                         args=(traffic_model, host_map[src_host], host_map[dst_host], 
-                                               idx + 1, len(traffic_flows), throughput, start_event, use_port))
-                iperf_send_thread.setDaemon(True)
-                iperf_send_thread.start()
-                thread_manager.append(iperf_send_thread)
+        def condition():
+            self.poll_agents(0.05)
+            return all(not clients or 'exited' in self.agent_events[host_name]
+                       for host_name, clients in self.pending_reports.items())
         
-        time.sleep(5)
+        self.readiness.wait_for('client reports written', condition, timeout=max(0, timeout),
+                                interval=0.001, max_interval=0.01, required=False)
+    
+    def setup_traffic_flows(self, traffic_flows, host_map, trace_folder, label, traffic_model, throughput, start_event, mode, affected_traffic_flows=None):
+        """Setup traffic flows"""
+        if affected_traffic_flows is None:
+            affected_traffic_flows = getattr(self, 'affected_traffic_flows', [])
         
-        # Affected traffic flows
-        for idx, (src_host, dst_host) in enumerate(traffic_flows):
-            use_port = self.BASE_PORT + idx
-            
-            if (src_host, dst_host) in getattr(self, 'affected_traffic_flows', []):
-                if traffic_model == 2:
-                    if mode == 'markov':
-                        cmd = "iperf3 -s -J -p " + str(use_port)
-                        iperf_server_thread = Thread(target=self.iperf_server_2, 
-                                                   args=(host_map[src_host], host_map[dst_host], cmd, trace_folder, label))
-                    else:
-                        cmd = "iperf3 -s -J -p " + str(use_port) + " -i 0.1"
-                        iperf_server_thread = Thread(target=self.iperf_server_2_fixed, 
-                                                   args=(host_map[src_host], host_map[dst_host], cmd, trace_folder, label))
-                elif traffic_model == 1:
-                    cmd = "iperf3 -s -p " + str(use_port)
-                    iperf_server_thread = Thread(target=self.iperf_server_1, args=(host_map[dst_host], cmd))
-                
-                iperf_server_thread.setDaemon(True)
-                iperf_server_thread.start()
-                thread_manager.append(iperf_server_thread)
-                
-                if mode == 'markov':
-                    iperf_send_thread = Thread(target=self.iperf_send_1, 
-                                             args=(traffic_model, host_map[src_host], host_map[dst_host], 
-                                                   idx + 1, len(traffic_flows), throughput, start_event, use_port, trace_folder, label))
-                else:
-                    iperf_send_thread = Thread(target=self.iperf_send_1_fixed, 
-                                             args=(traffic_model, host_map[src_host], host_map[dst_host], 
-                                                   idx + 1, len(traffic_flows), throughput, start_event, use_port, trace_folder, label))
-                
-                iperf_send_thread.setDaemon(True)
-                iperf_send_thread.start()
-                thread_manager.append(iperf_send_thread)
+        self.client_epochs = {}
+        jobs = self.plan_host_jobs(traffic_flows, trace_folder, label, traffic_model, throughput, mode,
+                                   affected_traffic_flows)
+        self.start_agents(jobs, host_map)
         
+        # Every server of every host listens before any client is released
+        self.wait_agents('ready')
+        self.send_agents('start')
+        self.wait_agents('started')
         start_event.set()
-        return thread_manager
+        
+        for idx, (src_host, dst_host) in enumerate(traffic_flows):
+            self.logger.log_traffic_flow(idx + 1, host_map[src_host], host_map[dst_host])
+        return list(self.agents.values())
+    
+    def flow_start_epochs(self, traffic_flows):
+        """{'<src>_<dst>': launch epoch} of the clients of the last trial"""
+        return {f'{src_host}_{dst_host}': self.client_epochs[idx + 1]
+                for idx, (src_host, dst_host) in enumerate(traffic_flows) if idx + 1 in self.client_epochs}
     
-    def cleanup_processes(self):
-        """Cleanup processes"""
+    def cleanup_processes(self, abort=False):
+        """Stop the traffic agents; unless aborting, the affected clients first finish their reports"""
+        if self.agents:
+            if not abort:
+                self.wait_reports()
+            self.send_agents('abort' if abort else 'stop')
+            try:
+                self.wait_agents('stopped', timeout=10, fail_fast=False)
+            except (RuntimeError, TimeoutError) as e:
+                self.logger.log(f'Traffic agents stop: {str(e)}')
+            self.selector.close()
         for sub_process in self.sub_process_manager:
-            sub_process.kill()
-        self.sub_process_manager = [] 
\ No newline at end of file
+            if sub_process.poll() is None:
+                sub_process.kill()
+            sub_process.wait()
+        self.sub_process_manager = []
+        self.agents = {}
+        self.agent_events = {}
+        self.agent_buffers = {}
+        self.pending_reports = {}
+        self.selector = None
+        self.failures = []
@@ -0,0 +1,193 @@
+"""
+Traffic agent
+Runs inside one Mininet host and supervises all of that host's traffic processes
+
+The harness writes one JSON job spec line to stdin, then "start" to release the
+clients and "stop" to end the trial ("abort" to end it without waiting for the
+clients that write a report). Progress is reported as JSON lines on stdout.
+"""
+
+import asyncio
+import json
+import re
+import signal
+import sys
+import time
+
+
+# stderr lines that mean the process will not deliver usable data
+FAILURE_PATTERNS = ['error', 'Address already in use', 'unable to', 'Connection refused']
+STDERR_TAIL = 5
+PID_PATTERN = re.compile(r'pid=(\d+)')
+# Time the interrupted processes get to write their report before they are killed
+STOP_TIMEOUT = 5
+
+
+def emit(event, **fields):
+    fields['event'] = event
+    sys.stdout.write(json.dumps(fields) + '\n')
+    sys.stdout.flush()
+
+
+class Supervisor:
+    """Launch, watch and reap the traffic processes of one host"""
+
+    def __init__(self, host):
+        self.host = host
+        self.watchers = []
+        self.processes = {}
+        self.exit_codes = {}
+        self.launch_epochs = {}
+        # Clients whose -J report is only written when they exit on their own
+        self.reports = set()
+        self.stopping = False
+
+    async def launch(self, name, job):
+        output = open(job['output'], 'w') if job.get('output') else asyncio.subprocess.DEVNULL
+        self.launch_epochs[name] = time.time()
+        try:
+            process = await asyncio.create_subprocess_exec(*job['argv'], stdout=output,
+                                                           stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            emit('error', host=self.host, process=name, message=str(e))
+            return
+        finally:
+            if job.get('output'):
+                output.close()
+        self.processes[name] = process
+        if name.startswith('client:') and job.get('output'):
+            self.reports.add(name)
+        self.watchers.append(asyncio.ensure_future(self.watch(name, process, job.get('deadline'))))
+
+    async def drain(self, name, process, tail):
+        """Stream stderr so the pipe never fills, reporting failure lines as they appear"""
+        reported = False
+        async for raw_line in process.stderr:
+            line = raw_line.decode(errors='replace').strip()
+            if not line:
+                continue
+            tail.append(line)
+            del tail[:-STDERR_TAIL]
+            if not reported and not self.stopping and any(pattern in line for pattern in FAILURE_PATTERNS):
+                reported = True
+                emit('error', host=self.host, process=name, message=line)
+
+    async def watch(self, name, process, deadline):
+        tail = []
+        start_time = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.gather(self.drain(name, process, tail), process.wait()), deadline)
+        except asyncio.TimeoutError:
+            emit('deadline', host=self.host, process=name, deadline=deadline)
+            process.kill()
+            await process.wait()
+        self.exit_codes[name] = process.returncode
+        emit('exit', host=self.host, process=name, returncode=process.returncode,
+             expected=self.stopping, elapsed=round(time.monotonic() - start_time, 3), stderr=tail)
+
+    async def stop(self, abort=False):
+        """Interrupt the servers and background clients; report clients run to their end unless aborting"""
+        self.stopping = True
+        interrupted = []
+        for name, process in self.processes.items():
+            if process.returncode is None and (abort or name not in self.reports):
+                try:
+                    # iperf3 still writes its JSON report on SIGINT, not on SIGKILL
+                    process.send_signal(signal.SIGINT)
+                except ProcessLookupError:
+                    continue
+                interrupted.append(process)
+        watchers = asyncio.gather(*self.watchers)
+        try:
+            await asyncio.wait_for(asyncio.shield(watchers), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            for process in interrupted:
+                if process.returncode is None:
+                    process.kill()
+            await watchers
+
+
+async def run_quiet(*argv, shell=False):
+    if shell:
+        process = await asyncio.create_subprocess_shell(argv[0], stdout=asyncio.subprocess.DEVNULL,
+                                                        stderr=asyncio.subprocess.DEVNULL)
+        await process.wait()
+        return ''
+    process = await asyncio.create_subprocess_exec(*argv, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.DEVNULL)
+    output, _ = await process.communicate()
+    return output.decode()
+
+
+async def listening_ports(pids):
+    """Ports listened on by the given processes (a stale listener on the same port does not count)"""
+    ports = set()
+    for line in (await run_quiet('ss', '-ltunpH')).splitlines():
+        fields = line.split()
+        if len(fields) >= 5 and set(PID_PATTERN.findall(line)) & pids:
+            port = fields[4].rsplit(':', 1)[-1]
+            if port.isdigit():
+                ports.add(int(port))
+    return ports
+
+
+async def wait_listening(ports, supervisor, timeout=10):
+    pids = set(str(process.pid) for process in supervisor.processes.values())
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while not ports <= await listening_ports(pids):
+        # A server that already exited will never listen, its exit event says why
+        if time.monotonic() >= deadline or supervisor.exit_codes:
+            return False
+        await asyncio.sleep(delay)
+        delay = min(delay * 1.5, 0.5)
+    return True
+
+
+async def stdin_reader():
+    reader = asyncio.StreamReader()
+    await asyncio.get_event_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    return reader
+
+
+async def run():
+    reader = await stdin_reader()
+    spec = json.loads(await reader.readline())
+    supervisor = Supervisor(spec['host'])
+
+    for cmd in spec.get('setup', []):
+        await run_quiet(cmd, shell=True)
+
+    # One ping per distinct destination, all in flight together
+    await asyncio.gather(*[run_quiet('ping', '-c1', ip) for ip in spec.get('ping', [])])
+
+    for job in spec.get('servers', []):
+        await supervisor.launch(f"server:{job['port']}", job)
+    ports = set(job['port'] for job in spec.get('servers', []))
+    if not await wait_listening(ports, supervisor):
+        emit('error', host=spec['host'], process='servers',
+             message=f'not listening on {sorted(ports)}')
+    emit('ready', host=spec['host'], listening=sorted(ports))
+
+    while True:
+        command = (await reader.readline()).decode().strip()
+        if command == 'start':
+            for job in spec.get('clients', []):
+                await supervisor.launch(f"client:{job['index']}", job)
+            emit('started', host=spec['host'],
+                 epochs={job['index']: supervisor.launch_epochs[f"client:{job['index']}"]
+                         for job in spec.get('clients', [])})
+        elif command in ('stop', 'abort', ''):
+            break
+
+    # A closed stdin means the harness is gone, nobody waits for the reports anymore
+    await supervisor.stop(abort=command != 'stop')
+    emit('stopped', host=spec['host'], exit_codes=supervisor.exit_codes)
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
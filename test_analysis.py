@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the trial analysis engine
+"""
+
+import json
+import math
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import numpy as np
+
+from src.analysis import TrialAnalyzer
+from src.iperf_parser import IperfParser
+
+
+# Client h1_0 -> h2_0 drops to 0 during fnlos and is back at its los throughput 1s into the
+# last phase; client h3_0 -> h4_0 never recovers; the server report of h1_0 -> h2_0 is ignored
+# by the client metrics
+FLOW_BPS = [
+    [10, 10, 10, 10, 10, 0, 0, 5, 10, 10],
+    [10, 10, 10, 10, 10, 0, 0, 0, 0, 0],
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+]
+
+
+def write_trial(folder):
+    record = {'label': 'SDFFR_MP_20_35_1000_10_2_20_30_1', 'states': [0, 2, 0],
+              'status_start': [1000.0, 1005.0, 1007.0], 'status_stop': [1005.0, 1007.0, 1010.0],
+              'change': [1000.0, 1005.2, 1007.2]}
+    with open(os.path.join(folder, TrialAnalyzer.RECORD_FILE), 'w') as f:
+        json.dump(record, f)
+
+    count = len(FLOW_BPS[0])
+    starts = np.tile(np.arange(count, dtype=float), len(FLOW_BPS))
+    np.savez_compressed(
+        os.path.join(folder, IperfParser.SAMPLE_FILE),
+        flow_src=np.array(['h1_0', 'h3_0', 'h1_0']), flow_dst=np.array(['h2_0', 'h4_0', 'h2_0']),
+        flow_role=np.array(['client', 'client', 'server']), flow_start=np.array([1000.0, 1000.0, 1000.0]),
+        flow_error=np.array(['', '', '']),
+        flow_id=np.repeat(np.arange(len(FLOW_BPS), dtype=np.int32), count),
+        start=starts, end=starts + 1, bits_per_second=np.array(FLOW_BPS, dtype=float).ravel(),
+        bytes=np.zeros(starts.size, dtype=np.int64), jitter_ms=np.zeros(starts.size, dtype=np.float32),
+        lost_packets=np.tile([0, 0, 0, 0, 0, 10, 10, 0, 0, 0], len(FLOW_BPS)),
+        packets=np.full(starts.size, 10), retransmits=np.full(starts.size, -1))
+
+
+def test_recovery_delay(tmp_path):
+    write_trial(str(tmp_path))
+    label, result = TrialAnalyzer(['RecoveryDelay']).analyze(str(tmp_path))
+
+    assert label == 'SDFFR_MP_20_35_1000_10_2_20_30_1'
+    assert list(result) == ['RecoveryDelay']
+    delays = result['RecoveryDelay']
+    assert sorted(delays) == ['2:fnlos', '3:los']
+    # First sample at or above 90% of the los median starts at 1008
+    assert math.isclose(delays['2:fnlos']['h1_0_h2_0'], 2.8)
+    assert math.isclose(delays['3:los']['h1_0_h2_0'], 0.8)
+    assert math.isnan(delays['3:los']['h3_0_h4_0'])
+    assert 'h1_0_h2_0' in delays['3:los'] and len(delays['3:los']) == 2
+
+
+def test_throughput_and_packet_loss(tmp_path):
+    write_trial(str(tmp_path))
+    _, result = TrialAnalyzer().analyze(str(tmp_path))
+
+    throughput = result['Throughput']
+    assert throughput['per_flow'] == {'h1_0_h2_0': 7.5, 'h3_0_h4_0': 5.0}
+    assert throughput['aggregate'] == 12.5
+    assert throughput['per_phase']['1:los'] == 20.0
+    assert throughput['per_phase']['2:fnlos'] == 0.0
+    assert math.isclose(throughput['per_phase']['3:los'], 25 / 3)
+    assert result['PacketLoss']['2:fnlos'] == 1.0
+    assert result['PacketLoss']['1:los'] == 0.0
+    assert math.isclose(result['TOTALPacketLoss'], 0.2)
+
+
+def test_trial_folders(tmp_path):
+    (tmp_path / 'done').mkdir()
+    write_trial(str(tmp_path / 'done'))
+    (tmp_path / 'unfinished').mkdir()
+    (tmp_path / 'unfinished' / TrialAnalyzer.RECORD_FILE).write_text('{}')
+    assert TrialAnalyzer.trial_folders(str(tmp_path)) == [str(tmp_path / 'done')]
+    assert TrialAnalyzer.trial_folders(str(tmp_path / 'missing')) == []
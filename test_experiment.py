@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for the experiment runner's handling of a failed network setup
+"""
+
+import json
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import pytest
+
+from src.experiment import ExperimentRunner
+from src.graph import TopologyGraph
+
+
+TEST_CONFIG = {
+    "UserName": "test",
+    "OutputFile": "test_result.pkl",
+    "FailureMode": "single",
+    "Mode": "fixed",
+    "Algorithm": ["SDFFR_MP"],
+    "Vertex": [3],
+    "Edge": [2],
+    "LinkBandwidth": [1000],
+    "Throughput": [10],
+    "TrafficModel": [1],
+    "ControlPlaneDelay": [20],
+    "FlowCount": [1],
+    "Trial": [1, 1],
+    "LinkChangeTime": [5]
+}
+
+
+class StoppableNet:
+    def __init__(self):
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    config_file = tmp_path / 'test_config.json'
+    config_file.write_text(json.dumps(TEST_CONFIG))
+    monkeypatch.chdir(tmp_path)
+    return ExperimentRunner(str(config_file), 'test')
+
+
+def test_network_stopped_when_controller_unreachable(runner, monkeypatch):
+    net = StoppableNet()
+    topology_manager = runner.topology_manager
+    monkeypatch.setattr(topology_manager, 'build_topo', lambda graph, bw: (net, {}, {}, {}))
+    monkeypatch.setattr(topology_manager, 'create_host_to_addr_location_file', lambda net, config: ({}, {}))
+    monkeypatch.setattr(topology_manager, 'create_traffic_flows_file', lambda flows, addr, config: None)
+    monkeypatch.setattr(topology_manager, 'create_u_v_connection', lambda switch_map, edges: {})
+
+    def unreachable(edge_count):
+        raise TimeoutError('controller links not ready after 300s')
+    monkeypatch.setattr(topology_manager, 'check_controller_connectivity', unreachable)
+
+    graph = TopologyGraph([1, 2, 3], [(1, 2), (2, 3)])
+    with pytest.raises(TimeoutError):
+        runner.setup_network_topology(graph, [('h1_0', 'h3_0')], 1000)
+    assert net.stopped
+
+
+def test_network_kept_when_setup_succeeds(runner, monkeypatch):
+    net = StoppableNet()
+    topology_manager = runner.topology_manager
+    monkeypatch.setattr(topology_manager, 'build_topo', lambda graph, bw: (net, {}, {}, {}))
+    monkeypatch.setattr(topology_manager, 'create_host_to_addr_location_file', lambda net, config: ({}, {}))
+    monkeypatch.setattr(topology_manager, 'create_traffic_flows_file', lambda flows, addr, config: None)
+    monkeypatch.setattr(topology_manager, 'create_u_v_connection', lambda switch_map, edges: {})
+    monkeypatch.setattr(topology_manager, 'check_controller_connectivity', lambda edge_count: None)
+
+    graph = TopologyGraph([1, 2, 3], [(1, 2), (2, 3)])
+    network = runner.setup_network_topology(graph, [('h1_0', 'h3_0')], 1000)
+    assert network[0] is net
+    assert not net.stopped
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tests for failure pattern sets, Markov sampling and link timelines
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import numpy as np
+import pytest
+
+from src.failure import FailureManager, FailurePatternSet, LinkTimeline
+
+
+def test_pattern_set_round_trip(tmp_path):
+    patterns = FailurePatternSet.from_config({'Mode': 'markov', 'Seed': 7}, range(1, 11))
+    path = str(tmp_path / 'patterns.npz')
+    patterns.save(path)
+    loaded = FailurePatternSet.load(path)
+
+    assert loaded.seed == 7
+    assert loaded.trials.tolist() == list(range(1, 11))
+    assert np.array_equal(loaded.states, patterns.states)
+    assert np.array_equal(loaded.bandwidths, patterns.bandwidths)
+    assert loaded.as_dict() == patterns.as_dict()
+    assert not os.path.exists(path + '.tmp.npz')
+
+
+def test_pattern_set_seeded():
+    cfg_file = {'Mode': 'markov', 'Seed': 42, 'PatternSteps': 6}
+    first = FailurePatternSet.from_config(cfg_file, range(1, 21))
+    second = FailurePatternSet.from_config(cfg_file, range(1, 21))
+    other = FailurePatternSet.from_config(dict(cfg_file, Seed=43), range(1, 21))
+
+    assert np.array_equal(first.states, second.states)
+    assert np.array_equal(first.bandwidths, second.bandwidths)
+    assert not np.array_equal(first.states, other.states)
+    assert first.states.shape == (20, 7)
+    # Only pnlos steps get a bandwidth, within 1..999
+    assert np.all(first.bandwidths[first.states != 1] == 0)
+    assert np.all((first.bandwidths[first.states == 1] >= 1) & (first.bandwidths[first.states == 1] < 1000))
+
+
+def test_pattern_set_fixed_mode():
+    patterns = FailurePatternSet.from_config({'Mode': 'fixed', 'Seed': 1}, [3, 5])
+    assert patterns.states_of(3) == [0, 1, 2, 1, 0]
+    assert patterns.states_of(5) == [0, 1, 2, 1, 0]
+    assert patterns.bandwidths_of(5)[0] == 0 and patterns.bandwidths_of(5)[2] == 0
+
+
+def test_markov_sampling_follows_transition_matrix():
+    trans_matrix = [[0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [1.0, 0.0, 0.0]]
+    states = FailureManager.sample_markov_chains(trans_matrix, 0, 6, 4, np.random.default_rng(0))
+    # A deterministic chain cycles los -> pnlos -> fnlos
+    assert states.tolist() == [[0, 1, 2, 0, 1, 2, 0]] * 4
+
+
+def test_markov_sampling_frequencies():
+    trans_matrix = np.array(FailureManager.TRANSITION_MATRIX)
+    states = FailureManager.sample_markov_chains(trans_matrix, 0, 1, 20000, np.random.default_rng(1))
+    assert np.all(states[:, 0] == 0)
+    frequencies = np.bincount(states[:, 1], minlength=3) / len(states)
+    assert np.allclose(frequencies, trans_matrix[0], atol=0.02)
+
+
+def test_timeline_from_pattern():
+    timeline = LinkTimeline.from_pattern([0, 1, 2, 1, 0], [0, 300, 0, 700, 0], 0.5)
+    assert timeline.offsets.tolist() == [0.0, 0.5, 1.0, 1.5, 2.0]
+    assert timeline.states.tolist() == [0, 1, 2, 1, 0]
+    # los and fnlos take their fixed bandwidth, pnlos keeps the drawn one
+    assert timeline.bandwidths.tolist() == [1000, 300, 0, 700, 1000]
+    assert timeline.duration == 2.5
+    assert len(timeline) == 5
+
+
+def test_timeline_staggered():
+    timelines = LinkTimeline.staggered(2, 5)
+    assert [timeline.offsets.tolist() for timeline in timelines] == [[5.0, 20.0], [10.0, 15.0]]
+    assert all(timeline.states.tolist() == [2, 0] for timeline in timelines)
+    assert all(timeline.duration == 25.0 for timeline in timelines)
+
+
+def test_timeline_rejects_unsorted_offsets():
+    with pytest.raises(ValueError):
+        LinkTimeline([1.0, 0.5], [0, 2], [1000, 0], 2.0)
+    with pytest.raises(ValueError):
+        LinkTimeline([0.0, 3.0], [0, 2], [1000, 0], 2.0)
+
+
+class RecordingLogger:
+    def log(self, message, **fields):
+        pass
+
+
+class RecordingActuator:
+    """Keeps the notification file as it was when each request went out"""
+
+    def __init__(self):
+        self.requests = []
+
+    def start(self):
+        pass
+
+    def run(self, commands):
+        with open('./failed_link_bw.txt') as f:
+            self.requests.append((commands, f.read()))
+        return [{'before_ns': time_ns - 1, 'after_ns': time_ns} for time_ns in range(1, len(commands) + 1)]
+
+
+class NamedIndex:
+    """Interface names of a topology, s1-eth<port of neighbor>"""
+
+    def intf(self, node, neighbor):
+        return f'{node}-eth{neighbor[1:]}'
+
+
+class RecordingControl:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, event, **fields):
+        self.messages.append((event, fields))
+
+
+def test_simultaneous_links_notified_together(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = FailureManager(RecordingLogger(), None)
+    manager.actuator = RecordingActuator()
+    manager.control = RecordingControl()
+    manager.topology_index = NamedIndex()
+    links = [('s1', 's2'), ('s3', 's4')]
+    u_v_connection = {'s1': {'s2': '1'}, 's2': {'s1': '1'}, 's3': {'s4': '2'}, 's4': {'s3': '2'}}
+    timelines = [LinkTimeline([0.0], [2], [0], 0.01), LinkTimeline([0.0], [2], [0], 0.01)]
+
+    data = manager.replay_link_timelines(timelines, links, u_v_connection, lambda seconds: None)
+
+    assert data['change_counter'] == 2
+    # Both links go out in one request, with both of them in the file already
+    assert len(manager.actuator.requests) == 1
+    commands, content = manager.actuator.requests[0]
+    # Both ends of each link go down in one command
+    assert [command['input'] for command in commands] == [
+        'link set dev s1-eth2 down\nlink set dev s2-eth1 down\n',
+        'link set dev s3-eth4 down\nlink set dev s4-eth3 down\n']
+    assert content == 'fnlos\n0\n0\n1\nfnlos\n0\n2\n3\n'
+    assert manager.control.messages == [('link_state', {'links': [
+        {'link': ['s1', 's2'], 'state': 'fnlos', 'bw': 0},
+        {'link': ['s3', 's4'], 'state': 'fnlos', 'bw': 0}]})]
+
+
+def test_unchanged_notification_not_rewritten(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    manager = FailureManager(RecordingLogger(), None)
+    manager.write_failed_link_bw([(('s1', 's2'), 'pnlos', 300)])
+    os.utime('failed_link_bw.txt', (0, 0))
+    manager.write_failed_link_bw([(('s1', 's2'), 'pnlos', 300)])
+    assert os.stat('failed_link_bw.txt').st_mtime == 0
+    manager.write_failed_link_bw([(('s1', 's2'), 'los', 1000)])
+    assert os.stat('failed_link_bw.txt').st_mtime != 0
+    assert open('failed_link_bw.txt').read() == 'los\n1000\n0\n1\n'
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for the topology graph: SNDlib import, generation and flow selection
+"""
+
+import os
+import random
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import pytest
+
+from src.graph import TopologyGraph
+
+
+SNDLIB_NETWORK = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<network xmlns="http://sndlib.zib.de/network" version="1.0">
+  <networkStructure>
+    <nodes coordinatesType="geographical">
+      <node id="Berlin"><coordinates><x>13.4</x><y>52.5</y></coordinates></node>
+      <node id="Hamburg"><coordinates><x>10.0</x><y>53.6</y></coordinates></node>
+      <node id="Munich"><coordinates><x>11.6</x><y>48.1</y></coordinates></node>
+      <node id="Cologne"><coordinates><x>6.9</x><y>50.9</y></coordinates></node>
+    </nodes>
+    <links>
+      <link id="L1"><source>Berlin</source><target>Hamburg</target></link>
+      <link id="L2"><source>Hamburg</source><target>Cologne</target></link>
+      <link id="L3"><source>Cologne</source><target>Munich</target></link>
+      <link id="L4"><source>Munich</source><target>Berlin</target></link>
+      <link id="L5"><source>Hamburg</source><target>Berlin</target></link>
+    </links>
+  </networkStructure>
+  <demands>
+    <demand id="D1"><source>Berlin</source><target>Munich</target><demandValue>10</demandValue></demand>
+  </demands>
+</network>
+"""
+
+
+def connected(graph):
+    seen = {graph.vertices[0]}
+    stack = [graph.vertices[0]]
+    while stack:
+        for neighbor in graph.neighbors(stack.pop()):
+            if neighbor not in seen:
+                seen.add(neighbor)
+                stack.append(neighbor)
+    return len(seen) == len(graph.vertices)
+
+
+def test_from_sndlib(tmp_path):
+    path = tmp_path / 'network.xml'
+    path.write_text(SNDLIB_NETWORK)
+    graph = TopologyGraph.from_sndlib(str(path))
+
+    # Nodes are numbered in file order; the reversed duplicate link and the demand add no edge
+    assert graph.vertices == [1, 2, 3, 4]
+    assert graph.edges == [(1, 2), (2, 4), (4, 3), (3, 1)]
+    assert graph.has_edge(2, 1)
+    assert graph.neighbors(1) == {2, 3}
+
+
+def test_generate_edge_count_and_connectivity():
+    for vertex_count, edge_count in [(20, 35), (10, 12), (8, 27), (6, 15)]:
+        graph = TopologyGraph.generate(vertex_count, edge_count, random.Random(vertex_count))
+        assert graph.vertices == list(range(1, vertex_count + 1))
+        assert len(graph.edges) == edge_count
+        assert len(set(TopologyGraph.edge_key(u, v) for u, v in graph.edges)) == edge_count
+        assert all(u != v for u, v in graph.edges)
+        assert connected(graph)
+
+
+def test_generate_seeded():
+    first = TopologyGraph.generate(30, 60, random.Random(5))
+    second = TopologyGraph.generate(30, 60, random.Random(5))
+    assert first.edges == second.edges
+
+
+def test_generate_too_many_edges():
+    with pytest.raises(ValueError):
+        TopologyGraph.generate(5, 11)
+
+
+def test_generate_flows_unique():
+    graph = TopologyGraph.generate(10, 15, random.Random(1))
+    traffic_flows = graph.generate_flows(45, random.Random(2))
+    pairs = set(frozenset(flow) for flow in traffic_flows)
+    assert len(pairs) == 45
+    assert all(src.endswith('_0') and dst.endswith('_0') for src, dst in traffic_flows)
+    with pytest.raises(ValueError):
+        graph.generate_flows(46)
+
+
+def test_ports():
+    graph = TopologyGraph([1, 2, 3], [(1, 2), (2, 3)])
+    graph.load_ports({'s1': {'s2': 3}, 's2': {'s1': 4, 's3': 5}})
+    assert graph.port(1, 2) == 3
+    assert graph.port(2, 1) == 4
+    assert graph.port(2, 3) == 5
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the iperf3 report parser
+"""
+
+import json
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import numpy as np
+
+from src.iperf_parser import IperfParser
+
+
+def interval(start, bits_per_second, lost_packets=0, packets=100):
+    return {'streams': [], 'sum': {'start': start, 'end': start + 1, 'seconds': 1, 'bytes': bits_per_second // 8,
+                                   'bits_per_second': bits_per_second, 'jitter_ms': 0.25,
+                                   'lost_packets': lost_packets, 'packets': packets}}
+
+
+def client_report():
+    return {'start': {'timestamp': {'time': 'Thu, 01 Jan 2026 00:00:00 GMT', 'timesecs': 1767225600}},
+            'intervals': [interval(0, 8000000), interval(1, 4000000, lost_packets=50), interval(2, 8000000)],
+            'end': {}}
+
+
+def test_flow_of():
+    assert IperfParser.flow_of('/trace/h1_0_h12_0.json') == ('h1_0', 'h12_0', 'client')
+    assert IperfParser.flow_of('/trace/h1_0_h12_0_s.json') == ('h1_0', 'h12_0', 'server')
+
+
+def test_parse_json_report(tmp_path):
+    path = tmp_path / 'h1_0_h2_0.json'
+    path.write_text(json.dumps(client_report(), indent=4))
+    start_epoch, error, rows = IperfParser().parse_file(str(path))
+
+    assert start_epoch == 1767225600
+    assert error == ''
+    assert [row[:3] for row in rows] == [(0, 1, 8000000), (1, 2, 4000000), (2, 3, 8000000)]
+    assert rows[1][5] == 50
+
+
+def test_parse_json_stream(tmp_path):
+    report = client_report()
+    lines = [{'event': 'start', 'data': report['start']}]
+    lines += [{'event': 'interval', 'data': data} for data in report['intervals'][:2]]
+    path = tmp_path / 'h1_0_h2_0.json'
+    # A killed --json-stream client still leaves its complete lines
+    path.write_text('\n'.join(json.dumps(line) for line in lines) + '\n')
+    start_epoch, error, rows = IperfParser().parse_file(str(path))
+
+    assert start_epoch == 1767225600
+    assert error == ''
+    assert len(rows) == 2
+
+
+def test_parse_truncated_report(tmp_path):
+    path = tmp_path / 'h1_0_h2_0.json'
+    path.write_text(json.dumps(client_report())[:100])
+    _, error, rows = IperfParser().parse_file(str(path))
+    assert error.startswith('unreadable report')
+    assert rows == []
+
+
+def test_collect(tmp_path):
+    (tmp_path / 'h1_0_h2_0.json').write_text(json.dumps(client_report()))
+    server_report = client_report()
+    server_report['error'] = 'the client has terminated'
+    (tmp_path / 'h1_0_h2_0_s.json').write_text(json.dumps(server_report))
+    (tmp_path / 'detect_link_change.txt').write_text('')
+
+    sample_file = IperfParser().collect(str(tmp_path), {'h1_0_h2_0': 1767225600.25}, remove_json=True)
+    samples = IperfParser.load(sample_file)
+
+    assert samples['flow_src'].tolist() == ['h1_0', 'h1_0']
+    assert samples['flow_role'].tolist() == ['client', 'server']
+    # The launch epoch of the harness replaces the whole second of the report
+    assert samples['flow_start'].tolist() == [1767225600.25, 1767225600.25]
+    assert samples['flow_error'].tolist() == ['', 'the client has terminated']
+    assert samples['flow_id'].tolist() == [0, 0, 0, 1, 1, 1]
+    assert np.array_equal(samples['bits_per_second'][:3], [8000000, 4000000, 8000000])
+    assert samples['lost_packets'][1] == 50
+    assert not (tmp_path / 'h1_0_h2_0.json').exists()
+    assert (tmp_path / 'detect_link_change.txt').exists()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the classified retry policy
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.retry import RetryPolicy
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.messages = []
+
+    def log(self, message, **fields):
+        self.messages.append(message)
+
+
+def test_budget_per_class():
+    policy = RetryPolicy(RecordingLogger(), limit=10, backoff=5)
+    policy.begin('A_1')
+    # traffic has a budget of 2 retries
+    assert policy.record(RetryPolicy.TRAFFIC, 1.0, 'no trial data') == 5
+    assert policy.record(RetryPolicy.TRAFFIC, 1.0, 'no trial data') == 10
+    assert policy.record(RetryPolicy.TRAFFIC, 1.0, 'no trial data') is None
+    # Other classes keep their own budget
+    assert policy.record(RetryPolicy.SETUP, 1.0, 'reset failed') == 5
+
+
+def test_budget_override_and_limit():
+    policy = RetryPolicy(RecordingLogger(), budgets={RetryPolicy.DATA: 5}, limit=3)
+    policy.begin('A_1')
+    assert policy.budgets[RetryPolicy.DATA] == 5
+    assert policy.budgets[RetryPolicy.SETUP] == 3
+    assert policy.record(RetryPolicy.DATA, 1.0, 'mismatch') is not None
+    assert policy.record(RetryPolicy.SETUP, 1.0, 'reset failed') is not None
+    # The third attempt of the label reaches the limit whatever the class budgets allow
+    assert policy.record(RetryPolicy.DATA, 1.0, 'mismatch') is None
+
+
+def test_backoff_cap():
+    policy = RetryPolicy(RecordingLogger(), budgets={RetryPolicy.SETUP: 10}, limit=20, backoff=5, max_backoff=30)
+    policy.begin('A_1')
+    delays = [policy.record(RetryPolicy.SETUP, 0.0, 'reset failed') for _ in range(6)]
+    assert delays == [5, 10, 20, 30, 30, 30]
+
+
+def test_begin_resets_label():
+    policy = RetryPolicy(RecordingLogger())
+    policy.begin('A_1')
+    policy.record(RetryPolicy.CONTROLLER, 2.0, 'algorithm setup failed')
+    assert policy.reset_mode('warm') == 'warm'
+    assert policy.keep_topology()
+    policy.record(RetryPolicy.SETUP, 3.0, 'reset failed')
+    assert policy.reset_mode('warm') == 'cold'
+    assert not policy.keep_topology()
+
+    policy.begin('A_2')
+    assert policy.reset_mode('warm') == 'warm'
+    assert policy.record(RetryPolicy.SETUP, 1.0, 'reset failed') == 5
+    # Failures and wasted time add up over labels
+    assert policy.summary()[RetryPolicy.SETUP] == (2, 4.0)
+    assert policy.summary()[RetryPolicy.CONTROLLER] == (1, 2.0)
+
+
+def test_phase_retries():
+    policy = RetryPolicy(RecordingLogger())
+    policy.begin('A_1')
+    assert policy.retry_phase(RetryPolicy.CONTROLLER, 1.0, 'algorithm setup failed')
+    assert policy.retry_phase(RetryPolicy.CONTROLLER, 1.0, 'algorithm setup failed')
+    assert not policy.retry_phase(RetryPolicy.CONTROLLER, 1.0, 'algorithm setup failed')
+    assert not policy.retry_phase(RetryPolicy.TRAFFIC, 1.0, 'no trial data')
+
+
+def test_previous_attempts():
+    policy = RetryPolicy(RecordingLogger(), limit=4)
+    policy.begin('A_1', previous=2)
+    assert not policy.exhausted()
+    assert policy.record(RetryPolicy.SETUP, 1.0, 'reset failed') is not None
+    # Attempts of earlier runs count against the limit
+    assert policy.record(RetryPolicy.SETUP, 1.0, 'reset failed') is None
+    policy.begin('A_2', previous=4)
+    assert policy.exhausted()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the transactional run index
+"""
+
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.run_index import RunIndex
+
+
+ENTRIES = [('A_1', 1, 'A'), ('B_1', 1, 'B'), ('A_2', 2, 'A')]
+
+
+def test_state_transitions(tmp_path):
+    index = RunIndex(str(tmp_path / RunIndex.FILE))
+    index.plan(ENTRIES)
+    assert index.summary() == {'planned': 3}
+
+    assert index.start('A_1') == 1
+    assert index.state('A_1') == 'running'
+    index.fail('A_1', 'traffic: no trial data')
+    assert index.state('A_1') == 'failed'
+    assert not index.is_settled('A_1')
+    assert index.start('A_1') == 2
+    assert index.attempts('A_1') == 2
+
+    folder = tmp_path / 'A_1'
+    folder.mkdir()
+    (folder / 'h1_0_h2_0.json').write_text('{}')
+    index.done('A_1', str(folder))
+    assert index.is_done('A_1') and index.is_settled('A_1')
+    assert list(index.artifacts('A_1')) == ['h1_0_h2_0.json']
+
+    index.start('B_1')
+    index.quarantine('B_1', 'setup: reset failed')
+    assert index.is_settled('B_1') and not index.is_done('B_1')
+    assert index.summary() == {'done': 1, 'quarantined': 1, 'planned': 1}
+    assert index.attempts('missing') == 0
+    index.close()
+
+
+def test_resume(tmp_path):
+    path = str(tmp_path / RunIndex.FILE)
+    index = RunIndex(path)
+    index.plan(ENTRIES)
+    index.start('A_1')
+    index.done('A_1')
+    # Crash in the middle of B_1
+    index.start('B_1')
+    index.close()
+
+    index = RunIndex(path)
+    # Planning again keeps what the first run recorded
+    index.plan(ENTRIES)
+    assert index.state('A_1') == 'done'
+    assert index.state('B_1') == 'running'
+    assert index.attempts('B_1') == 1
+    assert [label for label, _, _ in ENTRIES if not index.is_settled(label)] == ['B_1', 'A_2']
+    index.close()
+
+
+def test_plan_adopts_finished_folders(tmp_path):
+    (tmp_path / 'A_2').mkdir()
+    for marker in RunIndex.DONE_MARKERS:
+        (tmp_path / 'A_2' / marker).write_text('{}')
+    (tmp_path / 'B_1').mkdir()
+    # A crash between the record and the samples leaves an incomplete folder
+    (tmp_path / 'A_1').mkdir()
+    (tmp_path / 'A_1' / 'trial_record.json').write_text('{}')
+    index = RunIndex(str(tmp_path / RunIndex.FILE))
+    index.plan(ENTRIES, str(tmp_path))
+    assert index.state('A_2') == 'done'
+    assert index.state('B_1') == 'planned'
+    assert index.state('A_1') == 'planned'
+    index.close()
+
+
+def test_verify(tmp_path):
+    folder = tmp_path / 'A_1'
+    folder.mkdir()
+    (folder / 'intervals.npz').write_bytes(b'samples')
+    (folder / 'trial_record.json').write_text('{}')
+    index = RunIndex(str(tmp_path / RunIndex.FILE))
+    index.plan(ENTRIES)
+    index.done('A_1', str(folder))
+    assert index.verify('A_1', str(folder)) == []
+
+    (folder / 'intervals.npz').write_bytes(b'changed')
+    os.remove(folder / 'trial_record.json')
+    assert index.verify('A_1', str(folder)) == ['intervals.npz', 'trial_record.json']
+    index.close()
+
+
+def test_recheck(tmp_path):
+    folder = tmp_path / 'A_1'
+    folder.mkdir()
+    (folder / 'intervals.npz').write_bytes(b'samples')
+    (folder / 'trial_record.json').write_text('{}')
+    index = RunIndex(str(tmp_path / RunIndex.FILE))
+    index.plan(ENTRIES)
+    index.done('A_1', str(folder))
+    assert index.recheck('A_1', str(folder)) == []
+    assert index.is_done('A_1')
+    # Labels that are not done are left alone
+    assert index.recheck('B_1', str(tmp_path / 'B_1')) == []
+
+    os.remove(folder / 'intervals.npz')
+    assert index.recheck('A_1', str(folder)) == ['intervals.npz']
+    assert index.state('A_1') == 'planned'
+    index.close()